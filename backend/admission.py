@@ -0,0 +1,199 @@
+"""
+admission.py - Admission control and priority load shedding
+Caps how many requests run at once and queues the rest per priority class, so
+under overload agents working tickets are served before customer polling and
+health checks. Queued requests that wait past their class deadline get a fast
+503 instead of timing out in the threadpool. The concurrency limit adapts to
+observed latency (AIMD): it shrinks multiplicatively when requests run slower
+than a target latency (at most once per BACKOFF_INTERVAL_SECONDS, so a burst of
+slow requests counts as one signal) and grows additively while they stay fast.
+
+Everything runs on the event loop thread, so no locks are needed.
+Off by default; enable with ADMISSION_CONTROL=1.
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+
+import auth
+import metrics
+
+# ========== CONFIGURATION ==========
+ENABLED = os.getenv("ADMISSION_CONTROL", "0") == "1"
+# Admitting more than the connection pool (SQLAlchemy default: 5 + 10 overflow) or
+# anyio's 40 worker threads can serve only moves the queue there, where it is FIFO
+MAX_LIMIT = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "15"))
+MIN_LIMIT = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "4"))
+INITIAL_LIMIT = MAX_LIMIT
+MAX_QUEUE_PER_CLASS = 512
+
+# Priority classes, most important first
+CRITICAL = 0       # agent/admin writes
+AGENT_READ = 1     # agent/admin reads
+CUSTOMER = 2       # customer and unauthenticated API traffic
+BACKGROUND = 3     # health checks, metrics, docs
+CLASS_NAMES = ("critical", "agent_read", "customer", "background")
+
+# Longest a request may wait for a slot before it is shed (seconds)
+QUEUE_DEADLINES = (2.0, 1.0, 0.5, 0.25)
+
+BACKGROUND_PATHS = {"/", "/test", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# AIMD limit: cut by BACKOFF when a request runs longer than the target, then not
+# again for BACKOFF_INTERVAL_SECONDS (requests already running when the limit was
+# cut report the old load); grow by 1/limit per fast request while it is saturated
+TARGET_LATENCY_SECONDS = float(os.getenv("ADMISSION_TARGET_LATENCY_MS", "100")) / 1000.0
+BACKOFF = 0.9
+BACKOFF_INTERVAL_SECONDS = float(os.getenv("ADMISSION_BACKOFF_INTERVAL_MS", "1000")) / 1000.0
+# Slow by design (bcrypt); their latency says nothing about overload
+LATENCY_EXEMPT_PATHS = {"/login", "/register"}
+# Attachment upload/download: duration follows the client's bandwidth and the
+# file size. They are still queued/shed by class, but give their slot back on
+# admission (the few DB queries they make are cheap) and never feed the limit.
+STREAMING_ROUTES = (
+    ("POST", re.compile(r"/tickets/\d+/attachments")),
+    ("GET", re.compile(r"/tickets/\d+/attachments/\d+")),
+)
+
+# ========== CLASSIFICATION ==========
+
+def classify(request) -> int:
+    """Priority class from the path, method and (verified) role claim"""
+    if request.url.path in BACKGROUND_PATHS:
+        return BACKGROUND
+    header = request.headers.get("authorization", "")
+    if not header.lower().startswith("bearer "):
+        return CUSTOMER
+    try:
+        role = jwt.decode(header[7:], auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("role")
+    except JWTError:
+        # Rejected later by auth; never let a forged token jump the queue
+        return CUSTOMER
+    if role not in ("agent", "admin"):
+        return CUSTOMER
+    return AGENT_READ if request.method in READ_METHODS else CRITICAL
+
+def is_streaming(request) -> bool:
+    path = request.url.path
+    return any(request.method == method and pattern.fullmatch(path) for method, pattern in STREAMING_ROUTES)
+
+# ========== LIMITER ==========
+
+class AdaptiveLimiter:
+    """Concurrency limit with one FIFO queue per priority class"""
+
+    def __init__(self, initial: int = INITIAL_LIMIT, min_limit: int = MIN_LIMIT, max_limit: int = MAX_LIMIT):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.queues = [deque() for _ in CLASS_NAMES]
+        self.last_backoff = float("-inf")
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self.queues)
+
+    async def acquire(self, priority: int, timeout: float) -> Optional[str]:
+        """Wait for a slot; returns None once admitted, else the reason for shedding"""
+        if self._has_capacity() and not any(self.queues[p] for p in range(priority + 1)):
+            self.in_flight += 1
+            return None
+        queue = self.queues[priority]
+        if len(queue) >= MAX_QUEUE_PER_CLASS:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._discard(queue, future)
+            return "timeout"
+        except asyncio.CancelledError:
+            # Client went away; hand back a slot that was granted in the meantime
+            self._discard(queue, future)
+            if future.done() and not future.cancelled():
+                self.release(None)
+            raise
+        return None
+
+    def release(self, latency: Optional[float]) -> None:
+        """Free a slot, feed the latency sample to the limit and admit waiters"""
+        self.in_flight -= 1
+        if latency is not None:
+            self._update_limit(latency)
+        self._dispatch()
+
+    def _discard(self, queue: deque, future) -> None:
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+
+    def _dispatch(self) -> None:
+        for queue in self.queues:
+            while queue and self._has_capacity():
+                future = queue.popleft()
+                if future.done():  # cancelled/timed out
+                    continue
+                self.in_flight += 1
+                future.set_result(None)
+            if queue:
+                return
+
+    def _update_limit(self, latency: float) -> None:
+        if latency > TARGET_LATENCY_SECONDS:
+            now = time.monotonic()
+            if now - self.last_backoff >= BACKOFF_INTERVAL_SECONDS:
+                self.limit = max(self.min_limit, self.limit * BACKOFF)
+                self.last_backoff = now
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow while the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+limiter = AdaptiveLimiter()
+
+# ========== MIDDLEWARE ==========
+
+async def admission_middleware(request, call_next):
+    """Admit, queue or shed each request by priority class"""
+    priority = classify(request)
+    labels = (("class", CLASS_NAMES[priority]),)
+    start = time.perf_counter()
+    rejected = await limiter.acquire(priority, QUEUE_DEADLINES[priority])
+    admitted_at = time.perf_counter()
+    metrics.observe("admission_queue_seconds", admitted_at - start, labels)
+    if rejected is not None:
+        metrics.inc("admission_rejected_total", labels + (("reason", rejected),))
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is overloaded, please retry shortly"},
+            headers={"Retry-After": "1"},
+        )
+
+    if is_streaming(request):
+        limiter.release(None)
+        return await call_next(request)
+
+    latency = None
+    try:
+        response = await call_next(request)
+        if priority != BACKGROUND and request.url.path not in LATENCY_EXEMPT_PATHS:
+            latency = time.perf_counter() - admitted_at
+        return response
+    finally:
+        limiter.release(latency)
+        metrics.set_gauge("admission_limit", limiter.limit)
+        metrics.set_gauge("admission_in_flight", limiter.in_flight)
+        metrics.set_gauge("admission_queued", limiter.queued())
@@ -0,0 +1,337 @@
+"""
+analytics.py - Columnar ticket snapshot for reporting
+Reporting aggregates (volume per hour, time-to-resolve percentiles, per-agent
+throughput) run with NumPy over a memory-mapped, column-per-file copy of the
+tickets table instead of GROUP BY scans on the live database.
+
+The snapshot is refreshed incrementally: only tickets whose updated_at moved
+past the last watermark are read (from the read database), merged by id, and
+written as a new generation directory; CURRENT is then switched atomically so
+readers never see a half-written snapshot. Archived tickets are included;
+tickets deleted outright only disappear on a --full rebuild.
+
+Usage:
+    python analytics.py build            # incremental refresh
+    python analytics.py build --full     # rebuild from scratch
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+import models
+import sharding
+
+# ========== CONFIGURATION ==========
+SNAPSHOT_DIR = os.getenv("ANALYTICS_DIR", "./analytics_snapshot")
+FETCH_BATCH_SIZE = 50_000
+FORMAT_VERSION = 1
+
+RESOLVED_STATUSES = ("resolved", "closed")
+NULL_CODE = -1
+
+# Column name -> dtype. Strings are dictionary-encoded into int16 codes;
+# timestamps are epoch seconds (UTC); missing values are -1.
+COLUMNS = {
+    "id": np.int64,
+    "user_id": np.int64,
+    "assigned_to": np.int64,
+    "status": np.int16,
+    "priority": np.int16,
+    "category": np.int16,
+    "created_at": np.int64,
+    "updated_at": np.int64,
+    "resolved_by_ai": np.bool_,
+}
+DICTIONARY_COLUMNS = ("status", "priority", "category")
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _epoch_seconds(value: Optional[datetime]) -> int:
+    if value is None:
+        return NULL_CODE
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((value - _EPOCH).total_seconds())
+
+# ========== SNAPSHOT (READ SIDE) ==========
+
+class Snapshot:
+    """One immutable generation of the snapshot: memory-mapped columns plus its manifest"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.path = path
+        self.rows = self.manifest["rows"]
+        self.dictionaries: Dict[str, List[str]] = self.manifest["dictionaries"]
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") if self.rows else np.empty(0, dtype)
+            for name, dtype in COLUMNS.items()
+        }
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def code(self, column: str, value: str) -> int:
+        """Dictionary code of a value (NULL_CODE if it never occurs)"""
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return NULL_CODE
+
+    def label(self, column: str, code: int) -> Optional[str]:
+        return None if code == NULL_CODE else self.dictionaries[column][code]
+
+_current: Optional[Snapshot] = None
+_current_name: Optional[str] = None
+_load_lock = threading.Lock()
+
+def _read_pointer(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load(directory: str = SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """Latest snapshot generation (cached; reopened only after a refresh); None if never built"""
+    global _current, _current_name
+    name = _read_pointer(directory)
+    if name is None:
+        return None
+    if name != _current_name:
+        with _load_lock:
+            if name != _current_name:
+                _current = Snapshot(os.path.join(directory, name))
+                _current_name = name
+    return _current
+
+# ========== SNAPSHOT BUILDER ==========
+
+def _fetch_changed(engine, tickets, since: Optional[datetime],
+                   dictionaries: Dict[str, List[str]]) -> Dict[str, np.ndarray]:
+    """Read tickets (or archived tickets) updated at or after `since` into encoded column arrays"""
+    query = select(
+        tickets.c.id, tickets.c.user_id, tickets.c.assigned_to, tickets.c.status, tickets.c.priority,
+        tickets.c.ai_category, tickets.c.created_at, tickets.c.updated_at, tickets.c.resolved_by_ai,
+    )
+    if since is not None:
+        # Re-merging rows at the boundary is harmless; missing one is not
+        query = query.where(tickets.c.updated_at >= since)
+
+    lookups = {name: {value: code for code, value in enumerate(dictionaries[name])} for name in DICTIONARY_COLUMNS}
+
+    def encode(name, value):
+        if value is None:
+            return NULL_CODE
+        lookup = lookups[name]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(dictionaries[name])
+            dictionaries[name].append(value)
+        return code
+
+    chunks = {name: [] for name in COLUMNS}
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=FETCH_BATCH_SIZE).execute(query)
+        for batch in result.partitions():
+            rows = list(zip(*batch))
+            chunks["id"].append(np.fromiter(rows[0], np.int64, len(batch)))
+            chunks["user_id"].append(np.fromiter(rows[1], np.int64, len(batch)))
+            chunks["assigned_to"].append(np.fromiter(
+                (NULL_CODE if v is None else v for v in rows[2]), np.int64, len(batch)))
+            chunks["status"].append(np.fromiter((encode("status", v) for v in rows[3]), np.int16, len(batch)))
+            chunks["priority"].append(np.fromiter((encode("priority", v) for v in rows[4]), np.int16, len(batch)))
+            chunks["category"].append(np.fromiter((encode("category", v) for v in rows[5]), np.int16, len(batch)))
+            chunks["created_at"].append(np.fromiter((_epoch_seconds(v) for v in rows[6]), np.int64, len(batch)))
+            chunks["updated_at"].append(np.fromiter((_epoch_seconds(v) for v in rows[7]), np.int64, len(batch)))
+            chunks["resolved_by_ai"].append(np.fromiter((bool(v) for v in rows[8]), np.bool_, len(batch)))
+
+    return {
+        name: np.concatenate(parts) if parts else np.empty(0, COLUMNS[name])
+        for name, parts in chunks.items()
+    }
+
+def _merge(old: Optional[Snapshot], changed: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Upsert changed rows into the previous generation by id; result is sorted by id"""
+    order = np.argsort(changed["id"], kind="stable")
+    changed = {name: values[order] for name, values in changed.items()}
+    if old is None or old.rows == 0:
+        return changed
+
+    old_ids = old["id"]
+    positions = np.searchsorted(old_ids, changed["id"])
+    positions_clipped = np.minimum(positions, len(old_ids) - 1)
+    existing = old_ids[positions_clipped] == changed["id"]
+    merged = {}
+    for name in COLUMNS:
+        column = np.array(old[name])  # copy out of the read-only mmap
+        column[positions_clipped[existing]] = changed[name][existing]
+        merged[name] = np.concatenate([column, changed[name][~existing]])
+    if (~existing).any() and changed["id"][~existing].min() <= old_ids[-1]:
+        order = np.argsort(merged["id"], kind="stable")
+        merged = {name: values[order] for name, values in merged.items()}
+    return merged
+
+_build_lock = threading.Lock()
+
+def build(full: bool = False, directory: str = SNAPSHOT_DIR, engine=None) -> dict:
+    """
+    Refresh the snapshot and return its manifest
+
+    Reads only from the read databases of every shard. One build runs at a
+    time per process; run the CLI from a single scheduler rather than from
+    every worker.
+    """
+    engines = [engine] if engine is not None else [shard.read_engine for shard in sharding.shards]
+    with _build_lock:
+        start = time.perf_counter()
+        os.makedirs(directory, exist_ok=True)
+        latest = load(directory)
+        previous = None if full else latest
+        dictionaries = (
+            {name: list(values) for name, values in previous.dictionaries.items()}
+            if previous is not None else {name: [] for name in DICTIONARY_COLUMNS}
+        )
+        since = None
+        if previous is not None and previous.manifest["watermark"] is not None:
+            # One second early: SQLite compares timestamps as text, and rows stored
+            # without fractional seconds sort before a bound parameter that has them
+            since = datetime.utcfromtimestamp(previous.manifest["watermark"] - 1)
+
+        parts = []
+        for engine in engines:
+            parts.append(_fetch_changed(engine, models.Ticket.__table__, since, dictionaries))
+            if since is None:
+                # Archived tickets never change again, so they are only read on a first/full build
+                parts.append(_fetch_changed(engine, models.ArchivedTicket.__table__, None, dictionaries))
+        changed = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+        columns = _merge(previous, changed)
+        rows = len(columns["id"])
+        watermark = int(columns["updated_at"].max()) if rows else None
+
+        generation = int(latest.manifest["generation"]) + 1 if latest is not None else 1
+        name = f"gen-{generation:06d}"
+        path = os.path.join(directory, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        for column, values in columns.items():
+            np.save(os.path.join(path, f"{column}.npy"), np.ascontiguousarray(values, dtype=COLUMNS[column]))
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "generation": generation,
+            "rows": rows,
+            "changed_rows": len(changed["id"]),
+            "watermark": watermark,
+            "built_at": datetime.utcnow().isoformat(),
+            "dictionaries": dictionaries,
+        }
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+        pointer = os.path.join(directory, "CURRENT")
+        with open(pointer + ".tmp", "w") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+        _remove_old_generations(directory, keep={name, latest and os.path.basename(latest.path)})
+        manifest["build_seconds"] = round(time.perf_counter() - start, 3)
+        return manifest
+
+def _remove_old_generations(directory: str, keep: set) -> None:
+    # The previous generation is kept for readers that still have it mapped
+    for entry in os.listdir(directory):
+        if entry.startswith("gen-") and entry not in keep:
+            try:
+                shutil.rmtree(os.path.join(directory, entry))
+            except OSError:
+                pass  # still mapped on Windows; removed by a later build
+
+# ========== REPORTS ==========
+
+def _time_mask(values: np.ndarray, since: Optional[datetime], until: Optional[datetime]) -> np.ndarray:
+    mask = np.ones(len(values), dtype=bool)
+    if since is not None:
+        mask &= values >= _epoch_seconds(since)
+    if until is not None:
+        mask &= values < _epoch_seconds(until)
+    return mask
+
+def volume_per_hour(snapshot: Snapshot, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+    """Tickets created per hour (hours without tickets are omitted)"""
+    created = snapshot["created_at"]
+    created = created[_time_mask(created, since, until) & (created >= 0)]
+    if len(created) == 0:
+        return []
+    hours = created // 3600
+    first = int(hours.min())
+    counts = np.bincount(hours - first)
+    nonzero = np.flatnonzero(counts)
+    return [
+        {"hour": datetime.utcfromtimestamp((first + int(h)) * 3600).isoformat(), "count": int(counts[h])}
+        for h in nonzero
+    ]
+
+def resolution_percentiles(snapshot: Snapshot, group_by: str = "priority", percentiles=(50, 90, 99),
+                           since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+    """
+    Time-to-resolve percentiles (hours) per priority or category
+
+    Tickets have no resolved_at column; the last update of a resolved/closed
+    ticket is used as its resolution time.
+    """
+    status = snapshot["status"]
+    resolved_codes = [snapshot.code("status", s) for s in RESOLVED_STATUSES]
+    resolved = np.isin(status, [c for c in resolved_codes if c != NULL_CODE])
+    updated = snapshot["updated_at"]
+    mask = resolved & _time_mask(updated, since, until) & (snapshot["created_at"] >= 0)
+    hours = (updated[mask] - snapshot["created_at"][mask]) / 3600.0
+    groups = snapshot[group_by][mask]
+
+    codes, counts = np.unique(groups, return_counts=True)
+    report = []
+    for code, count in zip(codes, counts):
+        # np.percentile partitions rather than sorts; all percentiles in one pass
+        values = np.percentile(hours[groups == code], percentiles)
+        report.append({
+            group_by: snapshot.label(group_by, int(code)),
+            "resolved": int(count),
+            **{f"p{p}": round(float(v), 2) for p, v in zip(percentiles, values)},
+        })
+    return report
+
+def agent_throughput(snapshot: Snapshot, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     limit: int = 20) -> List[dict]:
+    """Resolved/closed tickets per assigned agent, busiest first"""
+    resolved_codes = [snapshot.code("status", s) for s in RESOLVED_STATUSES]
+    mask = (np.isin(snapshot["status"], [c for c in resolved_codes if c != NULL_CODE])
+            & (snapshot["assigned_to"] >= 0)
+            & _time_mask(snapshot["updated_at"], since, until))
+    agents, counts = np.unique(snapshot["assigned_to"][mask], return_counts=True)
+    top = np.argsort(counts, kind="stable")[::-1][:limit]
+    return [{"agent_id": int(agents[i]), "resolved": int(counts[i])} for i in top]
+
+def status_totals(snapshot: Snapshot) -> Dict[str, int]:
+    codes, counts = np.unique(snapshot["status"], return_counts=True)
+    return {snapshot.label("status", int(c)) or "unknown": int(n) for c, n in zip(codes, counts)}
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the analytics snapshot")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of incrementally")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    result = build(full=args.full, directory=args.dir)
+    print(f"[OK] Snapshot generation {result['generation']}: {result['rows']} tickets "
+          f"({result['changed_rows']} changed) in {result['build_seconds']}s")
@@ -0,0 +1,79 @@
+"""
+archive.py - Hot/cold archival of closed tickets
+Moves tickets that have been resolved/closed for more than N days from `tickets`
+into `tickets_archive`, in small batched transactions so live traffic is never
+blocked for long. GET /tickets/{id} falls back to the archive transparently.
+
+Usage:
+    python archive.py --days 30 --batch-size 1000
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, or_, select
+
+import models
+import sharding
+
+ARCHIVE_STATUSES = ("resolved", "closed")
+
+# Columns copied verbatim from tickets into tickets_archive
+_COPIED_COLUMNS = [c.name for c in models.ArchivedTicket.__table__.columns if c.name != "archived_at"]
+
+def archive_closed_tickets(days: int = 30, batch_size: int = 1000, engine=None,
+                           pause_seconds: float = 0.0) -> int:
+    """Archive tickets closed/resolved more than `days` ago (on every shard); returns how many were moved"""
+    if engine is None:
+        return sum(
+            archive_closed_tickets(days, batch_size, shard.engine, pause_seconds)
+            for shard in sharding.shards
+        )
+    tickets = models.Ticket.__table__
+    archive = models.ArchivedTicket.__table__
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    moved = 0
+
+    while True:
+        with engine.begin() as conn:
+            # Archived ids are never reused: tickets.id is AUTOINCREMENT on SQLite (migration 016)
+            ids = conn.execute(
+                select(tickets.c.id)
+                .where(tickets.c.status.in_(ARCHIVE_STATUSES), tickets.c.updated_at < cutoff,
+                       # Replies don't touch updated_at; a live conversation stays
+                       or_(tickets.c.last_message_at.is_(None), tickets.c.last_message_at < cutoff))
+                .order_by(tickets.c.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+
+            source = select(
+                *[tickets.c[name] for name in _COPIED_COLUMNS],
+                literal(datetime.utcnow(), type_=archive.c.archived_at.type).label("archived_at"),
+            ).where(tickets.c.id.in_(ids))
+            conn.execute(insert(archive).from_select(_COPIED_COLUMNS + ["archived_at"], source))
+            conn.execute(delete(tickets).where(tickets.c.id.in_(ids)))
+        moved += len(ids)
+        print(f"   ... archived {moved} tickets")
+        if pause_seconds:
+            # Give waiting writers a turn between batches
+            time.sleep(pause_seconds)
+
+    return moved
+
+def get_archived_ticket(db, ticket_id: int):
+    """Look up a ticket in the archive (None if it was never archived)"""
+    return db.query(models.ArchivedTicket).filter(models.ArchivedTicket.id == ticket_id).first()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old closed/resolved tickets")
+    parser.add_argument("--days", type=int, default=30, help="Archive tickets closed more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    total = archive_closed_tickets(args.days, args.batch_size, pause_seconds=args.pause)
+    print(f"[OK] Archived {total} tickets in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,319 @@
+"""
+attachments.py - Streaming, content-addressed ticket attachments
+Uploads are parsed incrementally (python-multipart) as the request body
+arrives: each file part is written to a temp file and hashed (SHA-256) chunk by
+chunk, so memory per upload stays constant whatever the file size. The
+finished file is renamed to objects/<hash[:2]>/<hash[2:4]>/<hash>; identical
+content uploaded to any ticket is stored once. The database only holds
+metadata rows (ticket_attachments, in the ticket's shard).
+
+Downloads honour single-range requests (resume, media seeking). With
+ATTACHMENT_ACCEL_PREFIX set, the app only authorizes the download and hands
+the file to the fronting nginx (X-Accel-Redirect), which serves it with
+sendfile.
+
+Usage:
+    python attachments.py gc             # delete unreferenced objects and stale temp files
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import anyio
+from multipart.exceptions import ParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import select
+from starlette.responses import FileResponse, Response
+
+import models
+import sharding
+
+# ========== CONFIGURATION ==========
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "./attachments")
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(25 * 1024 * 1024)))
+MAX_FILES_PER_UPLOAD = 10
+# Whole request body: every file at the limit plus room for the multipart framing
+MAX_UPLOAD_BYTES = MAX_FILES_PER_UPLOAD * MAX_ATTACHMENT_BYTES + 64 * 1024
+# e.g. "/protected-attachments/" mapped by nginx (internal) onto ATTACHMENT_DIR/objects/
+ACCEL_PREFIX = os.getenv("ATTACHMENT_ACCEL_PREFIX", "")
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# gc leaves recent objects/temp files alone: an upload may have just deduplicated
+# against an object (touching it) and not yet committed its metadata row
+GC_GRACE_SECONDS = 3600
+
+class AttachmentError(Exception):
+    """Rejected upload or download; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class StoredFile(NamedTuple):
+    sha256: str
+    size: int
+    filename: str
+    content_type: str
+    deduplicated: bool
+
+# ========== STORAGE ==========
+
+def object_path(digest: str) -> str:
+    return os.path.join(ATTACHMENT_DIR, "objects", digest[:2], digest[2:4], digest)
+
+def _tmp_dir() -> str:
+    path = os.path.join(ATTACHMENT_DIR, "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class _FilePart:
+    """One file being received: temp file + running hash"""
+
+    def __init__(self, filename: str, content_type: str):
+        self.filename = filename
+        self.content_type = content_type
+        fd, self.path = tempfile.mkstemp(dir=_tmp_dir(), suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > MAX_ATTACHMENT_BYTES:
+            raise AttachmentError(413, f"Attachment exceeds {MAX_ATTACHMENT_BYTES} bytes")
+        self.hash.update(data)
+        self.file.write(data)
+
+    def store(self) -> StoredFile:
+        """Move the finished file to its content address (or drop it if already stored)"""
+        self.file.close()
+        digest = self.hash.hexdigest()
+        target = object_path(digest)
+        deduplicated = os.path.exists(target)
+        if deduplicated:
+            os.unlink(self.path)
+            os.utime(target)  # keeps gc off it until the metadata row is committed
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(self.path, target)
+        return StoredFile(digest, self.size, self.filename, self.content_type, deduplicated)
+
+    def discard(self) -> None:
+        self.file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+# ========== MULTIPART STREAMING ==========
+
+def _filename(value: bytes) -> str:
+    # Only the base name is kept; it is metadata, never part of a storage path
+    name = value.decode("utf-8", "replace").replace("\\", "/").rsplit("/", 1)[-1].strip()
+    return name[:255] or "attachment"
+
+class MultipartUpload:
+    """
+    Incremental multipart/form-data parser that stores every file part
+
+    feed() the body chunks as they arrive, then finish(). Non-file fields are
+    ignored. Call discard() if the upload is abandoned.
+    """
+
+    def __init__(self, content_type: Optional[str]):
+        mime, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise AttachmentError(400, "Expected a multipart/form-data body")
+        self.stored: List[StoredFile] = []
+        self.current: Optional[_FilePart] = None
+        self._headers = {}
+        self._field = b""
+        self._value = b""
+        self._files = 0
+        self._received = 0
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._field = self._value = b""
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            return
+        self._files += 1
+        if self._files > MAX_FILES_PER_UPLOAD:
+            raise AttachmentError(400, f"At most {MAX_FILES_PER_UPLOAD} files per upload")
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1").strip()
+        self.current = _FilePart(_filename(options[b"filename"]), content_type or "application/octet-stream")
+
+    def _on_part_data(self, data, start, end):
+        if self.current is not None:
+            self.current.write(data[start:end])
+
+    def _on_part_end(self):
+        if self.current is not None:
+            part, self.current = self.current, None
+            self.stored.append(part.store())
+
+    def feed(self, chunk: bytes) -> None:
+        self._received += len(chunk)
+        if self._received > MAX_UPLOAD_BYTES:
+            raise AttachmentError(413, f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+        try:
+            self.parser.write(chunk)
+        except ParseError as e:
+            raise AttachmentError(400, f"Malformed multipart body: {e}")
+
+    def finish(self) -> List[StoredFile]:
+        try:
+            self.parser.finalize()
+        except ParseError as e:
+            raise AttachmentError(400, f"Malformed multipart body: {e}")
+        if self.current is not None:
+            raise AttachmentError(400, "Upload ended in the middle of a file")
+        if not self.stored:
+            raise AttachmentError(400, "No file in upload")
+        return self.stored
+
+    def discard(self) -> None:
+        """Drop a half-received file (stored objects stay; gc reclaims them if unused)"""
+        if self.current is not None:
+            self.current.discard()
+            self.current = None
+
+# ========== DOWNLOADS ==========
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (first, last) byte positions for a single "bytes=" range, None to send the
+    whole file (no header, several ranges, garbage such as "bytes=3-1", or an
+    empty file); raises AttachmentError(416) if the range starts past the end
+    """
+    if not header or not header.startswith("bytes=") or "," in header or size == 0:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end < start):
+        return None
+    if end is None:
+        end = size - 1
+    if start >= size:
+        raise AttachmentError(416, "Requested range not satisfiable")
+    return start, min(end, size - 1)
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that serves one byte range (206) when asked"""
+
+    def __init__(self, path: str, byte_range: Optional[Tuple[int, int]], size: int, **kwargs):
+        super().__init__(path, stat_result=os.stat(path), **kwargs)
+        self.byte_range = byte_range
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["x-content-type-options"] = "nosniff"
+        if byte_range is not None:
+            first, last = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {first}-{last}/{size}"
+            self.headers["content-length"] = str(last - first + 1)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self.byte_range is None:
+            await super().__call__(scope, receive, send)
+            return
+        first, last = self.byte_range
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        remaining = last - first + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(first)
+            while remaining > 0:
+                chunk = await file.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0 and bool(chunk)})
+                if not chunk:
+                    break
+
+def download_response(attachment, range_header: Optional[str]) -> Response:
+    """Response for an authorized download of an attachment row"""
+    path = object_path(attachment.sha256)
+    if ACCEL_PREFIX:
+        relative = os.path.relpath(path, os.path.join(ATTACHMENT_DIR, "objects")).replace(os.sep, "/")
+        response = Response(media_type=attachment.content_type, headers={
+            "X-Accel-Redirect": ACCEL_PREFIX.rstrip("/") + "/" + relative,
+            "X-Content-Type-Options": "nosniff",
+        })
+        # Same Content-Disposition FileResponse would send
+        response.headers["content-disposition"] = FileResponse(
+            path, filename=attachment.filename, stat_result=os.stat_result((0,) * 10)
+        ).headers["content-disposition"]
+        return response
+    byte_range = parse_range(range_header, attachment.size)
+    return RangeFileResponse(path, byte_range, attachment.size,
+                             media_type=attachment.content_type, filename=attachment.filename)
+
+# ========== GARBAGE COLLECTION ==========
+
+def gc(grace_seconds: int = GC_GRACE_SECONDS) -> Tuple[int, int]:
+    """Delete objects no attachment row references (any shard) and stale temp files"""
+    table = models.TicketAttachment.__table__
+    referenced = set()
+    for shard in sharding.shards:
+        with shard.engine.connect() as conn:
+            referenced.update(conn.execute(select(table.c.sha256).distinct()).scalars())
+    cutoff = time.time() - grace_seconds
+    removed_objects = removed_temp = 0
+    for root, _, files in os.walk(os.path.join(ATTACHMENT_DIR, "objects")):
+        for name in files:
+            path = os.path.join(root, name)
+            if name not in referenced and os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed_objects += 1
+    tmp = os.path.join(ATTACHMENT_DIR, "tmp")
+    if os.path.isdir(tmp):
+        for name in os.listdir(tmp):
+            path = os.path.join(tmp, name)
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed_temp += 1
+    return removed_objects, removed_temp
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "gc":
+        objects, temp = gc()
+        print(f"[OK] Removed {objects} unreferenced objects and {temp} stale temp files")
+    else:
+        print("Usage: python attachments.py gc")
+        sys.exit(1)
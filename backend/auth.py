@@ -3,8 +3,9 @@ auth.py - Authentication system for AutoResolve AI
 Handles password hashing, JWT tokens, and user authentication
 """
 
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Dict, Optional, Union
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -12,6 +13,7 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 import models
 import schemas
+import metrics
 from database import get_db
 
 # ========== CONFIGURATION ==========
@@ -22,26 +24,52 @@ from dotenv import load_dotenv
 load_dotenv()  # Load .env file
 
 # Get secret from environment variable or use default (change in production!)
-SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-this-in-production")
+DEFAULT_SECRET_KEY = "your-super-secret-key-change-this-in-production"
+SECRET_KEY = os.getenv("SECRET_KEY", DEFAULT_SECRET_KEY)
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Access tokens are short-lived; clients renew them through POST /token/refresh
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "5"))
+
+# Tokens younger than this are authorized from their claims alone (no user-table query).
+# Older tokens are re-checked against the user's token_version at most once per window.
+#
+# Revocation window: revoke_tokens() takes effect immediately in the worker that
+# handled it, but the denylist below is per process. Every other worker keeps
+# accepting an already-issued token until it is CLAIMS_TRUST_SECONDS old (then the
+# DB check rejects it) or it expires, whichever comes first - i.e. a demoted or
+# deactivated user keeps their old role for at most
+# min(CLAIMS_TRUST_SECONDS, ACCESS_TOKEN_EXPIRE_MINUTES * 60) seconds elsewhere.
+CLAIMS_TRUST_SECONDS = int(os.getenv("CLAIMS_TRUST_SECONDS", "60"))
 
 # ========== PASSWORD HASHING ==========
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Built on first use so importing this module (every worker, every script) stays cheap
+_pwd_context: Optional[CryptContext] = None
+
+def get_pwd_context() -> CryptContext:
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with metrics.timer("bcrypt_duration_seconds", (("op", "verify"),)):
+        return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password using bcrypt"""
-    return pwd_context.hash(password)
+    with metrics.timer("bcrypt_duration_seconds", (("op", "hash"),)):
+        return get_pwd_context().hash(password)
 
 # ========== USER AUTHENTICATION ==========
+def normalize_email(email: str) -> str:
+    """Canonical stored form of an email (lets lookups use the plain email index)"""
+    return email.strip().lower()
+
 def authenticate_user(db: Session, username: str, password: str):
     """Authenticate a user by username/email and password"""
     user = db.query(models.User).filter(
-        (models.User.username == username) | (models.User.email == username)
+        (models.User.username == username) | (models.User.email == normalize_email(username))
     ).first()
     
     if not user:
@@ -60,15 +88,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 # ========== TOKEN VERIFICATION ==========
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Get the current user from JWT token"""
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    Get the current user from JWT token
+
+    A plain def so FastAPI runs it in the threadpool: waiting for a pooled
+    connection must never block the event loop.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -94,6 +127,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     
     if user is None:
         raise credentials_exception
+    if payload.get("ver", 0) != (user.token_version or 0):
+        raise credentials_exception
     return user
 
 async def get_current_active_user(current_user = Depends(get_current_user)):
@@ -102,4 +137,75 @@ async def get_current_active_user(current_user = Depends(get_current_user)):
         return None
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+
+# ========== CLAIMS-ONLY PRINCIPAL ==========
+# Compact in-memory revocation state, keyed by user id:
+#   _min_token_version: tokens carrying a lower "ver" claim are rejected (denylist)
+#   _version_checked_at: when the user's token_version was last confirmed against the DB
+_min_token_version: Dict[int, int] = {}
+_version_checked_at: Dict[int, float] = {}
+
+def revoke_tokens(user) -> None:
+    """Invalidate every token issued to a user so far (caller commits)"""
+    user.token_version = (user.token_version or 0) + 1
+    _min_token_version[user.id] = user.token_version
+    _version_checked_at[user.id] = time.monotonic()
+
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    Authorize from verified JWT claims without loading the user row
+    
+    Returns a schemas.Principal (id, username, role). Fresh tokens need no query;
+    tokens older than CLAIMS_TRUST_SECONDS trigger one primary-key lookup of the
+    user's token_version/is_active per trust window (see the revocation window
+    note at CLAIMS_TRUST_SECONDS). A plain def, like get_current_user: the
+    lookups block, so FastAPI must run it in the threadpool.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    if not token:
+        return None
+    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    
+    username = payload.get("sub")
+    user_id = payload.get("user_id")
+    role = payload.get("role")
+    version = payload.get("ver", 0)
+    if username is None or user_id is None or role is None:
+        # Tokens issued before claims were embedded take the full lookup path
+        user = get_current_user(token, db)
+        if not user.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+        return schemas.Principal(id=user.id, username=user.username, role=user.role,
+                                 token_version=user.token_version or 0)
+    
+    if version < _min_token_version.get(user_id, 0):
+        raise credentials_exception
+    
+    now = time.monotonic()
+    issued_at = payload.get("iat", 0)
+    token_age = time.time() - issued_at
+    if token_age > CLAIMS_TRUST_SECONDS and now - _version_checked_at.get(user_id, 0) > CLAIMS_TRUST_SECONDS:
+        row = db.query(models.User.token_version, models.User.is_active).filter(
+            models.User.id == user_id
+        ).first()
+        if row is None:
+            raise credentials_exception
+        current_version = row.token_version or 0
+        _min_token_version[user_id] = current_version
+        _version_checked_at[user_id] = now
+        if not row.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+        if version != current_version:
+            raise credentials_exception
+    
+    return schemas.Principal(id=user_id, username=username, role=role, token_version=version)
@@ -0,0 +1,202 @@
+"""
+availability.py - Fast username/email availability checks for sign-up
+A Bloom filter of every taken username and email answers "definitely free"
+without touching the database; only possible hits fall through to an indexed
+lookup. The filter is built once per worker in the background, on the first
+check that worker serves (workers that never answer one never scan the users
+table, and startup does no work), then topped up
+incrementally (users with id > last seen) so registrations on other workers
+become visible. Email changes are added to the local filter directly; other
+workers only see them at their next full rebuild (every REBUILD_SECONDS, or
+when the filter outgrows its capacity). Until then they may answer "free" for
+the new email; registration itself always checks the database.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import func, select
+
+import database
+import metrics
+import models
+
+# ========== CONFIGURATION ==========
+INITIAL_CAPACITY = 1_000_000
+FALSE_POSITIVE_RATE = 0.001
+REFRESH_SECONDS = 5.0
+# Full rebuilds pick up changed emails (the incremental scan only sees new ids)
+REBUILD_SECONDS = 600.0
+
+# ========== BLOOM FILTER ==========
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        value = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest(), "little")
+        h1 = value & 0xFFFFFFFFFFFFFFFF
+        h2 = (value >> 64) | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> None:
+        bits = self.bits
+        for pos in self._positions(item):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(item):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+# ========== TAKEN-NAMES REGISTRY ==========
+
+class _Registry:
+    def __init__(self):
+        self.filter: Optional[BloomFilter] = None
+        self.last_user_id = 0
+        self.refreshed_at = 0.0
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+        self.warming = False
+        self.session_factory = None
+
+_registry = _Registry()
+
+def _key(kind: str, value: str) -> str:
+    return f"{kind}:{value}"
+
+def _load_new_users(db, bloom: BloomFilter, after_id: int) -> int:
+    """Add users with id > after_id (a primary-key range scan); returns the last id seen"""
+    rows = db.execute(
+        select(models.User.id, models.User.username, models.User.email)
+        .where(models.User.id > after_id)
+        .order_by(models.User.id)
+    ).all()
+    for user_id, username, email in rows:
+        bloom.add(_key("u", username))
+        bloom.add(_key("e", email))
+        after_id = user_id
+    return after_id
+
+def _build(session_factory) -> None:
+    db = session_factory()
+    try:
+        user_count = db.execute(select(func.count(models.User.id))).scalar() or 0
+        # Two entries (username + email) per user, with room to grow
+        bloom = BloomFilter(max(INITIAL_CAPACITY, user_count * 2) * 2, FALSE_POSITIVE_RATE)
+        last_id = _load_new_users(db, bloom, 0)
+        with _registry.lock:
+            _registry.filter = bloom
+            _registry.last_user_id = last_id
+            _registry.refreshed_at = _registry.built_at = time.monotonic()
+        metrics.set_gauge("availability_filter_entries", bloom.count)
+        print(f"[OK] Availability filter loaded ({user_count} users)")
+    except Exception as e:
+        print(f"[ERROR] Availability filter load failed: {e}")
+    finally:
+        _registry.warming = False
+        db.close()
+
+def warm_up(session_factory=None) -> None:
+    """Build the filter in a background thread (once); lookups hit the database until it is ready"""
+    with _registry.lock:
+        if session_factory is not None:
+            _registry.session_factory = session_factory
+        if _registry.warming or _registry.filter is not None:
+            return
+        _registry.warming = True
+    _start_build(_registry.session_factory or database.ReadSessionLocal)
+
+def _start_build(session_factory) -> None:
+    _registry.warming = True
+    threading.Thread(target=_build, args=(session_factory,), name="availability-warmup", daemon=True).start()
+
+def _current_filter(db) -> Optional[BloomFilter]:
+    bloom = _registry.filter
+    if bloom is None:
+        if not _registry.warming:
+            warm_up()
+        return None
+    # Past capacity the false-positive rate climbs (more queries, never wrong
+    # answers), so keep serving the old filter while a larger one is built
+    reason = None
+    if bloom.count > bloom.capacity:
+        reason = "capacity"
+    elif time.monotonic() - _registry.built_at >= REBUILD_SECONDS:
+        reason = "periodic"
+    if reason is not None and not _registry.warming:
+        metrics.inc("availability_filter_rebuilds_total", (("reason", reason),))
+        _start_build(_registry.session_factory or database.ReadSessionLocal)
+    if time.monotonic() - _registry.refreshed_at >= REFRESH_SECONDS and _registry.lock.acquire(blocking=False):
+        try:
+            _registry.last_user_id = _load_new_users(db, bloom, _registry.last_user_id)
+            _registry.refreshed_at = time.monotonic()
+        finally:
+            _registry.lock.release()
+    return bloom
+
+def record_registration(username: str, email: str) -> None:
+    """Make a just-registered (or just-renamed) user visible to this worker's filter immediately"""
+    if _registry.filter is not None:
+        _registry.filter.add(_key("u", username))
+        _registry.filter.add(_key("e", email))
+
+def find_taken(db, username: Optional[str] = None, email: Optional[str] = None) -> dict:
+    """
+    Return {"username": bool, "email": bool} (True = already taken)
+
+    Values the filter has never seen are answered from memory; possible
+    matches are confirmed with a single combined indexed query.
+    """
+    bloom = _current_filter(db)
+    if bloom is None:
+        return {
+            kind: any(getattr(row, kind) == value for row in find_existing(db, username, email))
+            for kind, value in (("username", username), ("email", email)) if value is not None
+        }
+
+    taken = {}
+    check_username = username is not None and _key("u", username) in bloom
+    check_email = email is not None and _key("e", email) in bloom
+    if username is not None and not check_username:
+        taken["username"] = False
+    if email is not None and not check_email:
+        taken["email"] = False
+    if check_username or check_email:
+        matches = find_existing(db, username if check_username else None, email if check_email else None)
+        if check_username:
+            taken["username"] = any(row.username == username for row in matches)
+        if check_email:
+            taken["email"] = any(row.email == email for row in matches)
+    return taken
+
+def find_existing(db, username: Optional[str], email: Optional[str]):
+    """One query for users holding this username and/or (normalized) email"""
+    conditions = []
+    if username is not None:
+        conditions.append(models.User.username == username)
+    if email is not None:
+        conditions.append(models.User.email == email)
+    if not conditions:
+        return []
+    query = select(models.User.id, models.User.username, models.User.email)
+    if len(conditions) == 1:
+        query = query.where(conditions[0])
+    else:
+        query = query.where(conditions[0] | conditions[1])
+    return db.execute(query.limit(2)).all()
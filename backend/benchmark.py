@@ -0,0 +1,342 @@
+"""
+benchmark.py - Repeatable load test for the AutoResolve AI API
+Starts the app in-process against a temporary SQLite database, seeds users and
+tickets, drives a realistic request mix concurrently and reports per-endpoint
+throughput and p50/p95/p99 latency.
+
+Usage:
+    python benchmark.py --users 50 --tickets 2000 --requests 5000 --concurrency 16
+    python benchmark.py --compare benchmarks/results/<previous>.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "results")
+BENCH_PASSWORD = "Bench@1234"
+
+# Relative weights of each operation in the request mix
+DEFAULT_MIX = {
+    "login": 2,
+    "create_ticket": 15,
+    "list_tickets": 35,
+    "list_tickets_filtered": 15,
+    "get_ticket": 20,
+    "update_ticket": 13,
+}
+
+STATUSES = ["open", "in_progress", "resolved", "closed"]
+PRIORITIES = ["low", "medium", "high", "urgent"]
+
+# ========== ENVIRONMENT SETUP ==========
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+def seed(num_users: int, num_tickets: int, rng: random.Random):
+    """Seed users (10% agents) and tickets; returns (users, ticket ids)"""
+    import auth
+    import database
+    import migrations
+    import models
+    import sharding
+
+    migrations.upgrade()
+    hashed = auth.get_password_hash(BENCH_PASSWORD)
+    users = []
+    with database.engine.begin() as conn:
+        rows = []
+        for i in range(num_users):
+            role = "agent" if i % 10 == 0 else "customer"
+            rows.append({
+                "email": f"bench{i}@example.com",
+                "username": f"bench{i}",
+                "hashed_password": hashed,
+                "role": role,
+                "is_active": True,
+            })
+            users.append((i + 1, f"bench{i}", role))
+        conn.execute(models.User.__table__.insert(), rows)
+
+        customers = [u for u in users if u[2] == "customer"] or users
+        rows = [{
+            "title": f"Benchmark ticket {i}",
+            "description": "Cannot log in after password reset, please help. " * 4,
+            "status": rng.choice(STATUSES),
+            "priority": rng.choice(PRIORITIES),
+            "user_id": rng.choice(customers)[0],
+            "resolved_by_ai": False,
+        } for i in range(num_tickets)]
+    if rows:
+        sharding.bulk_insert_tickets(rows)
+    # Without sharding the fresh database numbers tickets 1..n
+    ticket_ids = [row["id"] for row in rows] if sharding.ENABLED else list(range(1, num_tickets + 1))
+    return users, ticket_ids
+
+# ========== CLIENT ==========
+
+class Client:
+    """One keep-alive HTTP connection, used by a single worker thread"""
+
+    def __init__(self, port: int):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def request(self, method, path, body=None, token=None, form=False):
+        headers = {}
+        data = None
+        if body is not None:
+            if form:
+                data = urllib.parse.urlencode(body)
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            else:
+                data = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self.conn.request(method, path, body=data, headers=headers)
+        response = self.conn.getresponse()
+        payload = response.read()
+        return response.status, payload
+
+    def login(self, username):
+        status_code, payload = self.request(
+            "POST", "/login", {"username": username, "password": BENCH_PASSWORD}, form=True
+        )
+        if status_code != 200:
+            raise RuntimeError(f"Login failed for {username}: {status_code}")
+        return json.loads(payload)["access_token"]
+
+# ========== WORKLOAD ==========
+
+def run_workload(port, users, ticket_ids, total_requests, concurrency, mix, rng_seed):
+    ops = list(mix)
+    weights = [mix[o] for o in ops]
+    latencies = {op: [] for op in ops}
+    errors = {op: 0 for op in ops}
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker(worker_id):
+        rng = random.Random(rng_seed + worker_id)
+        client = Client(port)
+        user_id, username, role = users[worker_id % len(users)]
+        token = client.login(username)
+        local = {op: [] for op in ops}
+        local_errors = {op: 0 for op in ops}
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            op = rng.choices(ops, weights)[0]
+            ticket_id = ticket_ids[rng.randint(1, max(len(ticket_ids), 1)) - 1] if ticket_ids else 1
+            start = time.perf_counter()
+            if op == "login":
+                status_code, _ = client.request(
+                    "POST", "/login", {"username": username, "password": BENCH_PASSWORD}, form=True
+                )
+            elif op == "create_ticket":
+                status_code, _ = client.request("POST", "/tickets", {
+                    "title": "Load test ticket",
+                    "description": "Refund request for duplicate invoice charge.",
+                    "priority": rng.choice(PRIORITIES),
+                }, token=token)
+            elif op == "list_tickets":
+                skip = rng.choice([0, 0, 0, 20, 100])
+                status_code, _ = client.request("GET", f"/tickets?skip={skip}&limit=20", token=token)
+            elif op == "list_tickets_filtered":
+                query = f"status={rng.choice(STATUSES)}&priority={rng.choice(PRIORITIES)}&limit=20"
+                status_code, _ = client.request("GET", f"/tickets?{query}", token=token)
+            elif op == "get_ticket":
+                status_code, _ = client.request("GET", f"/tickets/{ticket_id}", token=token)
+            else:
+                body = {"status": rng.choice(STATUSES)} if role != "customer" else {"title": "Edited title"}
+                status_code, _ = client.request("PUT", f"/tickets/{ticket_id}", body, token=token)
+            elapsed = time.perf_counter() - start
+            # 403/404 are expected for customers touching other people's tickets
+            if status_code >= 500 or status_code in (401, 400):
+                local_errors[op] += 1
+            local[op].append(elapsed)
+        with lock:
+            for op in ops:
+                latencies[op].extend(local[op])
+                errors[op] += local_errors[op]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i) for i in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, wall):
+    endpoints = {}
+    total = 0
+    for op, values in latencies.items():
+        values = sorted(values)
+        total += len(values)
+        endpoints[op] = {
+            "requests": len(values),
+            "errors": errors[op],
+            "throughput_rps": round(len(values) / wall, 2) if wall else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    return {
+        "total_requests": total,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else 0.0,
+        "endpoints": endpoints,
+    }
+
+def measure_cold_start(runs: int):
+    """Time `import main` plus the startup check in fresh interpreters (one per worker start)"""
+    backend = os.path.dirname(os.path.abspath(__file__))
+    script = (
+        "import sys, time, asyncio; t = time.perf_counter(); "
+        f"sys.path.insert(0, {backend!r}); import main; "
+        "asyncio.run(main.app.router.startup()); "
+        "print(time.perf_counter() - t)"
+    )
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", script], text=True, env=os.environ)
+        timings.append(float(output.strip().splitlines()[-1]))
+    timings.sort()
+    return {
+        "runs": runs,
+        "min_ms": round(timings[0] * 1000, 1),
+        "median_ms": round(timings[len(timings) // 2] * 1000, 1),
+        "max_ms": round(timings[-1] * 1000, 1),
+    }
+
+# ========== REPORTING ==========
+
+def print_report(summary, baseline=None):
+    print("\n" + "=" * 78)
+    print(f"{'Endpoint':<24} {'req':>7} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    print("=" * 78)
+    for op, row in summary["endpoints"].items():
+        print(f"{op:<24} {row['requests']:>7} {row['errors']:>5} {row['throughput_rps']:>9} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+        if baseline and op in baseline.get("endpoints", {}):
+            old = baseline["endpoints"][op]
+            print(f"{'  vs baseline':<24} {'':>7} {'':>5} {_delta(old['throughput_rps'], row['throughput_rps']):>9} "
+                  f"{_delta(old['p50_ms'], row['p50_ms']):>9} {_delta(old['p95_ms'], row['p95_ms']):>9} "
+                  f"{_delta(old['p99_ms'], row['p99_ms']):>9}")
+    print("=" * 78)
+    print(f"Total: {summary['total_requests']} requests in {summary['wall_seconds']}s "
+          f"({summary['throughput_rps']} req/s)")
+
+def _delta(old, new):
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+# ========== MAIN ==========
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoResolve AI API benchmark")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Previous result JSON to compare against")
+    parser.add_argument("--cold-start", type=int, metavar="RUNS",
+                        help="Only measure per-worker cold start over RUNS fresh interpreters")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="autoresolve-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import uvicorn
+    import main as app_module
+
+    rng = random.Random(args.seed)
+    users, ticket_ids = seed(args.users, args.tickets, rng)
+
+    if args.cold_start:
+        result = measure_cold_start(args.cold_start)
+        print(f"[OK] Cold start over {result['runs']} runs: median {result['median_ms']} ms "
+              f"(min {result['min_ms']}, max {result['max_ms']})")
+        return result
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        latencies, errors, wall = run_workload(
+            port, users, ticket_ids, args.requests, args.concurrency, DEFAULT_MIX, args.seed
+        )
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    summary = summarize(latencies, errors, wall)
+    result = {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "users": args.users,
+            "tickets": args.tickets,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "mix": DEFAULT_MIX,
+        },
+        **summary,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{result['commit']}-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"[OK] Results written to {output}")
+
+if __name__ == "__main__":
+    main()
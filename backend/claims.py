@@ -0,0 +1,133 @@
+"""
+claims.py - Work queue for agents ("claim next ticket")
+An agent claims the most urgent, oldest open ticket nobody holds in a single
+conditional UPDATE ... RETURNING. The candidate comes from the partial index
+ix_tickets_claim_queue (status, priority_rank, created_at, id over open,
+unassigned tickets), so picking it is one index seek however large the table is, and the
+UPDATE re-checks that the ticket is still unassigned, so two agents can never
+get the same ticket. On PostgreSQL the candidate is locked with SKIP LOCKED so
+concurrent claimers move on to the next ticket instead of queueing; SQLite
+serializes writers anyway.
+
+A claim is a lease: until the agent moves the ticket out of "open" (or
+reassigns it) it expires after CLAIM_LEASE_MINUTES and the ticket goes back
+to the queue.
+
+Usage:
+    python claims.py release     # return expired claims to the queue now
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, select, update
+
+import models
+import sharding
+
+# ========== CONFIGURATION ==========
+CLAIM_LEASE_MINUTES = int(os.getenv("CLAIM_LEASE_MINUTES", "15"))
+# Expired leases are released by claimers at most this often per shard and process
+RELEASE_INTERVAL_SECONDS = 30.0
+
+_tickets = models.Ticket.__table__
+_last_release: Dict[int, float] = {}
+
+# ========== LEASES ==========
+
+def release_expired(conn, now: Optional[datetime] = None) -> int:
+    """Hand expired claims on still-open tickets back to the queue; returns how many"""
+    now = now or datetime.utcnow()
+    result = conn.execute(
+        update(_tickets)
+        .where(_tickets.c.claim_expires_at < now)
+        .values(
+            # Tickets that moved on keep their assignee; only the lease is dropped
+            assigned_to=case((_tickets.c.status == "open", None), else_=_tickets.c.assigned_to),
+            claim_expires_at=None,
+        )
+    )
+    return result.rowcount
+
+def _release_if_due(conn, shard_index: int) -> None:
+    now = time.monotonic()
+    if now - _last_release.get(shard_index, 0.0) >= RELEASE_INTERVAL_SECONDS:
+        _last_release[shard_index] = now
+        release_expired(conn)
+
+# ========== CLAIMING ==========
+
+def _next_claimable():
+    """
+    Id of the first ticket in the claim queue
+
+    The predicate is the index's own literal text: SQLite only uses a partial
+    index when the query's WHERE matches it, and a bound status = ? does not.
+    """
+    return (
+        select(_tickets.c.id)
+        .where(models.CLAIMABLE_WHERE)
+        .order_by(_tickets.c.priority_rank, _tickets.c.created_at, _tickets.c.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+
+def claim_next(conn, agent_id: int, shard_index: int = 0) -> Optional[int]:
+    """
+    Assign the next ticket in the queue to agent_id (caller commits)
+
+    Returns the claimed ticket id, or None when the queue is empty.
+    """
+    _release_if_due(conn, shard_index)
+    expires_at = datetime.utcnow() + timedelta(minutes=CLAIM_LEASE_MINUTES)
+    return conn.execute(
+        update(_tickets)
+        .where(_tickets.c.id == _next_claimable(),
+               _tickets.c.status == "open", _tickets.c.assigned_to.is_(None))
+        .values(assigned_to=agent_id, claim_expires_at=expires_at)
+        .returning(_tickets.c.id)
+    ).scalar()
+
+def shards_in_claim_order() -> List[sharding.Shard]:
+    """
+    Shards ordered by the head of their claim queue, so the claim stays globally
+    most urgent first; shards with an empty queue go last (they may still have
+    expired leases to release)
+    """
+    if len(sharding.shards) == 1:
+        return list(sharding.shards)
+
+    def head(shard):
+        with shard.engine.connect() as conn:
+            return conn.execute(
+                select(_tickets.c.priority_rank, _tickets.c.created_at, _tickets.c.id)
+                .where(models.CLAIMABLE_WHERE)
+                .order_by(_tickets.c.priority_rank, _tickets.c.created_at, _tickets.c.id)
+                .limit(1)
+            ).first()
+
+    heads = sharding.fan_out(head)
+    return [
+        shard for _, shard in sorted(
+            zip(heads, sharding.shards),
+            key=lambda pair: (pair[0] is None, tuple(pair[0]) if pair[0] else ()),
+        )
+    ]
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "release":
+        released = 0
+        for shard in sharding.shards:
+            with shard.engine.begin() as conn:
+                released += release_expired(conn)
+        print(f"[OK] Released {released} expired claims")
+    else:
+        print("Usage: python claims.py release")
+        sys.exit(1)
@@ -0,0 +1,146 @@
+"""
+column_types.py - Custom SQLAlchemy column types
+CompressedText stores large support-ticket text zlib-compressed with a shared
+preset dictionary of common helpdesk phrasing, which compresses even short
+descriptions well. Values below COMPRESS_THRESHOLD are stored uncompressed.
+
+Usage:
+    python column_types.py measure [rows]    # compression ratio of stored ticket text
+"""
+
+import sys
+import zlib
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+# ========== CONFIGURATION ==========
+COMPRESS_THRESHOLD = 200  # bytes of UTF-8; shorter values aren't worth the CPU
+COMPRESS_LEVEL = 6
+
+# Stored format: one marker byte, then the payload
+MARK_RAW = 0x00
+MARK_ZLIB_DICT_V1 = 0x01
+
+# Preset dictionary (zlib zdict). Hand-curated helpdesk phrasing, not trained on
+# ticket data: phrases that show up across tickets and agent replies; zlib favours
+# matches near the end, so the most common text goes last. Check how well it
+# fits real data with `python column_types.py measure` before adding a V2.
+# Never edit in place: add a new version + marker so stored rows stay readable.
+SUPPORT_DICTIONARY_V1 = (
+    "shipping address tracking number package delivered courier warehouse "
+    "subscription plan upgrade downgrade billing cycle renewal trial premium basic "
+    "error message screenshot browser version operating system mobile app update crash "
+    "two-factor authentication code verification email link expired "
+    "unfortunately we are unable to at this time. We apologize for the inconvenience. "
+    "Please clear your browser cache and cookies and try again. "
+    "Could you please provide your order number and the email address on the account? "
+    "If the issue persists, please reply to this ticket and we will investigate further. "
+    "Our team is looking into this and will update you as soon as possible. "
+    "I have escalated your ticket to our technical team. "
+    "Thank you for your patience. Best regards, Customer Support Team. "
+    "I was charged twice for my order. Please refund the duplicate payment. "
+    "I did not receive the invoice for my last payment. "
+    "I cannot log in to my account. It says invalid username or password. "
+    "I requested a password reset link but did not receive the email. "
+    "Thank you for contacting support. We have received your request and "
+    "Hello, I need help with my account. Thank you for your help. "
+    "Hi, thanks for reaching out. I'm sorry to hear that you are having trouble with "
+    "Please let us know if you have any other questions. "
+    "refund invoice payment charged account password login reset order "
+).encode("utf-8")
+
+_DICTIONARIES = {MARK_ZLIB_DICT_V1: SUPPORT_DICTIONARY_V1}
+
+# ========== ENCODING ==========
+
+def encode_text(value: str) -> bytes:
+    """Encode text in the stored format (compressed when it pays off)"""
+    raw = value.encode("utf-8")
+    if len(raw) >= COMPRESS_THRESHOLD:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=SUPPORT_DICTIONARY_V1)
+        packed = compressor.compress(raw) + compressor.flush()
+        if len(packed) < len(raw):
+            return bytes([MARK_ZLIB_DICT_V1]) + packed
+    return bytes([MARK_RAW]) + raw
+
+def decode_text(value) -> str:
+    """Decode a stored value; plain text from before compression is returned as-is"""
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value:
+        return ""
+    marker = value[0]
+    if marker == MARK_RAW:
+        return value[1:].decode("utf-8")
+    zdict = _DICTIONARIES.get(marker)
+    if zdict is not None:
+        decompressor = zlib.decompressobj(-15, zdict=zdict)
+        return (decompressor.decompress(value[1:]) + decompressor.flush()).decode("utf-8")
+    # Legacy UTF-8 bytes without a marker (e.g. a TEXT column converted to binary)
+    return value.decode("utf-8")
+
+# ========== SQLALCHEMY TYPE ==========
+
+class CompressedText(TypeDecorator):
+    """Text column stored as (optionally compressed) bytes"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return encode_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decode_text(value)
+
+# ========== MEASUREMENT ==========
+
+def _plain_zlib_size(raw: bytes) -> int:
+    """Stored size the same format would have without the preset dictionary"""
+    if len(raw) >= COMPRESS_THRESHOLD:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        return 1 + min(len(raw), len(compressor.compress(raw) + compressor.flush()))
+    return 1 + len(raw)
+
+def measure(rows: int = 10000) -> dict:
+    """Stored vs raw size of recent ticket descriptions and message bodies, with plain zlib for comparison"""
+    from sqlalchemy import text
+    import database
+
+    totals = {"values": 0, "long_values": 0, "raw_bytes": 0, "stored_bytes": 0, "zlib_bytes": 0,
+              "long_raw_bytes": 0, "long_stored_bytes": 0, "long_zlib_bytes": 0}
+    with database.engine.connect() as conn:
+        for query in ("SELECT description FROM tickets ORDER BY id DESC LIMIT :n",
+                      "SELECT body FROM ticket_messages ORDER BY id DESC LIMIT :n"):
+            for (stored,) in conn.execute(text(query), {"n": rows}):
+                if stored is None:
+                    continue
+                stored = stored.encode("utf-8") if isinstance(stored, str) else bytes(stored)
+                raw = decode_text(stored).encode("utf-8")
+                sizes = (len(raw), len(stored), _plain_zlib_size(raw))
+                prefixes = ("",) if len(raw) < COMPRESS_THRESHOLD else ("", "long_")
+                for prefix in prefixes:
+                    totals[prefix + "values"] += 1
+                    totals[prefix + "raw_bytes"] += sizes[0]
+                    totals[prefix + "stored_bytes"] += sizes[1]
+                    totals[prefix + "zlib_bytes"] += sizes[2]
+
+    print(f"[OK] {totals['values']} values, {totals['long_values']} of at least {COMPRESS_THRESHOLD} bytes")
+    for label, prefix in (("all values", ""), (f">= {COMPRESS_THRESHOLD} bytes", "long_")):
+        raw_bytes = totals[prefix + "raw_bytes"] or 1
+        print(f"     {label}: stored/raw {totals[prefix + 'stored_bytes'] / raw_bytes:.2f} with the dictionary, "
+              f"{totals[prefix + 'zlib_bytes'] / raw_bytes:.2f} with plain zlib")
+    return totals
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "measure":
+        measure(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        print("Usage: python column_types.py measure [rows]")
+        sys.exit(1)
@@ -3,28 +3,160 @@ database.py
 Purpose: Setup database connection for SQLite
 """
 
-from sqlalchemy import create_engine
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# Database URL - creates tickets.db in current folder
-SQLALCHEMY_DATABASE_URL = "sqlite:///./tickets.db"
+# Database URL - creates tickets.db in current folder unless DATABASE_URL is set
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./tickets.db")
+
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url
+
+def make_engine(url: str):
+    """Engine for a primary (read-write) database"""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}  # Needed for SQLite
+    )
+    if _is_sqlite_file(url):
+        @event.listens_for(engine, "connect")
+        def _enable_wal(dbapi_conn, _):
+            # WAL lets read-only connections proceed while a write transaction is open
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.close()
+    return engine
 
 # Create database engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Needed for SQLite
-)
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ========== READ/WRITE ROUTING ==========
+# GET handlers read through a separate pool: a replica when READ_DATABASE_URL is
+# set, otherwise read-only (mode=ro) connections to the same SQLite file.
+
+def read_only_url(url: str) -> str:
+    prefix = "sqlite:///"
+    if url.startswith(prefix) and ":memory:" not in url and "mode=ro" not in url:
+        path = url[len(prefix):]
+        return f"{prefix}file:{path}?mode=ro&uri=true"
+    return url
+
+def make_read_engine(read_url: str, primary):
+    """Engine for read-only traffic; an in-memory database can't be opened twice, so it shares the primary"""
+    if ":memory:" in read_url:
+        return primary
+    return create_engine(
+        read_url,
+        connect_args={"check_same_thread": False} if read_url.startswith("sqlite") else {}
+    )
+
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or read_only_url(SQLALCHEMY_DATABASE_URL)
+read_engine = make_read_engine(READ_DATABASE_URL, engine)
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# After a user's own write their reads go to the primary for this long,
+# so they never see a replica that is behind their change.
+#
+# Two records of the window: _last_write, per process, and a cookie carrying the
+# window's end back to the client (read_your_writes_middleware), so a read landing
+# on another worker still goes to the primary. Clients that drop cookies only get
+# the guarantee from the worker that handled their write.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_COOKIE = "rw_until"
+_last_write: Dict[int, float] = {}
+_prune_at_size = 1024
+
+class _RequestWrites:
+    """Per-request state shared with handler threads (mutated, never re-set)"""
+    __slots__ = ("client_until", "wrote_until")
+
+    def __init__(self, client_until: float):
+        self.client_until = client_until
+        self.wrote_until = 0.0
+
+_request_writes: ContextVar[Optional[_RequestWrites]] = ContextVar("request_writes", default=None)
+
+def _prune_writes(now: float) -> None:
+    """Drop expired entries; runs whenever the map doubles, so it stays bounded by recent writers"""
+    global _prune_at_size
+    for user_id, written_at in list(_last_write.items()):
+        if now - written_at >= READ_YOUR_WRITES_SECONDS:
+            _last_write.pop(user_id, None)
+    _prune_at_size = max(1024, 2 * len(_last_write))
+
+def note_write(user_id: Optional[int]) -> None:
+    """Record that a user just committed a write"""
+    if user_id is None:
+        return
+    now = time.monotonic()
+    _last_write[user_id] = now
+    if len(_last_write) >= _prune_at_size:
+        _prune_writes(now)
+    state = _request_writes.get()
+    if state is not None:
+        state.wrote_until = time.time() + READ_YOUR_WRITES_SECONDS
+
+def wrote_recently(user_id: Optional[int]) -> bool:
+    """True inside a user's read-your-writes window (this worker's record or the client's cookie)"""
+    if user_id is None:
+        return False
+    state = _request_writes.get()
+    if state is not None and state.client_until > time.time():
+        return True
+    written_at = _last_write.get(user_id)
+    if written_at is None:
+        return False
+    if time.monotonic() - written_at < READ_YOUR_WRITES_SECONDS:
+        return True
+    _last_write.pop(user_id, None)
+    return False
+
+async def read_your_writes_middleware(request, call_next):
+    """Read the client's read-your-writes cookie and set it after a write"""
+    try:
+        client_until = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0))
+    except ValueError:
+        client_until = 0.0
+    # Never honour more than one window from now (the cookie is unsigned; at worst
+    # a client sends its own reads to the primary)
+    state = _RequestWrites(min(client_until, time.time() + READ_YOUR_WRITES_SECONDS))
+    token = _request_writes.set(state)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_writes.reset(token)
+    if state.wrote_until:
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, f"{state.wrote_until:.3f}",
+                            max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite="lax")
+    return response
+
+def session_for_read(user_id: Optional[int] = None):
+    """Read session for a user: primary inside their read-your-writes window, replica otherwise"""
+    return SessionLocal() if wrote_recently(user_id) else ReadSessionLocal()
+
 # Base class for models
 Base = declarative_base()
 
 # Dependency to get DB session in API endpoints
 def get_db():
     db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency for anonymous read-only endpoints
+def get_read_db():
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
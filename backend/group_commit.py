@@ -0,0 +1,236 @@
+"""
+group_commit.py - Opt-in group commit for concurrent single-row writes
+Request threads hand a write function to one writer thread, which runs the
+writes of many concurrent requests in a single transaction (each inside its own
+SAVEPOINT) and commits once. Every request waits until that commit is durable,
+then gets its own result or its own exception.
+
+Enable with GROUP_COMMIT=1; tune with GROUP_COMMIT_WAIT_MS / GROUP_COMMIT_MAX_OPS.
+
+Usage:
+    python group_commit.py benchmark [writes] [threads] [commit_delay_ms]
+"""
+
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import sharding
+
+# ========== CONFIGURATION ==========
+ENABLED = os.getenv("GROUP_COMMIT", "0") == "1"
+MAX_WAIT_SECONDS = float(os.getenv("GROUP_COMMIT_WAIT_MS", "2")) / 1000.0
+MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_OPS", "64"))
+RESULT_TIMEOUT_SECONDS = 30
+
+class WriteNotApplied(Exception):
+    """The write waited too long in the queue and was withdrawn; it will never run"""
+
+# ========== WRITER ENGINE ==========
+
+def _make_engine(url: str):
+    """Dedicated engine for a writer thread"""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}
+    )
+    if url.startswith("sqlite"):
+        # pysqlite defers BEGIN and would let the first SAVEPOINT start (and its
+        # RELEASE commit) the transaction; take control of BEGIN ourselves.
+        # IMMEDIATE grabs the write lock up front instead of failing mid-batch.
+        @event.listens_for(engine, "connect")
+        def _disable_pysqlite_transactions(dbapi_conn, _):
+            dbapi_conn.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def _begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    return engine
+
+# ========== WRITER ==========
+
+class _Op:
+    __slots__ = ("fn", "future")
+
+    def __init__(self, fn: Callable, future: Future):
+        self.fn = fn
+        self.future = future
+
+class GroupCommitWriter:
+    """Collects writes for up to max_wait seconds or max_batch ops, then commits them together"""
+
+    def __init__(self, session_factory, max_wait: float = MAX_WAIT_SECONDS, max_batch: int = MAX_BATCH):
+        self.session_factory = session_factory
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.queue: "queue.Queue[Optional[_Op]]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock = threading.Lock()
+        self.batches = 0
+        self.ops = 0
+
+    def submit(self, fn: Callable) -> Future:
+        """Queue fn(session) to run in the next group; the future resolves after commit"""
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._loop, name="group-commit", daemon=True)
+                    self.thread.start()
+        future = Future()
+        self.queue.put(_Op(fn, future))
+        return future
+
+    def run(self, fn: Callable, timeout: float = RESULT_TIMEOUT_SECONDS):
+        """
+        Submit and wait: returns fn's result or re-raises its exception
+
+        A write still queued after timeout is withdrawn (WriteNotApplied), so a
+        retry can't duplicate it. One already running in a batch can't be taken
+        back; its commit decides the outcome, so that is awaited instead.
+        """
+        future = self.submit(fn)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriteNotApplied(f"Write not started within {timeout:g}s")
+            return future.result()
+
+    def stop(self) -> None:
+        """Drain pending writes and stop the writer thread"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=RESULT_TIMEOUT_SECONDS)
+            self.thread = None
+
+    def _collect(self, first: _Op):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                op = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if op is None:
+                self.queue.put(None)  # handle the stop after this batch
+                break
+            batch.append(op)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            self._commit_batch(self._collect(first))
+
+    def _commit_batch(self, batch):
+        outcomes = []
+        session = self.session_factory()
+        try:
+            session.begin()
+            for op in batch:
+                if not op.future.set_running_or_notify_cancel():
+                    continue
+                savepoint = session.begin_nested()
+                try:
+                    result = op.fn(session)
+                    savepoint.commit()
+                    outcomes.append((op, result, None))
+                except Exception as e:
+                    # Only this request's changes are undone
+                    savepoint.rollback()
+                    outcomes.append((op, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            for op in batch:
+                if not op.future.done():
+                    op.future.set_exception(e)
+            print(f"[ERROR] Group commit of {len(batch)} writes failed: {e}")
+            return
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.ops += len(outcomes)
+        for op, result, error in outcomes:
+            if error is not None:
+                op.future.set_exception(error)
+            else:
+                op.future.set_result(result)
+
+# One writer per ticket shard (just the main database without sharding), only when enabled
+writer_engines = {shard.index: _make_engine(shard.url) for shard in sharding.shards} if ENABLED else {}
+writers: Dict[int, GroupCommitWriter] = {
+    index: GroupCommitWriter(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False))
+    for index, engine in writer_engines.items()
+}
+
+def writer_for(shard) -> Optional[GroupCommitWriter]:
+    """Group-commit writer for a shard, or None when group commit is off"""
+    return writers.get(shard.index)
+
+# ========== BENCHMARK ==========
+
+def benchmark(writes: int = 2000, threads: int = 32, commit_delay_ms: float = 0.0) -> None:
+    """
+    Ticket inserts per second, one commit per write vs group commit
+
+    commit_delay_ms adds that much time to every commit (while the write lock
+    is held), standing in for the fsync latency of a real disk.
+    """
+    import database
+    import main
+    import migrations
+    import schemas
+
+    ticket = schemas.TicketCreate(title="Benchmark ticket", description="Cannot log in after password reset. " * 8)
+    for mode in ("direct", "group"):
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='group-commit-'), 'bench.db')}"
+        engine = database.make_engine(url)
+        migrations.upgrade(engine)
+        writer_engine = _make_engine(url)
+        for target in (engine, writer_engine):
+            if commit_delay_ms:
+                event.listen(target, "commit", lambda conn: time.sleep(commit_delay_ms / 1000.0))
+        direct = sessionmaker(bind=engine, autoflush=False)
+        writer = GroupCommitWriter(sessionmaker(bind=writer_engine, autoflush=False, expire_on_commit=False))
+
+        def write(_):
+            if mode == "group":
+                return writer.run(lambda session: main.apply_ticket_create(session, ticket, 1))
+            with direct() as session:
+                result = main.apply_ticket_create(session, ticket, 1)
+                session.commit()
+                return result
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(write, range(writes)))
+        elapsed = time.perf_counter() - started
+        writer.stop()
+        batches = f"   {writer.ops / max(1, writer.batches):.1f} writes per commit" if mode == "group" else ""
+        print(f"   {mode:7s} {writes / elapsed:8.0f} writes/s{batches}")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "benchmark":
+        args = sys.argv[2:]
+        benchmark(int(args[0]) if len(args) > 0 else 2000, int(args[1]) if len(args) > 1 else 32,
+                  float(args[2]) if len(args) > 2 else 0.0)
+    else:
+        print("Usage: python group_commit.py benchmark [writes] [threads] [commit_delay_ms]")
+        sys.exit(1)
@@ -6,8 +6,11 @@ Production-ready authentication system with login and protected routes
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Load, Session, undefer_group
+from sqlalchemy import case, func, text, update
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import List, Optional
 from pydantic import BaseModel, validator, Field
@@ -21,23 +24,33 @@ import models
 import database
 import auth
 import schemas
+import metrics
+import profiling
+import migrations
+import archive
+import availability
+import group_commit
+import sessions
+import admission
+import sharding
+import claims
+import routing
+import redaction
+import attachments
+import notifications
 
 # Load environment variables
 load_dotenv()
 
-# Create tables
-try:
-    models.Base.metadata.create_all(bind=database.engine)
-    print("[OK] Tables created successfully")
-except Exception as e:
-    print(f"[ERROR] Error creating tables: {e}")
-
 app = FastAPI(
     title="AutoResolve AI",
     description="Production-ready authentication system with complete user management",
     version="1.0.0"
 )
 
+# Sync endpoints are wrapped so the runtime profiler can sample them
+app.router.route_class = profiling.ProfiledRoute
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -47,9 +60,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Instrumentation (latency histograms, per-request query counts)
+metrics.instrument_engine(database.engine)
+if database.read_engine is not database.engine:
+    metrics.instrument_engine(database.read_engine)
+if sharding.ENABLED:
+    for shard in sharding.shards:
+        metrics.instrument_engine(shard.engine)
+        if shard.read_engine is not shard.engine:
+            metrics.instrument_engine(shard.read_engine)
+for writer_engine in group_commit.writer_engines.values():
+    metrics.instrument_engine(writer_engine)
+
+# Priority admission control runs inside the metrics middleware so queueing and
+# shed requests (503) show up in the latency histograms
+if admission.ENABLED:
+    app.middleware("http")(admission.admission_middleware)
+app.middleware("http")(database.read_your_writes_middleware)
+app.middleware("http")(metrics.metrics_middleware)
+
+# ========== DATABASE SESSIONS ==========
+
+def get_read_db(current_user = Depends(auth.get_current_principal)):
+    """Read-only session for GET handlers (primary briefly after the caller's own write)"""
+    db = database.session_for_read(current_user.id if current_user else None)
+    try:
+        yield db
+    finally:
+        db.close()
+
 # ========== STARTUP EVENT ==========
 @app.on_event("startup")
 async def startup_event():
+    # Schema changes are applied out-of-band (python migrations.py upgrade);
+    # workers only read the version row here
+    migrations.check()
+    
     print("\n" + "="*60)
     print("🚀 AUTORESOLVE AI - PHASE 4 COMPLETE")
     print("="*60)
@@ -62,11 +108,26 @@ async def startup_event():
     print("Ticket Endpoints:")
     print("   POST   /tickets")
     print("   GET    /tickets")
+    print("   POST   /tickets/claim")
     print("   GET    /tickets/{ticket_id}")
     print("   PUT    /tickets/{ticket_id}")
     print("   DELETE /tickets/{ticket_id}")
+    print("   GET    /tickets/{ticket_id}/messages")
+    print("   POST   /tickets/{ticket_id}/messages")
+    print("   POST   /tickets/{ticket_id}/attachments")
+    print("   GET    /tickets/{ticket_id}/attachments")
+    print("   GET    /tickets/{ticket_id}/attachments/{attachment_id}")
     print("="*60 + "\n")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    # Flush writes still waiting for a group commit
+    for writer in group_commit.writers.values():
+        writer.stop()
+    # Send notifications still waiting out their coalescing window
+    if notifications.dispatcher is not None:
+        notifications.dispatcher.stop()
+
 # ========== REQUEST/RESPONSE SCHEMAS ==========
 
 class UserCreate(BaseModel):
@@ -157,6 +218,7 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     expires_in: int
+    refresh_token: Optional[str] = None
 
 class LoginRequest(BaseModel):
     username: str
@@ -181,21 +243,47 @@ def root():
             "GET /": "This information",
             "GET /test": "Health check",
             "GET /health": "Detailed health check",
+            "GET /metrics": "Prometheus metrics",
             "POST /register": "Create new account",
+            "GET /register/available": "Check username/email availability",
             "POST /login": "Login and get JWT token",
+            "POST /token/refresh": "Exchange a refresh token for a new JWT token",
+            "POST /token/revoke": "Revoke a refresh token (logout)",
             "GET /users/me": "Get current user (protected)",
             "PUT /users/me": "Update current user (protected)",
             "POST /tickets": "Create new ticket (protected)",
             "GET /tickets": "List tickets (protected, role-based)",
+            "POST /tickets/claim": "Claim the next ticket from the work queue (agent/admin)",
             "GET /tickets/{ticket_id}": "Get ticket details (protected)",
             "PUT /tickets/{ticket_id}": "Update ticket (protected)",
             "DELETE /tickets/{ticket_id}": "Delete ticket - admin only",
+            "GET /tickets/{ticket_id}/messages": "Conversation, oldest first (keyset paginated: after, limit) (protected)",
+            "POST /tickets/{ticket_id}/messages": "Reply on a ticket (protected)",
+            "POST /tickets/{ticket_id}/attachments": "Upload attachments (multipart, streamed) (protected)",
+            "GET /tickets/{ticket_id}/attachments": "List a ticket's attachments (protected)",
+            "GET /tickets/{ticket_id}/attachments/{attachment_id}": "Download an attachment, Range supported (protected)",
+            "PUT /admin/users/{user_id}/role": "Change a user's role - admin only",
+            "GET /admin/tickets/{ticket_id}/original": "Ticket text before PII redaction - admin only",
+            "GET /admin/tickets/{ticket_id}/messages/{message_id}/original": "Message body before PII redaction - admin only",
+            "GET /admin/routing/rules": "List keyword routing rules - admin only",
+            "POST /admin/routing/rules": "Add a keyword routing rule - admin only",
+            "PUT /admin/routing/rules/{rule_id}": "Update a keyword routing rule - admin only",
+            "DELETE /admin/routing/rules/{rule_id}": "Delete a keyword routing rule - admin only",
+            "POST /admin/routing/reroute": "Re-route open tickets with the current rules - admin only",
+            "GET /admin/profiling": "Profiler status - admin only",
+            "POST /admin/profiling": "Enable/disable request profiling - admin only",
+            "GET /admin/profiling/stacks": "Collapsed stacks for flamegraphs - admin only",
+            "GET /analytics": "Analytics snapshot summary (agent/admin)",
+            "GET /analytics/volume": "Tickets created per hour (agent/admin)",
+            "GET /analytics/resolution": "Time-to-resolve percentiles (agent/admin)",
+            "GET /analytics/agents": "Resolved tickets per agent (agent/admin)",
+            "POST /admin/analytics/refresh": "Refresh the analytics snapshot - admin only",
             "GET /docs": "API documentation"
         }
     }
 
 @app.get("/test")
-def test(db: Session = Depends(database.get_db)):
+def test(db: Session = Depends(database.get_read_db)):
     """Simple health check endpoint"""
     try:
         db.execute(text("SELECT 1")).first()
@@ -212,7 +300,7 @@ def test(db: Session = Depends(database.get_db)):
         }
 
 @app.get("/health")
-def health_check(db: Session = Depends(database.get_db)):
+def health_check(db: Session = Depends(database.get_read_db)):
     """Detailed health check endpoint"""
     try:
         db.execute(text("SELECT 1")).first()
@@ -234,6 +322,11 @@ def health_check(db: Session = Depends(database.get_db)):
         "version": "1.0.0"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus-format metrics (request latency, DB queries, bcrypt time)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ========== REGISTRATION ENDPOINT ==========
 
 @app.post("/register", response_model=UserResponse, status_code=201)
@@ -247,20 +340,13 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
     - Password: 8-72 chars, uppercase, lowercase, number
     """
     try:
-        # Check if email exists (case-insensitive)
-        existing_email = db.query(models.User).filter(
-            func.lower(models.User.email) == user.email.lower()
-        ).first()
+        # Emails are stored normalized, so one indexed query covers both checks
+        existing = availability.find_existing(db, user.username, user.email)
         
-        if existing_email:
+        if any(row.email == user.email for row in existing):
             raise HTTPException(400, "Email already registered")
         
-        # Check if username exists
-        existing_username = db.query(models.User).filter(
-            models.User.username == user.username
-        ).first()
-        
-        if existing_username:
+        if any(row.username == user.username for row in existing):
             raise HTTPException(400, "Username already taken")
         
         # Create user with hashed password
@@ -278,6 +364,7 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+        availability.record_registration(db_user.username, db_user.email)
         
         # Convert datetime to string for response
         response_data = {
@@ -296,8 +383,37 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
         raise
     except Exception as e:
         print(f"Registration error: {e}")
+        metrics.inc("handler_errors_total", (("handler", "register"),))
         raise HTTPException(500, f"Internal server error")
 
+@app.get("/register/available", response_model=dict)
+def check_availability(
+    username: Optional[str] = None,
+    email: Optional[str] = None,
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Check whether a username and/or email can still be registered
+    
+    Unseen values are answered from an in-memory Bloom filter without a
+    database query; possible matches are confirmed with one indexed lookup.
+    """
+    if username is None and email is None:
+        raise HTTPException(status_code=400, detail="Provide username and/or email")
+    
+    if email is not None:
+        email = auth.normalize_email(email)
+    taken = availability.find_taken(db, username=username, email=email)
+    
+    response = {}
+    if username is not None:
+        response["username"] = username
+        response["username_available"] = not taken["username"]
+    if email is not None:
+        response["email"] = email
+        response["email_available"] = not taken["email"]
+    return response
+
 # ========== LOGIN ENDPOINT ==========
 
 @app.post("/login", response_model=Token)
@@ -309,6 +425,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     - access_token: JWT token for authentication
     - token_type: Bearer
     - expires_in: Token expiration in seconds
+    - refresh_token: Single-use token for POST /token/refresh
     """
     # Authenticate user
     user = auth.authenticate_user(db, form_data.username, form_data.password)
@@ -320,19 +437,52 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token
+    refresh_token = sessions.issue(db, user)
+    db.commit()
+    return token_response(user, refresh_token)
+
+def token_response(user, refresh_token: str) -> dict:
+    """Access token for a user plus the refresh token that goes with it"""
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.username, "role": user.role, "user_id": user.id},
+        data={"sub": user.username, "role": user.role, "user_id": user.id, "ver": user.token_version or 0},
         expires_delta=access_token_expires
     )
     
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token
     }
 
+@app.post("/token/refresh", response_model=Token)
+def refresh_access_token(request: schemas.RefreshRequest, db: Session = Depends(database.get_db)):
+    """
+    Exchange a refresh token for a new access token (no password, no bcrypt)
+    
+    The refresh token is single use: the response carries its replacement.
+    """
+    try:
+        user, refresh_token = sessions.rotate(db, request.refresh_token)
+    except sessions.RefreshError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Build the response before commit expires the user
+    response = token_response(user, refresh_token)
+    db.commit()
+    return response
+
+@app.post("/token/revoke")
+def revoke_refresh_token(request: schemas.RefreshRequest, db: Session = Depends(database.get_db)):
+    """Revoke a refresh token (logout); unknown tokens are ignored"""
+    sessions.revoke(db, request.refresh_token)
+    db.commit()
+    return {"success": True}
+
 # ========== PROTECTED ENDPOINTS (Require Login) ==========
 
 @app.get("/users/me", response_model=UserResponse)
@@ -362,15 +512,18 @@ def update_user_me(
         raise HTTPException(401, "Not authenticated")
     
     # Update email if provided
+    email_changed = False
     if user_update.email:
+        email = auth.normalize_email(user_update.email)
         # Check if email already taken
-        existing = db.query(models.User).filter(
-            func.lower(models.User.email) == user_update.email.lower(),
+        existing = db.query(models.User.id).filter(
+            models.User.email == email,
             models.User.id != current_user.id
         ).first()
         if existing:
             raise HTTPException(400, "Email already registered")
-        current_user.email = user_update.email
+        email_changed = email != current_user.email
+        current_user.email = email
     
     # Update full name if provided
     if user_update.full_name:
@@ -381,9 +534,13 @@ def update_user_me(
         if len(user_update.password) < 8:
             raise HTTPException(400, "Password must be at least 8 characters")
         current_user.hashed_password = auth.get_password_hash(user_update.password)
+        # Tokens issued with the old password must stop working
+        auth.revoke_tokens(current_user)
     
     db.commit()
     db.refresh(current_user)
+    if email_changed:
+        availability.record_registration(current_user.username, current_user.email)
     
     return {
         "id": current_user.id,
@@ -398,12 +555,16 @@ def update_user_me(
 # ========== TICKET ENDPOINTS (PHASE 4) ==========
 
 # Helper function to convert Ticket object to response dict
-def ticket_to_response(ticket: models.Ticket) -> dict:
+def ticket_to_response(ticket: models.Ticket, include_text: bool = True) -> dict:
     """Convert SQLAlchemy Ticket object to response dictionary"""
-    return {
+    # Large text columns are deferred; only touch them when the caller wants them
+    response = {
         "id": ticket.id,
         "title": ticket.title,
-        "description": ticket.description,
+    }
+    if include_text:
+        response["description"] = ticket.description
+    response.update({
         "status": ticket.status,
         "priority": ticket.priority,
         "user_id": ticket.user_id,
@@ -411,12 +572,213 @@ def ticket_to_response(ticket: models.Ticket) -> dict:
         "ai_category": ticket.ai_category,
         "ai_confidence": ticket.ai_confidence,
         "sentiment_score": ticket.sentiment_score,
-        "ai_suggested_response": ticket.ai_suggested_response,
+    })
+    if include_text:
+        response["ai_suggested_response"] = ticket.ai_suggested_response
+    response.update({
         "resolved_by_ai": ticket.resolved_by_ai,
+        "message_count": ticket.message_count,
+        "last_message_at": ticket.last_message_at.isoformat() if ticket.last_message_at else None,
         "created_at": ticket.created_at.isoformat() if ticket.created_at else None,
         "updated_at": ticket.updated_at.isoformat() if ticket.updated_at else None
+    })
+    return response
+
+def message_to_response(message: models.TicketMessage) -> dict:
+    return {
+        "id": message.id,
+        "ticket_id": message.ticket_id,
+        "author_id": message.author_id,
+        "body": message.body,
+        "created_at": message.created_at.isoformat() if message.created_at else None
     }
 
+def reload_ticket(db: Session, ticket_id: int) -> models.Ticket:
+    """Re-read a ticket after commit, deferred text included, in a single query"""
+    return db.query(models.Ticket).options(undefer_group("text")).populate_existing().filter(
+        models.Ticket.id == ticket_id
+    ).one()
+
+# ========== TICKET WRITES ==========
+# Write helpers stop short of committing so they can run either in the request's
+# own transaction or batched by the group-commit writer (GROUP_COMMIT=1).
+
+@contextmanager
+def ticket_session(shard, db: Session, read_user_id: Optional[int] = None, read: bool = False):
+    """
+    Session on a ticket shard
+    
+    Without sharding this is the request's own session: a second pooled
+    connection per request could starve the pool. With sharding it is a new
+    session on the shard (read-only for reads outside the read-your-writes window).
+    """
+    if not sharding.ENABLED:
+        yield db
+        return
+    session = shard.session_for_read(read_user_id) if read else shard.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def run_ticket_write(shard, db: Session, write):
+    """Run write(session) on the ticket's shard and commit; returns its response dict"""
+    writer = group_commit.writer_for(shard)
+    if writer is not None:
+        try:
+            return writer.run(write)
+        except group_commit.WriteNotApplied:
+            # Safe to retry: the write was withdrawn before it ran
+            raise HTTPException(status_code=503, detail="Server is busy, the change was not applied; please retry",
+                                headers={"Retry-After": "1"})
+    with ticket_session(shard, db) as session:
+        result = write(session)
+        session.commit()
+        return result
+
+def validate_assignee(db: Session, assigned_to: Optional[int]) -> None:
+    """Tickets can only be assigned to existing agents/admins (0 = unassign)"""
+    if assigned_to is None or assigned_to == 0:
+        return
+    assigned_user = db.query(models.User).filter(models.User.id == assigned_to).first()
+    if not assigned_user:
+        raise HTTPException(status_code=400, detail="Assigned user not found")
+    if assigned_user.role not in ["agent", "admin"]:
+        raise HTTPException(status_code=400, detail="Can only assign to agents or admins")
+
+def apply_ticket_create(db: Session, ticket: schemas.TicketCreate, user_id: int,
+                        ticket_id: Optional[int] = None, route: Optional[routing.Route] = None,
+                        pii_original: Optional[bytes] = None) -> dict:
+    """Insert a ticket owned by user_id (no commit); ticket_id is set when sharded"""
+    db_ticket = models.Ticket(
+        id=ticket_id,
+        title=ticket.title,
+        description=ticket.description,
+        priority=routing.escalate(ticket.priority, route.priority) if route else ticket.priority,
+        ai_category=route.category if route else None,
+        status="open",
+        user_id=user_id,
+        pii_original=pii_original
+    )
+    
+    db.add(db_ticket)
+    db.flush()
+    return ticket_to_response(reload_ticket(db, db_ticket.id))
+
+def apply_ticket_update(db: Session, ticket_id: int, ticket_update: schemas.TicketUpdate,
+                        user_id: int, role: str, pii_originals: Optional[dict] = None,
+                        changes: Optional[list] = None) -> dict:
+    """
+    Apply an update on behalf of user_id/role with permission checks (no commit)
+    
+    pii_originals comes from redaction.redact_fields for the (already redacted)
+    title/description in ticket_update. Status/assignee changes are appended
+    to changes as (field, old, new) for notifications.
+    """
+    query = db.query(models.Ticket)
+    if pii_originals:
+        query = query.options(undefer_group("pii"))
+    ticket = query.filter(models.Ticket.id == ticket_id).first()
+    
+    if not ticket:
+        if archive.get_archived_ticket(db, ticket_id):
+            raise HTTPException(status_code=409, detail="Ticket is archived and can no longer be updated")
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    # Check permissions
+    is_creator = ticket.user_id == user_id
+    is_agent_or_admin = role in ["agent", "admin"]
+    
+    if role == "customer" and not is_creator:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    old_status, old_assignee = ticket.status, ticket.assigned_to
+    
+    # Customers can only update title and description
+    if role == "customer":
+        if ticket_update.title:
+            ticket.title = ticket_update.title
+        if ticket_update.description:
+            ticket.description = ticket_update.description
+    
+    # Agents and admins can update status, priority, and assignment
+    if is_agent_or_admin:
+        if ticket_update.title:
+            ticket.title = ticket_update.title
+        if ticket_update.description:
+            ticket.description = ticket_update.description
+        if ticket_update.status:
+            ticket.status = ticket_update.status
+        if ticket_update.priority:
+            ticket.priority = ticket_update.priority
+            ticket.priority_rank = models.priority_rank(ticket_update.priority)
+        
+        # Handle assignment to another agent/admin (validated by the caller: users
+        # live in the main database, which may not be this ticket's shard)
+        if ticket_update.assigned_to is not None:
+            ticket.assigned_to = ticket_update.assigned_to if ticket_update.assigned_to != 0 else None
+        
+        # Working a claimed ticket (or reassigning it) turns the claim lease into a plain assignment
+        if ticket_update.status or ticket_update.assigned_to is not None:
+            ticket.claim_expires_at = None
+        
+        # Update AI-related fields
+        if ticket_update.ai_category is not None:
+            ticket.ai_category = ticket_update.ai_category
+        if ticket_update.ai_confidence is not None:
+            ticket.ai_confidence = ticket_update.ai_confidence
+        if ticket_update.sentiment_score is not None:
+            ticket.sentiment_score = ticket_update.sentiment_score
+        if ticket_update.ai_suggested_response is not None:
+            ticket.ai_suggested_response = ticket_update.ai_suggested_response
+        if ticket_update.resolved_by_ai is not None:
+            ticket.resolved_by_ai = ticket_update.resolved_by_ai
+    
+    if pii_originals:
+        ticket.pii_original = redaction.merge_originals(ticket.pii_original, pii_originals)
+    
+    if changes is not None:
+        if ticket.status != old_status:
+            changes.append(("status", old_status, ticket.status))
+        if ticket.assigned_to != old_assignee:
+            changes.append(("assigned_to", old_assignee, ticket.assigned_to))
+    
+    db.flush()
+    return ticket_to_response(reload_ticket(db, ticket_id))
+
+def apply_message_create(db: Session, ticket_id: int, body: str, user_id: int, role: str,
+                         pii_original: Optional[bytes] = None) -> dict:
+    """Add a message and update the ticket's conversation summary (no commit)"""
+    ticket = db.query(models.Ticket.user_id).filter(models.Ticket.id == ticket_id).first()
+    
+    if not ticket:
+        if archive.get_archived_ticket(db, ticket_id):
+            raise HTTPException(status_code=409, detail="Ticket is archived and can no longer be updated")
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    if role == "customer" and ticket.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    message = models.TicketMessage(ticket_id=ticket_id, author_id=user_id, body=body, pii_original=pii_original)
+    db.add(message)
+    db.flush()
+    
+    # Same transaction as the insert. The count is incremented by the database and
+    # the latest message only moves forward, so concurrent replies can't undo each other.
+    # updated_at is pinned (it would otherwise fire its onupdate): it tracks ticket
+    # changes, which analytics' time-to-resolve and the archive cutoff are based on
+    tickets = models.Ticket.__table__
+    is_latest = (tickets.c.last_message_id.is_(None)) | (tickets.c.last_message_id < message.id)
+    db.execute(
+        update(tickets).where(tickets.c.id == ticket_id).values(
+            updated_at=tickets.c.updated_at,
+            message_count=tickets.c.message_count + 1,
+            last_message_id=case((is_latest, message.id), else_=tickets.c.last_message_id),
+            last_message_at=case((is_latest, message.created_at), else_=tickets.c.last_message_at),
+        )
+    )
+    return message_to_response(message)
+
 @app.post("/tickets", response_model=dict, status_code=201)
 def create_ticket(
     ticket: schemas.TicketCreate,
@@ -433,20 +795,19 @@ def create_ticket(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Create new ticket with current user as creator
-    db_ticket = models.Ticket(
-        title=ticket.title,
-        description=ticket.description,
-        priority=ticket.priority,
-        status="open",
-        user_id=current_user.id
+    user_id = current_user.id
+    # Card numbers, emails and phone numbers never reach storage; the originals are kept encrypted
+    redacted, originals = redaction.redact_fields({"title": ticket.title, "description": ticket.description})
+    ticket = ticket.copy(update=redacted)
+    pii_original = redaction.merge_originals(None, originals)
+    # Keyword rules set the category and can raise the priority
+    route = routing.route_ticket(db, ticket.title, ticket.description)
+    shard = sharding.shard_for_user(user_id)
+    ticket_id = sharding.next_ticket_id(shard)
+    database.note_write(user_id)
+    return run_ticket_write(
+        shard, db, lambda session: apply_ticket_create(session, ticket, user_id, ticket_id, route, pii_original)
     )
-    
-    db.add(db_ticket)
-    db.commit()
-    db.refresh(db_ticket)
-    
-    return ticket_to_response(db_ticket)
 
 @app.get("/tickets", response_model=dict)
 def list_tickets(
@@ -454,8 +815,9 @@ def list_tickets(
     limit: int = 100,
     status: Optional[str] = None,
     priority: Optional[str] = None,
-    db: Session = Depends(database.get_db),
-    current_user = Depends(auth.get_current_active_user)
+    include_text: bool = True,
+    db: Session = Depends(get_read_db),
+    current_user = Depends(auth.get_current_principal)
 ):
     """
     List all tickets with optional filtering
@@ -463,49 +825,117 @@ def list_tickets(
     - **Customers**: See only their own tickets
     - **Agents/Admins**: See all tickets
     - **Filters**: status (open, in_progress, resolved, closed), priority (low, medium, high, urgent)
+    - **include_text**: set false to omit description/ai_suggested_response (faster list views)
+    - Each ticket includes its **latest_message** (None before the first reply)
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    query = db.query(models.Ticket)
-    
     # Role-based access control
-    if current_user.role == "customer":
-        # Customers can only see their own tickets
-        query = query.filter(models.Ticket.user_id == current_user.id)
-    elif current_user.role not in ["agent", "admin"]:
+    if current_user.role not in ["customer", "agent", "admin"]:
         # Unknown role
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Apply optional filters
-    if status:
-        if status not in ['open', 'in_progress', 'resolved', 'closed']:
-            raise HTTPException(status_code=400, detail="Invalid status filter")
-        query = query.filter(models.Ticket.status == status)
-    
-    if priority:
-        if priority not in ['low', 'medium', 'high', 'urgent']:
-            raise HTTPException(status_code=400, detail="Invalid priority filter")
-        query = query.filter(models.Ticket.priority == priority)
+    # Validate optional filters
+    if status and status not in ['open', 'in_progress', 'resolved', 'closed']:
+        raise HTTPException(status_code=400, detail="Invalid status filter")
+    if priority and priority not in ['low', 'medium', 'high', 'urgent']:
+        raise HTTPException(status_code=400, detail="Invalid priority filter")
     
-    # Get total count before pagination
-    total = query.count()
+    def fetch(session: Session, merged: bool):
+        query = session.query(models.Ticket)
+        if current_user.role == "customer":
+            # Customers can only see their own tickets
+            query = query.filter(models.Ticket.user_id == current_user.id)
+        if status:
+            query = query.filter(models.Ticket.status == status)
+        if priority:
+            query = query.filter(models.Ticket.priority == priority)
+        
+        # Get total count before pagination
+        total = query.count()
+        
+        # Each ticket's latest message comes with it in the same query (joined
+        # on last_message_id) instead of one query per ticket
+        query = query.outerjoin(
+            models.TicketMessage, models.TicketMessage.id == models.Ticket.last_message_id
+        ).add_entity(models.TicketMessage)
+        
+        # Apply pagination
+        if include_text:
+            query = query.options(Load(models.Ticket).undefer_group("text"))
+        if merged:
+            # Each shard returns its first skip+limit by id; the merge paginates
+            rows = query.order_by(models.Ticket.id).limit(skip + limit).all()
+        else:
+            rows = query.offset(skip).limit(limit).all()
+        tickets = []
+        for ticket, latest in rows:
+            response = ticket_to_response(ticket, include_text)
+            response["latest_message"] = message_to_response(latest) if latest else None
+            tickets.append(response)
+        return total, tickets
     
-    # Apply pagination
-    tickets = query.offset(skip).limit(limit).all()
+    if current_user.role == "customer" or not sharding.ENABLED:
+        # A customer's tickets all live in one shard
+        with ticket_session(sharding.shard_for_user(current_user.id), db, current_user.id, read=True) as session:
+            total, tickets = fetch(session, merged=False)
+    else:
+        def fetch_shard(shard):
+            with shard.session_for_read(current_user.id) as session:
+                return fetch(session, merged=True)
+        results = sharding.fan_out(fetch_shard)
+        total = sum(count for count, _ in results)
+        tickets = sharding.merge_sorted([rows for _, rows in results], key=lambda t: t["id"],
+                                        skip=skip, limit=limit)
     
     return {
         "total": total,
         "skip": skip,
         "limit": limit,
-        "tickets": [ticket_to_response(t) for t in tickets]
+        "tickets": tickets
     }
 
+@app.post("/tickets/claim", response_model=dict)
+def claim_ticket(
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Claim the next ticket from the work queue (agent/admin)
+    
+    - Assigns the most urgent, oldest open and unassigned ticket to the caller
+    - The claim expires after CLAIM_LEASE_MINUTES unless the ticket is moved out
+      of "open" (e.g. to in_progress); expired claims go back to the queue
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if current_user.role not in ["agent", "admin"]:
+        raise HTTPException(status_code=403, detail="Agent or admin access required")
+    
+    agent_id = current_user.id
+    database.note_write(agent_id)
+    for shard in claims.shards_in_claim_order():
+        def claim(session, shard_index=shard.index):
+            ticket_id = claims.claim_next(session, agent_id, shard_index)
+            if ticket_id is None:
+                return None
+            ticket = reload_ticket(session, ticket_id)
+            response = ticket_to_response(ticket)
+            response["claim_expires_at"] = ticket.claim_expires_at.isoformat()
+            return response
+        claimed = run_ticket_write(shard, db, claim)
+        if claimed is not None:
+            return claimed
+    
+    raise HTTPException(status_code=404, detail="No open tickets to claim")
+
 @app.get("/tickets/{ticket_id}", response_model=dict)
 def get_ticket(
     ticket_id: int,
-    db: Session = Depends(database.get_db),
-    current_user = Depends(auth.get_current_active_user)
+    db: Session = Depends(get_read_db),
+    current_user = Depends(auth.get_current_principal)
 ):
     """
     Get a specific ticket by ID
@@ -516,7 +946,19 @@ def get_ticket(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    ticket, archived = None, False
+    for shard in sharding.shards_for_ticket(ticket_id):
+        with ticket_session(shard, db, current_user.id, read=True) as session:
+            ticket = session.query(models.Ticket).options(undefer_group("text")).filter(
+                models.Ticket.id == ticket_id
+            ).first()
+            
+            if not ticket:
+                # Closed tickets may have been moved to the archive
+                ticket = archive.get_archived_ticket(session, ticket_id)
+                archived = ticket is not None
+        if ticket:
+            break
     
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
@@ -525,7 +967,10 @@ def get_ticket(
     if current_user.role == "customer" and ticket.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return ticket_to_response(ticket)
+    response = ticket_to_response(ticket)
+    if archived:
+        response["archived"] = True
+    return response
 
 @app.put("/tickets/{ticket_id}", response_model=dict)
 def update_ticket(
@@ -539,97 +984,684 @@ def update_ticket(
     
     - **Agents/Admins**: Can update status, priority, assigned_to, and AI fields
     - **Customers**: Can update title and description only
+    - Status changes notify the ticket's owner and assignee; reassignments notify
+      the previous and new assignee (email/webhook, coalesced per ticket)
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user_id, role = current_user.id, current_user.role
+    if role in ["agent", "admin"]:
+        validate_assignee(db, ticket_update.assigned_to)
+    redacted, pii_originals = redaction.redact_fields({
+        field: getattr(ticket_update, field) for field in redaction.REDACTED_FIELDS if getattr(ticket_update, field)
+    })
+    ticket_update = ticket_update.copy(update=redacted)
+    shard = sharding.locate_ticket(ticket_id)
+    database.note_write(user_id)
+    changes = []
+    response = run_ticket_write(
+        shard, db,
+        lambda session: apply_ticket_update(session, ticket_id, ticket_update, user_id, role, pii_originals, changes)
+    )
+    # Committed: queue notifications (coalesced and sent in the background)
+    notifications.ticket_changed(response, changes, user_id)
+    return response
+
+@app.delete("/tickets/{ticket_id}", status_code=204)
+def delete_ticket(
+    ticket_id: int,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Delete a ticket (admin only)
+    
+    - Only platform admins can delete tickets
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can delete tickets")
+    
+    with ticket_session(sharding.locate_ticket(ticket_id), db) as session:
+        ticket = session.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+        
+        if not ticket:
+            ticket = archive.get_archived_ticket(session, ticket_id)
+        
+        if not ticket:
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        
+        session.delete(ticket)
+        # Stored files no ticket uses any more are removed by `python attachments.py gc`
+        session.query(models.TicketAttachment).filter(
+            models.TicketAttachment.ticket_id == ticket_id
+        ).delete(synchronize_session=False)
+        session.query(models.TicketMessage).filter(
+            models.TicketMessage.ticket_id == ticket_id
+        ).delete(synchronize_session=False)
+        database.note_write(current_user.id)  # before commit, which expires current_user
+        session.commit()
+    
+    return None
+
+# ========== TICKET CONVERSATIONS ==========
+
+MAX_MESSAGES_PAGE = 200
+
+def find_visible_ticket(db: Session, ticket_id: int, user_id: int, role: str, read: bool = False):
+    """(shard, archived) of a ticket the caller may see; 404/403 otherwise"""
+    for shard in sharding.shards_for_ticket(ticket_id):
+        with ticket_session(shard, db, user_id, read=read) as session:
+            ticket = session.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+            archived = False
+            if not ticket:
+                ticket = archive.get_archived_ticket(session, ticket_id)
+                archived = ticket is not None
+            owner_id = ticket.user_id if ticket else None
+        if ticket:
+            break
     
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    # Check permissions
-    is_creator = ticket.user_id == current_user.id
-    is_agent_or_admin = current_user.role in ["agent", "admin"]
-    
-    if current_user.role == "customer" and not is_creator:
+    if role == "customer" and owner_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Customers can only update title and description
-    if current_user.role == "customer":
-        if ticket_update.title:
-            ticket.title = ticket_update.title
-        if ticket_update.description:
-            ticket.description = ticket_update.description
+    return shard, archived
+
+@app.get("/tickets/{ticket_id}/messages", response_model=dict)
+def list_messages(
+    ticket_id: int,
+    after: Optional[int] = None,
+    limit: int = 50,
+    db: Session = Depends(get_read_db),
+    current_user = Depends(auth.get_current_principal)
+):
+    """
+    A ticket's conversation, oldest first (customers: own tickets only)
     
-    # Agents and admins can update status, priority, and assignment
-    if is_agent_or_admin:
-        if ticket_update.title:
-            ticket.title = ticket_update.title
-        if ticket_update.description:
-            ticket.description = ticket_update.description
-        if ticket_update.status:
-            ticket.status = ticket_update.status
-        if ticket_update.priority:
-            ticket.priority = ticket_update.priority
+    - **after**: message id to continue after; pass the previous page's **next_after**
+    - **limit**: messages per page (max 200)
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if limit < 1 or limit > MAX_MESSAGES_PAGE:
+        raise HTTPException(status_code=400, detail=f"Limit must be between 1 and {MAX_MESSAGES_PAGE}")
+    
+    shard, _ = find_visible_ticket(db, ticket_id, current_user.id, current_user.role, read=True)
+    with ticket_session(shard, db, current_user.id, read=True) as session:
+        # Keyset pagination: a range scan on (ticket_id, id), never OFFSET
+        query = session.query(models.TicketMessage).filter(models.TicketMessage.ticket_id == ticket_id)
+        if after is not None:
+            query = query.filter(models.TicketMessage.id > after)
+        messages = query.order_by(models.TicketMessage.id).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        return {
+            "ticket_id": ticket_id,
+            "messages": [message_to_response(message) for message in messages],
+            "next_after": messages[-1].id if has_more else None
+        }
+
+@app.post("/tickets/{ticket_id}/messages", response_model=dict, status_code=201)
+def post_message(
+    ticket_id: int,
+    message: schemas.MessageCreate,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Reply on a ticket (customers: own tickets only)
+    
+    - **body**: message text (max 5000 chars); PII is redacted like ticket text
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user_id, role = current_user.id, current_user.role
+    redacted, originals = redaction.redact_fields({"body": message.body})
+    body = redacted["body"]
+    pii_original = redaction.merge_originals(None, originals)
+    shard = sharding.locate_ticket(ticket_id)
+    database.note_write(user_id)
+    return run_ticket_write(
+        shard, db, lambda session: apply_message_create(session, ticket_id, body, user_id, role, pii_original)
+    )
+
+# ========== TICKET ATTACHMENTS ==========
+
+def attachment_to_response(attachment: models.TicketAttachment) -> dict:
+    return {
+        "id": attachment.id,
+        "ticket_id": attachment.ticket_id,
+        "filename": attachment.filename,
+        "content_type": attachment.content_type,
+        "size": attachment.size,
+        "sha256": attachment.sha256,
+        "uploaded_by": attachment.uploaded_by,
+        "created_at": attachment.created_at.isoformat() if attachment.created_at else None
+    }
+
+@app.post("/tickets/{ticket_id}/attachments", response_model=dict, status_code=201)
+async def upload_attachments(
+    ticket_id: int,
+    request: Request,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Attach files to a ticket (multipart/form-data, one or more file fields)
+    
+    - The body is streamed to disk while it is hashed; memory use does not grow with file size
+    - Files are stored once by content (SHA-256), however many tickets they are attached to
+    - **Customers**: own tickets only; max MAX_ATTACHMENT_BYTES per file
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    user_id, role = current_user.id, current_user.role
+    shard, archived = await run_in_threadpool(find_visible_ticket, db, ticket_id, user_id, role)
+    if archived:
+        raise HTTPException(status_code=409, detail="Ticket is archived and can no longer be updated")
+    # A slow client can take minutes to send the body: don't hold a pooled connection meanwhile
+    await run_in_threadpool(db.close)
+    
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > attachments.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {attachments.MAX_UPLOAD_BYTES} bytes")
+    
+    try:
+        upload = attachments.MultipartUpload(request.headers.get("content-type"))
+        try:
+            async for chunk in request.stream():
+                await run_in_threadpool(upload.feed, chunk)
+            stored = await run_in_threadpool(upload.finish)
+        finally:
+            upload.discard()
+    except attachments.AttachmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    def insert(session: Session):
+        # The ticket may have been archived or deleted while the body was arriving
+        if not session.query(models.Ticket.id).filter(models.Ticket.id == ticket_id).first():
+            raise HTTPException(status_code=409, detail="Ticket was archived or deleted during the upload")
+        rows = [
+            models.TicketAttachment(
+                ticket_id=ticket_id,
+                sha256=file.sha256,
+                size=file.size,
+                filename=file.filename,
+                content_type=file.content_type,
+                uploaded_by=user_id
+            )
+            for file in stored
+        ]
+        session.add_all(rows)
+        session.flush()
+        return [attachment_to_response(row) for row in rows]
+    
+    database.note_write(user_id)
+    created = run_ticket_write(shard, db, insert)
+    for response, file in zip(created, stored):
+        response["deduplicated"] = file.deduplicated
+    return {"ticket_id": ticket_id, "attachments": created}
+
+@app.get("/tickets/{ticket_id}/attachments", response_model=dict)
+def list_attachments(
+    ticket_id: int,
+    db: Session = Depends(get_read_db),
+    current_user = Depends(auth.get_current_principal)
+):
+    """List a ticket's attachments (customers: own tickets only)"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    shard, _ = find_visible_ticket(db, ticket_id, current_user.id, current_user.role, read=True)
+    with ticket_session(shard, db, current_user.id, read=True) as session:
+        rows = session.query(models.TicketAttachment).filter(
+            models.TicketAttachment.ticket_id == ticket_id
+        ).order_by(models.TicketAttachment.id).all()
+        return {"ticket_id": ticket_id, "attachments": [attachment_to_response(row) for row in rows]}
+
+@app.get("/tickets/{ticket_id}/attachments/{attachment_id}")
+def download_attachment(
+    ticket_id: int,
+    attachment_id: int,
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user = Depends(auth.get_current_principal)
+):
+    """
+    Download an attachment (customers: own tickets only)
+    
+    - Supports single byte ranges (`Range: bytes=start-end`) for resuming and seeking
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    shard, _ = find_visible_ticket(db, ticket_id, current_user.id, current_user.role, read=True)
+    with ticket_session(shard, db, current_user.id, read=True) as session:
+        attachment = session.query(models.TicketAttachment).filter(
+            models.TicketAttachment.id == attachment_id,
+            models.TicketAttachment.ticket_id == ticket_id
+        ).first()
+        if not attachment:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        session.expunge(attachment)
+    
+    if not os.path.exists(attachments.object_path(attachment.sha256)):
+        print(f"[ERROR] Attachment {attachment.id} content {attachment.sha256} is missing from storage")
+        raise HTTPException(status_code=404, detail="Attachment content not found")
+    try:
+        return attachments.download_response(attachment, request.headers.get("range"))
+    except attachments.AttachmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail,
+                            headers={"Content-Range": f"bytes */{attachment.size}"})
+
+# ========== ADMIN: USERS ==========
+
+@app.put("/admin/users/{user_id}/role", response_model=UserResponse)
+def update_user_role(
+    user_id: int,
+    role_update: schemas.RoleUpdate,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Change a user's role (admin only)
+    
+    Bumps the user's token version so tokens carrying the old role are rejected.
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if user.role != role_update.role:
+        user.role = role_update.role
+        auth.revoke_tokens(user)
+        db.commit()
+        db.refresh(user)
+    
+    return {
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "full_name": user.full_name,
+        "role": user.role,
+        "is_active": user.is_active,
+        "created_at": user.created_at.isoformat() if user.created_at else None
+    }
+
+# ========== ADMIN: UNREDACTED TICKETS ==========
+
+@app.get("/admin/tickets/{ticket_id}/original", response_model=dict)
+def get_ticket_original(
+    ticket_id: int,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Title and description as submitted, before PII redaction (admin only)
+    
+    - **redacted_fields**: fields whose stored text was redacted
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    with ticket_session(sharding.locate_ticket(ticket_id), db) as session:
+        ticket = session.query(models.Ticket).options(undefer_group("text"), undefer_group("pii")).filter(
+            models.Ticket.id == ticket_id
+        ).first()
+        if not ticket:
+            ticket = archive.get_archived_ticket(session, ticket_id)
+        if not ticket:
+            raise HTTPException(status_code=404, detail="Ticket not found")
         
-        # Handle assignment to another agent/admin
-        if ticket_update.assigned_to is not None:
-            if ticket_update.assigned_to != 0:  # 0 means unassign
-                assigned_user = db.query(models.User).filter(
-                    models.User.id == ticket_update.assigned_to
-                ).first()
-                if not assigned_user:
-                    raise HTTPException(status_code=400, detail="Assigned user not found")
-                if assigned_user.role not in ["agent", "admin"]:
-                    raise HTTPException(status_code=400, detail="Can only assign to agents or admins")
-            ticket.assigned_to = ticket_update.assigned_to if ticket_update.assigned_to != 0 else None
+        try:
+            originals = redaction.decrypt_originals(ticket.pii_original)
+        except redaction.InvalidToken:
+            raise HTTPException(status_code=500, detail="Original text cannot be decrypted with the configured keys")
         
-        # Update AI-related fields
-        if ticket_update.ai_category is not None:
-            ticket.ai_category = ticket_update.ai_category
-        if ticket_update.ai_confidence is not None:
-            ticket.ai_confidence = ticket_update.ai_confidence
-        if ticket_update.sentiment_score is not None:
-            ticket.sentiment_score = ticket_update.sentiment_score
-        if ticket_update.ai_suggested_response is not None:
-            ticket.ai_suggested_response = ticket_update.ai_suggested_response
-        if ticket_update.resolved_by_ai is not None:
-            ticket.resolved_by_ai = ticket_update.resolved_by_ai
+        return {
+            "id": ticket.id,
+            "redacted_fields": sorted(originals),
+            "title": originals.get("title", ticket.title),
+            "description": originals.get("description", ticket.description)
+        }
+
+@app.get("/admin/tickets/{ticket_id}/messages/{message_id}/original", response_model=dict)
+def get_message_original(
+    ticket_id: int,
+    message_id: int,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Message body as submitted, before PII redaction (admin only)
     
-    db.commit()
-    db.refresh(ticket)
+    - **redacted**: whether the stored body was redacted
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    with ticket_session(sharding.locate_ticket(ticket_id), db) as session:
+        message = session.query(models.TicketMessage).options(undefer_group("pii")).filter(
+            models.TicketMessage.ticket_id == ticket_id,
+            models.TicketMessage.id == message_id
+        ).first()
+        if not message:
+            raise HTTPException(status_code=404, detail="Message not found")
+        
+        try:
+            originals = redaction.decrypt_originals(message.pii_original)
+        except redaction.InvalidToken:
+            raise HTTPException(status_code=500, detail="Original text cannot be decrypted with the configured keys")
+        
+        return {
+            "id": message.id,
+            "ticket_id": message.ticket_id,
+            "redacted": "body" in originals,
+            "body": originals.get("body", message.body)
+        }
+
+# ========== ADMIN: ROUTING RULES ==========
+
+def rule_to_response(rule: models.RoutingRule) -> dict:
+    return {
+        "id": rule.id,
+        "keyword": rule.keyword,
+        "category": rule.category,
+        "priority": rule.priority,
+        "is_active": rule.is_active,
+        "created_at": rule.created_at.isoformat() if rule.created_at else None,
+        "updated_at": rule.updated_at.isoformat() if rule.updated_at else None
+    }
+
+@app.get("/admin/routing/rules", response_model=dict)
+def list_routing_rules(
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """List keyword routing rules (admin only)"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    return ticket_to_response(ticket)
+    rules = db.query(models.RoutingRule).order_by(models.RoutingRule.id).all()
+    return {"total": len(rules), "rules": [rule_to_response(rule) for rule in rules]}
 
-@app.delete("/tickets/{ticket_id}", status_code=204)
-def delete_ticket(
-    ticket_id: int,
+@app.post("/admin/routing/rules", response_model=dict, status_code=201)
+def create_routing_rule(
+    rule: schemas.RoutingRuleCreate,
     db: Session = Depends(database.get_db),
     current_user = Depends(auth.get_current_active_user)
 ):
     """
-    Delete a ticket (admin only)
+    Add a keyword routing rule (admin only)
     
-    - Only platform admins can delete tickets
+    - **keyword**: word or phrase, matched as whole words, case-insensitive
+    - **category**: ai_category given to matching tickets
+    - **priority**: matching tickets are raised to at least this priority
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can delete tickets")
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    db_rule = models.RoutingRule(
+        keyword=rule.keyword,
+        category=rule.category,
+        priority=rule.priority,
+        is_active=rule.is_active
+    )
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    routing.reload(db)
+    return rule_to_response(db_rule)
+
+@app.put("/admin/routing/rules/{rule_id}", response_model=dict)
+def update_routing_rule(
+    rule_id: int,
+    rule_update: schemas.RoutingRuleUpdate,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """Update a keyword routing rule (admin only)"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
     
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
+    db_rule = db.query(models.RoutingRule).filter(models.RoutingRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Routing rule not found")
+    
+    if rule_update.keyword is not None:
+        db_rule.keyword = rule_update.keyword
+    if rule_update.category is not None:
+        db_rule.category = rule_update.category or None
+    if rule_update.priority is not None:
+        db_rule.priority = rule_update.priority or None
+    if rule_update.is_active is not None:
+        db_rule.is_active = rule_update.is_active
+    
+    if not db_rule.category and not db_rule.priority:
+        raise HTTPException(status_code=400, detail="A rule must set a category or a priority")
     
-    db.delete(ticket)
     db.commit()
+    db.refresh(db_rule)
+    routing.reload(db)
+    return rule_to_response(db_rule)
+
+@app.delete("/admin/routing/rules/{rule_id}", status_code=204)
+def delete_routing_rule(
+    rule_id: int,
+    db: Session = Depends(database.get_db),
+    current_user = Depends(auth.get_current_active_user)
+):
+    """Delete a keyword routing rule (admin only)"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    db_rule = db.query(models.RoutingRule).filter(models.RoutingRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Routing rule not found")
     
+    db.delete(db_rule)
+    db.commit()
+    routing.reload(db)
     return None
 
+@app.post("/admin/routing/reroute", response_model=dict)
+def reroute_tickets(current_user = Depends(auth.get_current_active_user)):
+    """
+    Apply the current routing rules to open and in-progress tickets (admin only)
+    
+    Runs in id batches; for very large backlogs prefer `python routing.py reroute`.
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return routing.reroute_tickets()
+
+# ========== ADMIN: PROFILING ==========
+
+@app.get("/admin/profiling", response_model=dict)
+def get_profiling_status(current_user = Depends(auth.get_current_active_user)):
+    """Current profiler configuration and sample counts (admin only)"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return profiling.status()
+
+@app.post("/admin/profiling", response_model=dict)
+def configure_profiling(
+    config: schemas.ProfilingConfig,
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Enable or disable sampling profiling (admin only)
+    
+    - **sample_rate**: fraction of requests to profile (0-1)
+    - **route**: only profile this route template, e.g. /tickets/{ticket_id}
+    - **duration_seconds**: automatically switch off after this long
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return profiling.configure(
+        enabled=config.enabled,
+        sample_rate=config.sample_rate,
+        route=config.route,
+        duration_seconds=config.duration_seconds,
+        interval_ms=config.interval_ms
+    )
+
+@app.get("/admin/profiling/stacks", response_class=PlainTextResponse)
+def get_profiling_stacks(
+    since: Optional[float] = None,
+    reset: bool = False,
+    current_user = Depends(auth.get_current_active_user)
+):
+    """
+    Aggregated call stacks in collapsed format (admin only)
+    
+    Pipe the output into flamegraph.pl or speedscope.
+    - **since**: only samples after this unix timestamp (from the ring buffer)
+    - **reset**: clear collected samples after reading
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    body = profiling.collapsed_stacks(since)
+    if reset:
+        profiling.reset()
+    return PlainTextResponse(body)
+
+# ========== ANALYTICS ==========
+# Reports run over the columnar snapshot (analytics.py), never the live tickets table.
+# analytics (and NumPy with it) is imported on first use, so workers that never
+# serve a report don't load it.
+
+def get_analytics_snapshot(current_user = Depends(auth.get_current_principal)):
+    """Current analytics snapshot for agents/admins"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role not in ("agent", "admin"):
+        raise HTTPException(status_code=403, detail="Access denied")
+    import analytics
+    snapshot = analytics.load()
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Analytics snapshot not built yet (python analytics.py build)")
+    return snapshot
+
+@app.get("/analytics", response_model=dict)
+def analytics_summary(snapshot = Depends(get_analytics_snapshot)):
+    """Snapshot freshness and ticket totals by status (agent/admin)"""
+    import analytics
+    return {
+        "generation": snapshot.manifest["generation"],
+        "built_at": snapshot.manifest["built_at"],
+        "tickets": snapshot.rows,
+        "by_status": analytics.status_totals(snapshot)
+    }
+
+@app.get("/analytics/volume", response_model=dict)
+def analytics_volume(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    snapshot = Depends(get_analytics_snapshot)
+):
+    """Tickets created per hour (agent/admin)"""
+    import analytics
+    return {"built_at": snapshot.manifest["built_at"], "hours": analytics.volume_per_hour(snapshot, since, until)}
+
+@app.get("/analytics/resolution", response_model=dict)
+def analytics_resolution(
+    group_by: str = "priority",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    snapshot = Depends(get_analytics_snapshot)
+):
+    """
+    Time-to-resolve percentiles in hours (agent/admin)
+    
+    - **group_by**: priority or category
+    - **since/until**: filter by resolution time
+    """
+    if group_by not in ("priority", "category"):
+        raise HTTPException(status_code=400, detail="group_by must be priority or category")
+    import analytics
+    return {
+        "built_at": snapshot.manifest["built_at"],
+        "groups": analytics.resolution_percentiles(snapshot, group_by, since=since, until=until)
+    }
+
+@app.get("/analytics/agents", response_model=dict)
+def analytics_agents(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 20,
+    snapshot = Depends(get_analytics_snapshot),
+    db: Session = Depends(get_read_db)
+):
+    """Resolved tickets per agent, busiest first (agent/admin)"""
+    import analytics
+    agents = analytics.agent_throughput(snapshot, since, until, limit=max(1, min(limit, 500)))
+    names = dict(
+        db.query(models.User.id, models.User.username)
+        .filter(models.User.id.in_([a["agent_id"] for a in agents]))
+        .all()
+    ) if agents else {}
+    for agent in agents:
+        agent["username"] = names.get(agent["agent_id"])
+    return {"built_at": snapshot.manifest["built_at"], "agents": agents}
+
+@app.post("/admin/analytics/refresh", response_model=dict)
+def refresh_analytics(full: bool = False, current_user = Depends(auth.get_current_active_user)):
+    """Refresh the analytics snapshot now (admin only); reads from the read database"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    import analytics
+    return analytics.build(full=full)
+
 # ========== RUN SERVER ==========
 if __name__ == "__main__":
     import uvicorn
+    migrations.upgrade()
     uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
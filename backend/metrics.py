@@ -0,0 +1,227 @@
+"""
+metrics.py - Request, database and password-hashing instrumentation
+Collects latency histograms and counters and renders them in Prometheus text format
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+# ========== CONFIGURATION ==========
+# Fixed histogram buckets (seconds). Observations never allocate after a series exists.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# The same statement executed this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+logger = logging.getLogger("autoresolve.metrics")
+# Routes already logged as N+1; after the first warning only the counter moves
+_n_plus_one_logged = set()
+
+# ========== PER-THREAD SHARDS ==========
+# Every thread writes only to its own shard, so the hot path takes no locks.
+# Shards are merged when /metrics is scraped.
+
+_shards: List[dict] = []
+_shards_lock = threading.Lock()  # only taken once per thread, when its shard is created
+_local = threading.local()
+
+def _shard() -> dict:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = {"counters": {}, "histograms": {}}
+        _local.shard = shard
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+def inc(name: str, labels: Tuple[Tuple[str, str], ...] = (), value: float = 1) -> None:
+    """Increment a counter"""
+    counters = _shard()["counters"]
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+def observe(name: str, value: float, labels: Tuple[Tuple[str, str], ...] = (),
+            buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+    """Record one observation in a fixed-bucket histogram"""
+    histograms = _shard()["histograms"]
+    key = (name, labels)
+    series = histograms.get(key)
+    if series is None:
+        # [bucket counts..., +Inf count, sum]
+        series = histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+    counts = series[1]
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            counts[i] += 1
+            break
+    else:
+        counts[-1] += 1
+    series[2] += value
+
+# Gauges are last-value-wins and set from one place each, so a plain dict will do
+_gauges: Dict[tuple, float] = {}
+
+def set_gauge(name: str, value: float, labels: Tuple[Tuple[str, str], ...] = ()) -> None:
+    """Set a gauge to its current value"""
+    _gauges[(name, labels)] = value
+
+class timer:
+    """Context manager observing elapsed seconds into a histogram"""
+
+    def __init__(self, name: str, labels: Tuple[Tuple[str, str], ...] = ()):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+# ========== PER-REQUEST QUERY TRACKING ==========
+
+class RequestStats:
+    """Database activity for the request currently being served"""
+
+    __slots__ = ("queries", "query_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements: Dict[str, int] = {}
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def instrument_engine(engine) -> None:
+    """Attach query counting/timing hooks to a SQLAlchemy engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        observe("db_query_duration_seconds", elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+            stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+# ========== ROUTE RESOLUTION ==========
+
+_endpoint_paths: Dict[object, str] = {}
+
+def _route_label(request) -> str:
+    """Return the route template (e.g. /tickets/{ticket_id}) so ids don't explode cardinality"""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _endpoint_paths.get(endpoint)
+    if path is None:
+        for candidate in request.app.routes:
+            if getattr(candidate, "endpoint", None) is endpoint:
+                path = candidate.path
+                break
+        else:
+            path = "unmatched"
+        _endpoint_paths[endpoint] = path
+    return path
+
+# ========== MIDDLEWARE ==========
+
+async def metrics_middleware(request, call_next):
+    """Record latency, status and database usage for every request"""
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        _request_stats.reset(token)
+        route = _route_label(request)
+        labels = (("method", request.method), ("route", route))
+        observe("http_request_duration_seconds", elapsed, labels)
+        inc("http_requests_total", labels + (("status", str(status_code)),))
+        observe("http_request_db_queries", stats.queries, labels, QUERY_COUNT_BUCKETS)
+        observe("http_request_db_seconds", stats.query_time, labels)
+        if stats.statements and max(stats.statements.values()) >= N_PLUS_ONE_THRESHOLD:
+            inc("http_request_n_plus_one_total", labels)
+            if labels not in _n_plus_one_logged:
+                _n_plus_one_logged.add(labels)
+                logger.warning("Possible N+1 on %s %s: %d repeats of one statement (see http_request_n_plus_one_total)",
+                               request.method, route, max(stats.statements.values()))
+
+# ========== EXPOSITION ==========
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+def render() -> str:
+    """Merge all thread shards and render Prometheus text exposition format"""
+    with _shards_lock:
+        shards = list(_shards)
+
+    counters: Dict[tuple, float] = {}
+    histograms: Dict[tuple, list] = {}
+    for shard in shards:
+        for key, value in list(shard["counters"].items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, counts, total) in list(shard["histograms"].items()):
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [buckets, list(counts), total]
+            else:
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(_gauges.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (buckets, counts, total) in sorted(histograms.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, count in zip(buckets, counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+        cumulative += counts[-1]
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
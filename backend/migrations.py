@@ -0,0 +1,357 @@
+"""
+migrations.py - Versioned schema migrations for AutoResolve AI
+The applied version lives in a one-row `schema_version` table. Workers only read
+that row at startup; migrations are applied out-of-band, once per deploy:
+
+    python migrations.py upgrade
+    python migrations.py status
+
+Every migration must be safe to run against a database that already has the
+change (tables created with checkfirst, columns/indexes added only if missing),
+because the baseline builds tables from the current models.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+import database
+
+# ========== HELPERS ==========
+
+def _columns(conn, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+def _add_column(conn, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _create_tables(conn, *tables) -> None:
+    for table in tables:
+        table.create(conn, checkfirst=True)
+
+def _on_shard(conn) -> bool:
+    """True while migrating a ticket shard: global tables (users, sessions, rules) stay in the main database"""
+    return conn.info.get("shard", False)
+
+# ========== MIGRATIONS ==========
+
+def m001_baseline(conn):
+    """Users and tickets tables"""
+    import models
+    if _on_shard(conn):
+        _create_tables(conn, models.Ticket.__table__)
+        return
+    _create_tables(conn, models.User.__table__, models.Ticket.__table__)
+
+def m002_user_token_version(conn):
+    """users.token_version for token revocation"""
+    if _on_shard(conn):
+        return
+    _add_column(conn, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
+
+def m003_ticket_archive(conn):
+    """tickets_archive table and archival scan index"""
+    import models
+    _create_tables(conn, models.ArchivedTicket.__table__)
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_tickets_status_updated_at ON tickets (status, updated_at)"
+    ))
+
+def _compress_text_columns(conn, table: str, columns: list, batch_size: int = 2000) -> None:
+    from column_types import encode_text
+    if conn.dialect.name == "postgresql":
+        for column in columns:
+            conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA USING convert_to({column}, 'UTF8')"
+            ))
+        return
+    if conn.dialect.name != "sqlite":
+        print(f"[WARN] {table}: convert {columns} to a binary type manually on {conn.dialect.name}")
+        return
+    # SQLite is dynamically typed: rewrite plain TEXT values into the compressed format in place
+    pending = " OR ".join(f"typeof({c}) = 'text'" for c in columns)
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > :last AND ({pending}) "
+            f"ORDER BY id LIMIT :n"
+        ), {"last": last_id, "n": batch_size}).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            values = {"id": row[0]}
+            for i, column in enumerate(columns, start=1):
+                value = row[i]
+                values[column] = encode_text(value) if isinstance(value, str) else value
+            params.append(values)
+        assignments = ", ".join(f"{c} = :{c}" for c in columns)
+        conn.execute(text(f"UPDATE {table} SET {assignments} WHERE id = :id"), params)
+        last_id = rows[-1][0]
+
+def m004_compress_ticket_text(conn):
+    """Store ticket description/ai_suggested_response compressed"""
+    for table in ("tickets", "tickets_archive"):
+        _compress_text_columns(conn, table, ["description", "ai_suggested_response"])
+
+def m005_normalize_emails(conn):
+    """Store emails lower-cased/trimmed so the unique email index serves lookups"""
+    if _on_shard(conn):
+        return
+    collisions = conn.execute(text(
+        "SELECT lower(trim(email)) AS normalized, count(*) FROM users "
+        "GROUP BY lower(trim(email)) HAVING count(*) > 1"
+    )).all()
+    if collisions:
+        listed = ", ".join(row[0] for row in collisions[:10])
+        raise RuntimeError(f"Emails differing only by case must be merged first: {listed}")
+    conn.execute(text("UPDATE users SET email = lower(trim(email)) WHERE email != lower(trim(email))"))
+
+def m006_refresh_sessions(conn):
+    """refresh_sessions table for rotating refresh tokens"""
+    import models
+    if _on_shard(conn):
+        return
+    _create_tables(conn, models.RefreshSession.__table__)
+
+def m007_ticket_updated_at_index(conn):
+    """tickets.updated_at index for incremental analytics snapshots"""
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tickets_updated_at ON tickets (updated_at)"))
+
+def m008_id_allocator(conn):
+    """id_allocator table for globally unique ticket ids across shards"""
+    import models
+    _create_tables(conn, models.IdAllocator.__table__)
+
+def m009_ticket_claim_queue(conn):
+    """tickets.priority_rank/claim_expires_at and claim queue indexes"""
+    _add_column(conn, "tickets", "priority_rank", "SMALLINT NOT NULL DEFAULT 2")
+    _add_column(conn, "tickets", "claim_expires_at", "TIMESTAMP")
+    conn.execute(text(
+        "UPDATE tickets SET priority_rank = CASE priority "
+        "WHEN 'urgent' THEN 0 WHEN 'high' THEN 1 WHEN 'low' THEN 3 ELSE 2 END "
+        "WHERE priority IN ('urgent', 'high', 'low')"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_tickets_claim_queue ON tickets (status, priority_rank, created_at, id) "
+        "WHERE status = 'open' AND assigned_to IS NULL"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_tickets_claim_expires_at ON tickets (claim_expires_at) "
+        "WHERE claim_expires_at IS NOT NULL"
+    ))
+
+def m010_routing_rules(conn):
+    """routing_rules table for keyword ticket routing"""
+    import models
+    if _on_shard(conn):
+        return
+    _create_tables(conn, models.RoutingRule.__table__)
+
+def m011_ticket_pii_original(conn):
+    """pii_original column (encrypted pre-redaction text) on tickets and tickets_archive"""
+    ddl = "BYTEA" if conn.dialect.name == "postgresql" else "BLOB"
+    for table in ("tickets", "tickets_archive"):
+        _add_column(conn, table, "pii_original", ddl)
+
+def m012_bigint_ticket_ids(conn):
+    """64-bit ticket ids (sharded id ranges start at 2^40)"""
+    if conn.dialect.name == "postgresql":
+        for table in ("tickets", "tickets_archive"):
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN id TYPE BIGINT"))
+    elif conn.dialect.name != "sqlite":
+        # SQLite INTEGER keys are already 64-bit
+        print(f"[WARN] tickets/tickets_archive: widen id to BIGINT manually on {conn.dialect.name}")
+
+def m013_ticket_attachments(conn):
+    """ticket_attachments table (attachment metadata)"""
+    import models
+    _create_tables(conn, models.TicketAttachment.__table__)
+
+def m014_ticket_messages(conn):
+    """ticket_messages table and conversation summary columns on tickets"""
+    import models
+    _create_tables(conn, models.TicketMessage.__table__)
+    for table in ("tickets", "tickets_archive"):
+        _add_column(conn, table, "message_count", "INTEGER NOT NULL DEFAULT 0")
+        _add_column(conn, table, "last_message_at", "TIMESTAMP")
+        _add_column(conn, table, "last_message_id", "INTEGER")
+
+def m015_global_tables_off_shards(conn):
+    """Drop ticket->users foreign keys and global tables from ticket shards"""
+    if not _on_shard(conn):
+        return
+    # A shard's users table is empty, so an enforced FK (PostgreSQL) rejects
+    # every ticket insert. SQLite doesn't enforce them; its constraints stay inert.
+    if conn.dialect.name != "sqlite":
+        for table in ("tickets", "refresh_sessions"):
+            if not inspect(conn).has_table(table):
+                continue
+            for fk in inspect(conn).get_foreign_keys(table):
+                if fk["referred_table"] == "users" and fk.get("name"):
+                    conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{fk["name"]}"'))
+    for table in ("refresh_sessions", "routing_rules", "users"):
+        if not inspect(conn).has_table(table):
+            continue
+        if conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first():
+            print(f"[WARN] {table} on a ticket shard has rows; not dropping it")
+            continue
+        conn.execute(text(f"DROP TABLE {table}"))
+
+def m016_ticket_ids_never_reused(conn):
+    """tickets.id AUTOINCREMENT on SQLite so deleted/archived ids are never reused"""
+    if conn.dialect.name != "sqlite":
+        return  # PostgreSQL sequences never hand an id out twice
+    import models
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tickets'")).scalar()
+    if ddl is None or "AUTOINCREMENT" in ddl.upper():
+        return
+    # SQLite can't alter a key to AUTOINCREMENT: rebuild the table from the model
+    conn.execute(text("ALTER TABLE tickets RENAME TO tickets_old"))
+    for index in inspect(conn).get_indexes("tickets_old"):
+        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    models.Ticket.__table__.create(conn)
+    columns = ", ".join(c for c in models.Ticket.__table__.columns.keys() if c in _columns(conn, "tickets_old"))
+    conn.execute(text(f"INSERT INTO tickets ({columns}) SELECT {columns} FROM tickets_old"))
+    conn.execute(text("DROP TABLE tickets_old"))
+    # Start after every id ever used, archived ones included
+    highest = max(
+        conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+        for table in ("tickets", "tickets_archive")
+    )
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'tickets'"))
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('tickets', :seq)"), {"seq": highest})
+
+def m017_message_pii_original(conn):
+    """pii_original column (encrypted pre-redaction body) on ticket_messages"""
+    ddl = "BYTEA" if conn.dialect.name == "postgresql" else "BLOB"
+    _add_column(conn, "ticket_messages", "pii_original", ddl)
+
+MIGRATIONS = [
+    (1, m001_baseline),
+    (2, m002_user_token_version),
+    (3, m003_ticket_archive),
+    (4, m004_compress_ticket_text),
+    (5, m005_normalize_emails),
+    (6, m006_refresh_sessions),
+    (7, m007_ticket_updated_at_index),
+    (8, m008_id_allocator),
+    (9, m009_ticket_claim_queue),
+    (10, m010_routing_rules),
+    (11, m011_ticket_pii_original),
+    (12, m012_bigint_ticket_ids),
+    (13, m013_ticket_attachments),
+    (14, m014_ticket_messages),
+    (15, m015_global_tables_off_shards),
+    (16, m016_ticket_ids_never_reused),
+    (17, m017_message_pii_original),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# ========== VERSION TRACKING ==========
+
+def _ensure_version_table(conn) -> None:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "id INTEGER PRIMARY KEY, version INTEGER NOT NULL, applied_at VARCHAR NOT NULL)"
+    ))
+
+def current_version(engine=None) -> int:
+    """Read the applied schema version (0 for a database that was never migrated)"""
+    engine = engine or database.engine
+    with engine.connect() as conn:
+        try:
+            row = conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).first()
+        except Exception:
+            return 0
+    return row[0] if row else 0
+
+def _engines(engine=None) -> list:
+    """The given engine, or the main database plus every ticket shard"""
+    if engine is not None:
+        return [engine]
+    import sharding
+    engines = [database.engine]
+    engines += [shard.engine for shard in sharding.shards if shard.url != database.SQLALCHEMY_DATABASE_URL]
+    return engines
+
+def _is_shard(engine) -> bool:
+    """A ticket shard other than the main database"""
+    if engine is database.engine:
+        return False
+    import sharding
+    return any(engine is shard.engine for shard in sharding.shards)
+
+def upgrade(engine=None, target: int = None) -> int:
+    """
+    Apply pending migrations, each in its own transaction; returns the new version
+
+    Without an engine every database is upgraded. Shards get the ticket
+    tables only; users, sessions and routing rules stay in the main database.
+    """
+    target = LATEST_VERSION if target is None else target
+    for engine in _engines(engine):
+        version = _upgrade_one(engine, target)
+    return version
+
+def _upgrade_one(engine, target: int) -> int:
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+
+    version = current_version(engine)
+    for number, migration in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            conn.info["shard"] = _is_shard(engine)
+            migration(conn)
+            conn.execute(text("DELETE FROM schema_version"))
+            conn.execute(
+                text("INSERT INTO schema_version (id, version, applied_at) VALUES (1, :v, :at)"),
+                {"v": number, "at": datetime.utcnow().isoformat()},
+            )
+        version = number
+        print(f"[OK] Migration {number:03d} {migration.__doc__} ({time.perf_counter() - start:.2f}s)")
+    return version
+
+def check(engine=None) -> None:
+    """
+    Cheap startup check: one read of the version row
+
+    Set AUTO_MIGRATE=1 to apply pending migrations instead of failing
+    (convenient for local development, not for multi-worker deployments).
+    """
+    for engine in _engines(engine):
+        version = current_version(engine)
+        if version >= LATEST_VERSION:
+            continue
+        if os.getenv("AUTO_MIGRATE", "0") == "1":
+            upgrade(engine)
+            continue
+        raise RuntimeError(
+            f"Database {engine.url} schema is at version {version}, code expects {LATEST_VERSION}. "
+            f"Run `python migrations.py upgrade` first."
+        )
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "upgrade":
+        new_version = upgrade()
+        print(f"[OK] Schema at version {new_version}")
+    elif command == "status":
+        for engine in _engines():
+            print(f"Applied version: {current_version(engine)}  Latest: {LATEST_VERSION}  ({engine.url})")
+        for number, migration in MIGRATIONS:
+            print(f"   {number:03d} {migration.__doc__}")
+    else:
+        print("Usage: python migrations.py [upgrade|status]")
+        sys.exit(1)
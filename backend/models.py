@@ -3,9 +3,25 @@ models.py
 Purpose: Define database models/tables
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, DateTime, Boolean, Text, ForeignKey, Index, LargeBinary
+from sqlalchemy.orm import deferred
+from datetime import datetime
+from sqlalchemy.sql import func, text
 from database import Base
+from column_types import CompressedText
+
+# Work-queue order: lower rank is claimed first (claims.py)
+PRIORITY_RANKS = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
+DEFAULT_PRIORITY_RANK = PRIORITY_RANKS["medium"]
+
+def priority_rank(priority) -> int:
+    return PRIORITY_RANKS.get(priority, DEFAULT_PRIORITY_RANK)
+
+def _default_priority_rank(context) -> int:
+    return priority_rank(context.get_current_parameters().get("priority"))
+
+# Partial index predicate for the claim queue: open tickets nobody holds
+CLAIMABLE_WHERE = text("status = 'open' AND assigned_to IS NULL")
 
 class User(Base):
     __tablename__ = "users"
@@ -17,22 +33,148 @@ class User(Base):
     full_name = Column(String, nullable=True)
     role = Column(String, default="customer")  # customer, agent, admin
     is_active = Column(Boolean, default=True)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # bumped to revoke issued tokens
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+# Sharded ticket ids go past 2^31 (sharding.py); SQLite needs INTEGER for rowid ids
+TicketId = BigInteger().with_variant(Integer, "sqlite")
+
 class Ticket(Base):
     __tablename__ = "tickets"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(TicketId, primary_key=True, index=True)
     title = Column(String, nullable=False)
-    description = Column(Text, nullable=False)
+    # Large text is stored compressed and only loaded when a response includes it
+    description = deferred(Column(CompressedText, nullable=False), group="text")
     status = Column(String, default="open")  # open, in_progress, resolved, closed
     priority = Column(String, default="medium")  # low, medium, high, urgent
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    assigned_to = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    # Numeric mirror of priority so the claim queue is one ordered index scan
+    priority_rank = Column(SmallInteger, nullable=False, default=_default_priority_rank,
+                           server_default=str(DEFAULT_PRIORITY_RANK))
+    # No foreign keys to users: users live in the main database, tickets may be on another shard
+    user_id = Column(Integer, nullable=False, index=True)
+    assigned_to = Column(Integer, nullable=True, index=True)
+    ai_category = Column(String, nullable=True)
+    ai_confidence = Column(Integer, nullable=True)
+    sentiment_score = Column(Integer, nullable=True)
+    ai_suggested_response = deferred(Column(CompressedText, nullable=True), group="text")
+    resolved_by_ai = Column(Boolean, default=False)
+    # Fernet-encrypted originals of redacted title/description (redaction.py)
+    pii_original = deferred(Column(LargeBinary, nullable=True), group="pii")
+    # Set while a claimed ticket is still open; past it the claim is released
+    claim_expires_at = Column(DateTime, nullable=True)
+    # Conversation summary, kept in step with ticket_messages by the insert's transaction
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Archival scan: closed/resolved tickets by age
+        Index("ix_tickets_status_updated_at", "status", "updated_at"),
+        # Incremental analytics snapshot: tickets changed since the last build
+        Index("ix_tickets_updated_at", "updated_at"),
+        # Claim queue: next ticket is the first entry, and the entry holds the id.
+        # status leads (constant here) so SQLite prefers it over the status index
+        # even without ANALYZE statistics
+        Index("ix_tickets_claim_queue", "status", "priority_rank", "created_at", "id",
+              sqlite_where=CLAIMABLE_WHERE, postgresql_where=CLAIMABLE_WHERE),
+        # Lease sweep: only claimed tickets are indexed
+        Index("ix_tickets_claim_expires_at", "claim_expires_at",
+              sqlite_where=text("claim_expires_at IS NOT NULL"),
+              postgresql_where=text("claim_expires_at IS NOT NULL")),
+        # Without AUTOINCREMENT SQLite hands out max(id) + 1, so the id of a deleted
+        # or archived newest ticket would be given to the next one
+        {"sqlite_autoincrement": True},
+    )
+
+class ArchivedTicket(Base):
+    """Closed/resolved tickets moved out of the hot `tickets` table by archive.py"""
+    __tablename__ = "tickets_archive"
+    
+    id = Column(TicketId, primary_key=True, autoincrement=False)
+    title = Column(String, nullable=False)
+    description = Column(CompressedText, nullable=False)
+    status = Column(String)
+    priority = Column(String)
+    user_id = Column(Integer, nullable=False, index=True)
+    assigned_to = Column(Integer, nullable=True)
     ai_category = Column(String, nullable=True)
     ai_confidence = Column(Integer, nullable=True)
     sentiment_score = Column(Integer, nullable=True)
-    ai_suggested_response = Column(Text, nullable=True)
+    ai_suggested_response = Column(CompressedText, nullable=True)
     resolved_by_ai = Column(Boolean, default=False)
+    pii_original = deferred(Column(LargeBinary, nullable=True), group="pii")
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RefreshSession(Base):
+    """One refresh token (stored as a SHA-256 hash); rotated on every use by sessions.py"""
+    __tablename__ = "refresh_sessions"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    token_version = Column(Integer, nullable=False, default=0)  # must match users.token_version
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=True)
+    replaced_by_id = Column(Integer, nullable=True)
+
+class IdAllocator(Base):
+    """Next free id per sequence; app processes reserve blocks from it (sharding.py)"""
+    __tablename__ = "id_allocator"
+    
+    name = Column(String, primary_key=True)
+    next_id = Column(BigInteger, nullable=False)
+
+class RoutingRule(Base):
+    """Keyword rule that sets category and/or priority on new tickets (routing.py)"""
+    __tablename__ = "routing_rules"
+    
+    id = Column(Integer, primary_key=True)
+    keyword = Column(String, nullable=False)
+    category = Column(String, nullable=True)
+    priority = Column(String, nullable=True)
+    is_active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set in Python (sub-second) so workers notice every edit when polling for changes
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TicketAttachment(Base):
+    """Metadata of a file attached to a ticket; the content lives in attachments.py's object store"""
+    __tablename__ = "ticket_attachments"
+    
+    id = Column(Integer, primary_key=True)
+    # No foreign key: rows stay valid when the ticket moves to tickets_archive
+    ticket_id = Column(TicketId, nullable=False, index=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    uploaded_by = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class TicketMessage(Base):
+    """One reply in a ticket's conversation"""
+    __tablename__ = "ticket_messages"
+    
+    id = Column(Integer, primary_key=True)
+    # No foreign key: the conversation stays readable once the ticket is archived
+    ticket_id = Column(TicketId, nullable=False)
+    author_id = Column(Integer, nullable=False)
+    body = Column(CompressedText, nullable=False)
+    # Fernet-encrypted original of a redacted body (redaction.py)
+    pii_original = deferred(Column(LargeBinary, nullable=True), group="pii")
+    # Set in Python so the ticket's last_message_at is the very same value
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Keyset pagination: one range scan per page, however deep
+        Index("ix_ticket_messages_ticket_id_id", "ticket_id", "id"),
+    )
@@ -0,0 +1,654 @@
+"""
+notifications.py - Email/webhook notifications for ticket changes
+update_ticket hands status changes and (re)assignments to an in-process
+dispatcher and returns; no request waits on a mail server. Events are queued
+per recipient and ticket, and everything that happens to a ticket within
+NOTIFY_COALESCE_SECONDS of the first change is folded into one message (a
+field changed and changed back drops out), so bulk operations and bursts of
+edits cost one notification per recipient, not one per event.
+
+One dispatcher thread sends due notifications in batches: emails over a pool
+of persistent SMTP sessions (NOTIFY_SMTP_CONNECTIONS, used in parallel), the
+webhook as one JSON array per batch over a keep-alive connection. Failed
+deliveries are retried per channel with exponential backoff and jitter, then
+dropped after MAX_ATTEMPTS. Pending notifications live in memory: a crash loses
+at most the current coalescing window; shutdown flushes them.
+
+Enable with NOTIFY_SMTP_URL (smtp://[user:password@]host:port, or
+smtp+starttls://...) and/or NOTIFY_WEBHOOK_URL. Webhook receivers should
+deduplicate on the notification id (delivery is at least once).
+
+Usage:
+    python notifications.py serve [smtp_port] [webhook_port]   # local stand-in servers that print what they get
+    python notifications.py benchmark [tickets] [fail_every]   # throughput against the stand-ins
+"""
+
+import asyncio
+import base64
+import heapq
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import smtplib
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.header import Header
+from email.utils import formatdate, parseaddr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from sqlalchemy import select
+
+import database
+import metrics
+import models
+
+# ========== CONFIGURATION ==========
+SMTP_URL = os.getenv("NOTIFY_SMTP_URL", "")
+WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL", "")
+MAIL_FROM = os.getenv("NOTIFY_FROM", "AutoResolve AI <support@autoresolve.local>")
+COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "30"))
+SMTP_CONNECTIONS = int(os.getenv("NOTIFY_SMTP_CONNECTIONS", "4"))
+ENABLED = bool(SMTP_URL or WEBHOOK_URL)
+
+BATCH_SIZE = 500
+MAX_PENDING = 100_000          # beyond this, new notifications are dropped (and counted)
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+CONNECT_TIMEOUT_SECONDS = 10.0
+# Pooled SMTP sessions idle longer than this are checked (NOOP) before reuse
+SMTP_IDLE_CHECK_SECONDS = 30.0
+SHUTDOWN_FLUSH_SECONDS = 10.0
+
+Change = Tuple[str, Optional[object], Optional[object]]  # (field, old, new)
+
+# ========== NOTIFICATIONS ==========
+
+class Notification:
+    """Everything one recipient should hear about one ticket, pending delivery"""
+
+    __slots__ = ("id", "recipient_id", "ticket_id", "title", "changes", "due_at", "attempts", "channels")
+
+    def __init__(self, recipient_id: int, ticket_id: int, title: str, due_at: float, channels: Iterable[str]):
+        self.id = uuid.uuid4().hex
+        self.recipient_id = recipient_id
+        self.ticket_id = ticket_id
+        self.title = title
+        self.changes: Dict[str, list] = {}  # field -> [value before the first change, latest value]
+        self.due_at = due_at
+        self.attempts = 0
+        self.channels = set(channels)       # channels still to deliver to
+
+    def merge(self, changes: Iterable[Change]) -> None:
+        for field, old, new in changes:
+            if field in self.changes:
+                self.changes[field][1] = new
+            else:
+                self.changes[field] = [old, new]
+            if self.changes[field][0] == self.changes[field][1]:
+                # Changed and changed back within the window: nothing to report
+                del self.changes[field]
+
+    def lines(self) -> List[str]:
+        lines = []
+        for field, (old, new) in sorted(self.changes.items()):
+            if field == "assigned_to":
+                lines.append(f"Assignee: {self._person(old)} -> {self._person(new)}")
+            else:
+                lines.append(f"{field.replace('_', ' ').capitalize()}: {old} -> {new}")
+        return lines
+
+    def _person(self, user_id) -> str:
+        if user_id is None:
+            return "nobody"
+        return "you" if user_id == self.recipient_id else f"user #{user_id}"
+
+    def payload(self, email: str) -> dict:
+        return {
+            "id": self.id,
+            "ticket_id": self.ticket_id,
+            "title": self.title,
+            "recipient_id": self.recipient_id,
+            "email": email,
+            "changes": [{"field": field, "from": old, "to": new} for field, (old, new) in sorted(self.changes.items())],
+        }
+
+def _header(value: str) -> str:
+    value = " ".join(value.split())  # no CR/LF: header injection
+    return value if value.isascii() else Header(value, "utf-8").encode()
+
+def render_email(notification: Notification, sender: str, to: str) -> bytes:
+    """
+    Plain-text message, built directly: EmailMessage's policy machinery costs
+    over a millisecond per message and would cap throughput on its own
+    """
+    title = " ".join(notification.title.split())
+    body = [f"Ticket #{notification.ticket_id} \"{title}\" was updated:", ""]
+    body += [f"  {line}" for line in notification.lines()]
+    text = "\r\n".join(body) + "\r\n"
+    if text.isascii():
+        encoding, payload = "7bit", text
+    else:
+        encoding, payload = "base64", base64.encodebytes(text.encode("utf-8")).decode("ascii").replace("\n", "\r\n")
+    headers = [
+        f"From: {_header(sender)}",
+        f"To: {_header(to)}",
+        f"Subject: {_header(f'[Ticket #{notification.ticket_id}] {title}')}",
+        f"Date: {formatdate(localtime=False)}",
+        f"Message-ID: <{notification.id}@autoresolve>",
+        "MIME-Version: 1.0",
+        "Content-Type: text/plain; charset=utf-8",
+        f"Content-Transfer-Encoding: {encoding}",
+    ]
+    return ("\r\n".join(headers) + "\r\n\r\n" + payload).encode("ascii")
+
+# ========== TRANSPORTS ==========
+# send(notifications, emails) -> (failed, rejected): failed ones are retried,
+# rejected ones (permanent errors, e.g. unknown mailbox) are dropped.
+
+class SmtpTransport:
+    """Email over a pool of persistent SMTP sessions, used in parallel"""
+
+    name = "email"
+
+    def __init__(self, url: str, sender: str = MAIL_FROM, connections: int = SMTP_CONNECTIONS):
+        parsed = urlsplit(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 25
+        self.starttls = parsed.scheme == "smtp+starttls"
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.sender = sender
+        self.envelope_sender = parseaddr(sender)[1]
+        self.connections = max(1, connections)
+        self.idle: "queue.LifoQueue[Tuple[smtplib.SMTP, float]]" = queue.LifoQueue()
+        self.executor = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="notify-smtp")
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=CONNECT_TIMEOUT_SECONDS)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        return smtp
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            try:
+                smtp, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < SMTP_IDLE_CHECK_SECONDS:
+                return smtp
+            try:
+                smtp.noop()
+                return smtp
+            except (smtplib.SMTPException, OSError):
+                _close(smtp)
+
+    def _send_chunk(self, items: List[Notification], emails: Dict[int, str]):
+        failed, rejected = [], []
+        try:
+            smtp = self._checkout()
+        except (smtplib.SMTPException, OSError) as e:
+            print(f"[ERROR] SMTP connect to {self.host}:{self.port} failed: {e}")
+            return items, []
+        for index, notification in enumerate(items):
+            to = emails[notification.recipient_id]
+            try:
+                smtp.sendmail(self.envelope_sender, [to], render_email(notification, self.sender, to))
+            except smtplib.SMTPRecipientsRefused:
+                rejected.append(notification)
+            except smtplib.SMTPResponseException as e:
+                # 4xx: try again later; 5xx: permanent (smtplib already reset the transaction)
+                (failed if 400 <= e.smtp_code < 500 else rejected).append(notification)
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"[ERROR] SMTP session to {self.host}:{self.port} broke: {e}")
+                _close(smtp)
+                return failed + items[index:], rejected
+        self.idle.put((smtp, time.monotonic()))
+        return failed, rejected
+
+    def send(self, items: List[Notification], emails: Dict[int, str]):
+        chunks = [items[start::self.connections] for start in range(self.connections)]
+        futures = [self.executor.submit(self._send_chunk, chunk, emails) for chunk in chunks if chunk]
+        failed, rejected = [], []
+        for future in futures:
+            chunk_failed, chunk_rejected = future.result()
+            failed += chunk_failed
+            rejected += chunk_rejected
+        return failed, rejected
+
+    def close(self) -> None:
+        while True:
+            try:
+                smtp, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                _close(smtp)
+        self.executor.shutdown(wait=False)
+
+def _close(smtp: smtplib.SMTP) -> None:
+    try:
+        smtp.close()
+    except OSError:
+        pass
+
+class WebhookTransport:
+    """One JSON POST per batch over a keep-alive HTTP(S) connection"""
+
+    name = "webhook"
+
+    def __init__(self, url: str):
+        parsed = urlsplit(url)
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port
+        self.path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=CONNECT_TIMEOUT_SECONDS)
+        return self.conn
+
+    def send(self, items: List[Notification], emails: Dict[int, str]):
+        body = json.dumps({"notifications": [n.payload(emails[n.recipient_id]) for n in items]}).encode()
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.request("POST", self.path, body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                # The server may have closed the idle keep-alive connection: reconnect once
+                self.close()
+                if attempt:
+                    print(f"[ERROR] Webhook {self.host} unreachable: {e}")
+                    return items, []
+        if 200 <= response.status < 300:
+            return [], []
+        if response.status == 429 or response.status >= 500:
+            return items, []
+        print(f"[ERROR] Webhook rejected {len(items)} notifications: HTTP {response.status}")
+        return [], items
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# ========== DISPATCHER ==========
+
+def load_recipients(user_ids) -> Dict[int, str]:
+    """Emails of the given (active) users, in one query"""
+    users = models.User.__table__
+    with database.engine.connect() as conn:
+        rows = conn.execute(
+            select(users.c.id, users.c.email).where(users.c.id.in_(list(user_ids)), users.c.is_active.is_(True))
+        ).all()
+    return {row.id: row.email for row in rows}
+
+def backoff_seconds(attempts: int, base: float = BACKOFF_BASE_SECONDS) -> float:
+    return min(BACKOFF_MAX_SECONDS, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+class Dispatcher:
+    """Coalesces notifications per (recipient, ticket) and delivers them in batches from one thread"""
+
+    def __init__(self, transports: List, resolve: Callable = load_recipients,
+                 coalesce_seconds: float = COALESCE_SECONDS, batch_size: int = BATCH_SIZE,
+                 backoff_base: float = BACKOFF_BASE_SECONDS):
+        self.transports = {transport.name: transport for transport in transports}
+        self.resolve = resolve
+        self.coalesce_seconds = coalesce_seconds
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.condition = threading.Condition()
+        self.pending: Dict[Tuple[int, int], Notification] = {}  # still open for coalescing
+        self.heap: List[Tuple[float, int, Notification]] = []   # pending + retries, by due time
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.flushing = False
+        self.stopping = False
+        self.thread: Optional[threading.Thread] = None
+        self.sent: Dict[str, int] = {name: 0 for name in self.transports}
+        self.dropped = 0
+
+    def add(self, recipient_id: int, ticket_id: int, title: str, changes: List[Change]) -> None:
+        """Queue changes for a recipient (cheap, never blocks on delivery)"""
+        key = (recipient_id, ticket_id)
+        with self.condition:
+            notification = self.pending.get(key)
+            if notification is not None:
+                notification.title = title
+                notification.merge(changes)
+                metrics.inc("notifications_coalesced_total")
+                return
+            if len(self.heap) >= MAX_PENDING:
+                self.dropped += 1
+                metrics.inc("notifications_dropped_total", (("reason", "queue_full"),))
+                return
+            notification = Notification(recipient_id, ticket_id, title,
+                                        time.monotonic() + self.coalesce_seconds, self.transports)
+            notification.merge(changes)
+            self.pending[key] = notification
+            self._push(notification)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="notifications", daemon=True)
+                self.thread.start()
+
+    def _push(self, notification: Notification) -> None:
+        heapq.heappush(self.heap, (notification.due_at, next(self.sequence), notification))
+        if self.heap[0][2] is notification:
+            self.condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send everything now (ignoring the coalescing window); True once all is delivered or dropped"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            try:
+                while self.heap or self.in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                return True
+            finally:
+                self.flushing = False
+
+    def stop(self, timeout: float = SHUTDOWN_FLUSH_SECONDS) -> None:
+        """Flush pending notifications, then stop the dispatcher thread and close connections"""
+        if self.thread is not None:
+            if not self.flush(timeout):
+                print(f"[ERROR] {len(self.heap)} notifications not delivered at shutdown")
+            with self.condition:
+                self.stopping = True
+                self.condition.notify_all()
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        for transport in self.transports.values():
+            transport.close()
+
+    def _take_due(self) -> Optional[List[Notification]]:
+        with self.condition:
+            while True:
+                if self.stopping:
+                    return None
+                now = time.monotonic()
+                if self.heap and (self.flushing or self.heap[0][0] <= now):
+                    break
+                self.condition.wait(self.heap[0][0] - now if self.heap else None)
+            batch = []
+            while self.heap and len(batch) < self.batch_size and (self.flushing or self.heap[0][0] <= now):
+                _, _, notification = heapq.heappop(self.heap)
+                key = (notification.recipient_id, notification.ticket_id)
+                if self.pending.get(key) is notification:
+                    del self.pending[key]
+                batch.append(notification)
+            self.in_flight += len(batch)
+            return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._take_due()
+            if batch is None:
+                return
+            try:
+                retry = self._deliver(batch)
+            except Exception as e:
+                print(f"[ERROR] Notification batch failed: {e}")
+                retry = batch
+            with self.condition:
+                self.in_flight -= len(batch)
+                for notification in retry:
+                    self._retry(notification)
+                metrics.set_gauge("notifications_pending", len(self.heap))
+                self.condition.notify_all()
+
+    def _retry(self, notification: Notification) -> None:
+        notification.attempts += 1
+        if notification.attempts >= MAX_ATTEMPTS:
+            self.dropped += 1
+            for channel in notification.channels:
+                metrics.inc("notifications_dropped_total", (("channel", channel), ("reason", "retries_exhausted")))
+            print(f"[ERROR] Gave up on notification {notification.id} (ticket {notification.ticket_id}) "
+                  f"after {notification.attempts} attempts")
+            return
+        notification.due_at = time.monotonic() + backoff_seconds(notification.attempts, self.backoff_base)
+        self._push(notification)
+
+    def _deliver(self, batch: List[Notification]) -> List[Notification]:
+        """Send a batch on every channel it still needs; returns the notifications to retry"""
+        batch = [notification for notification in batch if notification.changes]
+        if not batch:
+            return []
+        emails = self.resolve({notification.recipient_id for notification in batch})
+        batch = [notification for notification in batch if notification.recipient_id in emails]
+        for name, transport in self.transports.items():
+            items = [notification for notification in batch if name in notification.channels]
+            if not items:
+                continue
+            try:
+                failed, rejected = transport.send(items, emails)
+            except Exception as e:
+                print(f"[ERROR] Sending {len(items)} notifications via {name} failed: {e}")
+                failed, rejected = items, []
+            keep = {id(notification) for notification in failed}
+            for notification in items:
+                if id(notification) not in keep:
+                    notification.channels.discard(name)
+            delivered = len(items) - len(failed) - len(rejected)
+            self.sent[name] += delivered
+            metrics.inc("notifications_sent_total", (("channel", name),), delivered)
+            if failed:
+                metrics.inc("notifications_retries_total", (("channel", name),), len(failed))
+            if rejected:
+                self.dropped += len(rejected)
+                metrics.inc("notifications_dropped_total", (("channel", name), ("reason", "rejected")), len(rejected))
+        return [notification for notification in batch if notification.channels]
+
+def _configured_transports() -> List:
+    transports = []
+    if SMTP_URL:
+        transports.append(SmtpTransport(SMTP_URL))
+    if WEBHOOK_URL:
+        transports.append(WebhookTransport(WEBHOOK_URL))
+    return transports
+
+dispatcher: Optional[Dispatcher] = Dispatcher(_configured_transports()) if ENABLED else None
+
+# ========== TICKET EVENTS ==========
+
+def ticket_changed(ticket: dict, changes: List[Change], actor_id: int) -> None:
+    """
+    Notify the people a committed ticket update concerns (never the person who made it)
+
+    Status changes go to the ticket's owner and assignee; (re)assignments to
+    the previous and the new assignee.
+    """
+    if dispatcher is None or not changes:
+        return
+    per_recipient: Dict[int, List[Change]] = {}
+    for change in changes:
+        field, old, new = change
+        people = (ticket["user_id"], ticket["assigned_to"]) if field == "status" else (old, new)
+        for person in people:
+            if person and person != actor_id:
+                per_recipient.setdefault(person, []).append(change)
+    for recipient_id, own_changes in per_recipient.items():
+        metrics.inc("notifications_events_total")
+        dispatcher.add(recipient_id, ticket["id"], ticket["title"], own_changes)
+
+# ========== LOCAL STAND-IN SERVERS ==========
+
+class StandInSmtpServer:
+    """SMTP sink for local runs and benchmarks; fail_every=N answers every Nth message with 451"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, fail_every: int = 0, verbose: bool = False):
+        self.host = host
+        self.port = port
+        self.fail_every = fail_every
+        self.verbose = verbose
+        self.received = 0
+        self.delivered = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    def start(self) -> "StandInSmtpServer":
+        threading.Thread(target=self._run, name="stand-in-smtp", daemon=True).start()
+        self.ready.wait()
+        return self
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(
+            asyncio.start_server(self._session, self.host, self.port, limit=1 << 20)
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _session(self, reader, writer) -> None:
+        writer.write(b"220 stand-in ESMTP\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                verb = line[:4].upper()
+                if verb == b"DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    self.received += 1
+                    if self.fail_every and self.received % self.fail_every == 0:
+                        writer.write(b"451 Try again later\r\n")
+                    else:
+                        self.delivered += 1
+                        writer.write(b"250 OK\r\n")
+                        if self.verbose:
+                            subject = next((h for h in data.split(b"\r\n") if h.startswith(b"Subject:")), b"")
+                            print(f"[SMTP] {subject.decode(errors='replace')}")
+                elif verb == b"EHLO":
+                    writer.write(b"250-stand-in\r\n250 8BITMIME\r\n")
+                elif verb == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    # HELO, MAIL, RCPT, RSET, NOOP
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+class StandInWebhookServer:
+    """Webhook sink (HTTP/1.1 keep-alive); fail_every=N answers every Nth request with 503"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, fail_every: int = 0, verbose: bool = False):
+        self.requests = 0
+        self.delivered = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stand_in.requests += 1
+                if fail_every and stand_in.requests % fail_every == 0:
+                    status = 503
+                else:
+                    status = 200
+                    notifications = json.loads(body)["notifications"]
+                    stand_in.delivered += len(notifications)
+                    if verbose:
+                        for notification in notifications:
+                            print(f"[WEBHOOK] {json.dumps(notification)}")
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self) -> "StandInWebhookServer":
+        threading.Thread(target=self.server.serve_forever, name="stand-in-webhook", daemon=True).start()
+        return self
+
+# ========== BENCHMARK ==========
+
+def benchmark(tickets: int = 20000, fail_every: int = 0) -> None:
+    """Coalesce and deliver 3 status changes per ticket for `tickets` tickets over both channels"""
+    smtp_server = StandInSmtpServer(fail_every=fail_every).start()
+    webhook_server = StandInWebhookServer(fail_every=fail_every).start()
+    bench = Dispatcher(
+        [SmtpTransport(f"smtp://127.0.0.1:{smtp_server.port}", connections=SMTP_CONNECTIONS),
+         WebhookTransport(f"http://127.0.0.1:{webhook_server.port}/notify")],
+        resolve=lambda user_ids: {user_id: f"user{user_id}@example.com" for user_id in user_ids},
+        coalesce_seconds=60,
+        backoff_base=0.01,  # keep injected failures from dominating the run
+    )
+    statuses = ("open", "in_progress", "resolved", "closed")
+    started = time.perf_counter()
+    for ticket_id in range(1, tickets + 1):
+        for step in range(3):
+            bench.add(ticket_id % 5000 + 1, ticket_id, f"Ticket {ticket_id}",
+                      [("status", statuses[step], statuses[step + 1])])
+    enqueued = time.perf_counter() - started
+    started = time.perf_counter()
+    bench.flush()
+    elapsed = time.perf_counter() - started
+    bench.stop()
+    events = tickets * 3
+    print(f"   events queued:       {events} in {enqueued:.2f}s ({enqueued / events * 1e6:.1f} us each)")
+    print(f"   notifications:       {tickets} per channel after coalescing")
+    print(f"   email delivered:     {smtp_server.delivered} ({smtp_server.received - smtp_server.delivered} retried)")
+    print(f"   webhook delivered:   {webhook_server.delivered} in {webhook_server.requests} requests")
+    print(f"   delivery time:       {elapsed:.2f}s")
+    print(f"   throughput:          {tickets / elapsed:,.0f} notifications/s per channel, "
+          f"{(smtp_server.delivered + webhook_server.delivered) / elapsed:,.0f}/s total")
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "serve":
+        smtp_port = int(sys.argv[2]) if len(sys.argv) > 2 else 2525
+        webhook_port = int(sys.argv[3]) if len(sys.argv) > 3 else 8025
+        StandInSmtpServer(port=smtp_port, verbose=True).start()
+        StandInWebhookServer(port=webhook_port, verbose=True).start()
+        print(f"[OK] Stand-in servers: NOTIFY_SMTP_URL=smtp://127.0.0.1:{smtp_port} "
+              f"NOTIFY_WEBHOOK_URL=http://127.0.0.1:{webhook_port}/notify")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    elif command == "benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 20000,
+                  int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    else:
+        print("Usage: python notifications.py [serve [smtp_port] [webhook_port]|benchmark [tickets] [fail_every]]")
+        sys.exit(1)
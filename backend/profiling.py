@@ -0,0 +1,176 @@
+"""
+profiling.py - Runtime-toggled sampling profiler for live requests
+Admins enable it for a fraction of requests (optionally one route); a sampler
+thread snapshots the stacks of threads serving those requests and aggregates
+them into flamegraph-ready collapsed stacks. When disabled the only cost is one
+attribute check per request.
+"""
+
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from fastapi.routing import APIRoute
+
+# ========== CONFIGURATION ==========
+RING_BUFFER_SIZE = 10000            # most recent raw samples kept
+MAX_STACK_DEPTH = 128
+# Distinct collapsed stacks kept in the aggregate; once full, samples with a new
+# stack are counted under "<route>;[other]" so memory stays bounded however long
+# profiling runs (reset() starts over)
+MAX_DISTINCT_STACKS = 5000
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class _ProfilerState:
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.route: Optional[str] = None
+        self.interval = 0.005
+        self.expires_at: Optional[float] = None
+        self.samples_taken = 0
+        self.samples_folded = 0
+
+_state = _ProfilerState()
+_active: Dict[int, str] = {}        # thread id -> route of the sampled request it is serving
+_stacks: Dict[str, int] = {}        # collapsed stack -> sample count
+_recent = deque(maxlen=RING_BUFFER_SIZE)
+_sampler: Optional[threading.Thread] = None
+_control_lock = threading.Lock()
+
+# ========== REQUEST SELECTION ==========
+
+def _should_sample(path: str) -> bool:
+    if _state.expires_at is not None and time.monotonic() > _state.expires_at:
+        _state.enabled = False
+        return False
+    if _state.route is not None and _state.route != path:
+        return False
+    return random.random() < _state.sample_rate
+
+def profiled(endpoint, path: str):
+    """Wrap a sync endpoint so sampled requests register their worker thread"""
+    if inspect.iscoroutinefunction(endpoint):
+        # Async handlers share the event loop thread, so their stacks can't be attributed
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        if not _state.enabled or not _should_sample(path):
+            return endpoint(*args, **kwargs)
+        tid = threading.get_ident()
+        _active[tid] = path
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _active.pop(tid, None)
+
+    return wrapper
+
+_WRAPPER_CODE = profiled(lambda: None, "").__code__
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint can be sampled by the profiler"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint, path), **kwargs)
+
+# ========== SAMPLER ==========
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(BACKEND_DIR):
+        filename = os.path.relpath(filename, BACKEND_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+def _collapse(route: str, frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        # Stop at our wrapper: everything above it is threadpool plumbing
+        if frame.f_code is _WRAPPER_CODE:
+            break
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(route)
+    return ";".join(reversed(labels))
+
+def _sample_loop():
+    while _state.enabled:
+        if _state.expires_at is not None and time.monotonic() > _state.expires_at:
+            _state.enabled = False
+            break
+        if _active:
+            frames = sys._current_frames()
+            now = time.time()
+            for tid, route in list(_active.items()):
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                stack = _collapse(route, frame)
+                if stack not in _stacks and len(_stacks) >= MAX_DISTINCT_STACKS:
+                    stack = f"{route};[other]"
+                    _state.samples_folded += 1
+                _stacks[stack] = _stacks.get(stack, 0) + 1
+                _recent.append((now, stack))
+                _state.samples_taken += 1
+            del frames
+        time.sleep(_state.interval)
+
+# ========== CONTROL ==========
+
+def configure(enabled: bool, sample_rate: float = 0.1, route: Optional[str] = None,
+              duration_seconds: Optional[float] = None, interval_ms: float = 5.0) -> dict:
+    """Enable/disable profiling at runtime"""
+    global _sampler
+    with _control_lock:
+        _state.sample_rate = sample_rate
+        _state.route = route
+        _state.interval = interval_ms / 1000.0
+        _state.expires_at = time.monotonic() + duration_seconds if duration_seconds else None
+        _state.enabled = enabled
+        if enabled and (_sampler is None or not _sampler.is_alive()):
+            _sampler = threading.Thread(target=_sample_loop, name="profiler-sampler", daemon=True)
+            _sampler.start()
+    return status()
+
+def status() -> dict:
+    remaining = None
+    if _state.enabled and _state.expires_at is not None:
+        remaining = max(0.0, round(_state.expires_at - time.monotonic(), 1))
+    return {
+        "enabled": _state.enabled,
+        "sample_rate": _state.sample_rate,
+        "route": _state.route,
+        "interval_ms": _state.interval * 1000,
+        "seconds_remaining": remaining,
+        "samples_taken": _state.samples_taken,
+        "distinct_stacks": len(_stacks),
+        "folded_samples": _state.samples_folded,
+        "recent_samples": len(_recent),
+    }
+
+def collapsed_stacks(since: Optional[float] = None) -> str:
+    """Return `stack count` lines (Brendan Gregg collapsed format)"""
+    if since is None:
+        counts = dict(_stacks)
+    else:
+        counts = {}
+        for ts, stack in list(_recent):
+            if ts >= since:
+                counts[stack] = counts.get(stack, 0) + 1
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+def reset() -> None:
+    _stacks.clear()
+    _recent.clear()
+    _state.samples_taken = 0
+    _state.samples_folded = 0
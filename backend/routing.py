@@ -0,0 +1,246 @@
+"""
+routing.py - Keyword routing rules for new tickets
+Admins define rules ("refund" -> category billing, "outage" -> priority urgent).
+All active rules are compiled into one Aho-Corasick automaton, so a ticket's
+title and description are scanned once, character by character, and the cost
+does not grow with the number of rules. Keywords match whole words,
+case-insensitively.
+
+Each worker keeps its compiled automaton in memory and swaps in a new one
+(built off to the side) when the rules change: immediately for changes made
+through this worker, within REFRESH_SECONDS for changes made elsewhere.
+
+Usage:
+    python routing.py reroute            # apply current rules to open tickets
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select, update
+
+import database
+import models
+import sharding
+
+# ========== CONFIGURATION ==========
+REFRESH_SECONDS = 5.0
+REROUTE_BATCH_SIZE = 1000
+REROUTE_STATUSES = ("open", "in_progress")
+
+# ========== AUTOMATON ==========
+
+class Rule(NamedTuple):
+    id: int
+    keyword: str
+    category: Optional[str]
+    priority: Optional[str]
+
+class Route(NamedTuple):
+    """Outcome of routing one text: category/priority are None when no rule sets them"""
+    category: Optional[str]
+    priority: Optional[str]
+    rule_ids: List[int]
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+class Automaton:
+    """Aho-Corasick automaton over rule keywords (immutable once built)"""
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        for index, rule in enumerate(rules):
+            state = 0
+            for char in rule.keyword:
+                following = goto[state].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto[state][char] = following
+                    goto.append({})
+                    outputs.append([])
+                state = following
+            outputs[state].append(index)
+
+        # Breadth-first: a state's failure link is the longest proper suffix that
+        # is also a trie path; its outputs include everything that suffix matches
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, following in goto[state].items():
+                pending.append(following)
+                suffix = fail[state]
+                while suffix and char not in goto[suffix]:
+                    suffix = fail[suffix]
+                fail[following] = goto[suffix].get(char, 0)
+                outputs[following].extend(outputs[fail[following]])
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = [tuple(output) for output in outputs]
+        self.lengths = [len(rule.keyword) for rule in rules]
+
+    def matches(self, text: str) -> List[int]:
+        """Indexes of rules whose keyword occurs in text as a whole word (one pass)"""
+        goto, fail, outputs, lengths = self.goto, self.fail, self.outputs, self.lengths
+        text = text.lower()
+        end = len(text)
+        found = []
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                after = position + 1
+                if after < end and text[after].isalnum():
+                    continue
+                for index in outputs[state]:
+                    start = after - lengths[index]
+                    if start == 0 or not text[start - 1].isalnum():
+                        found.append(index)
+        return found
+
+    def route(self, text: str) -> Route:
+        """
+        Category with the most keyword hits (ties: oldest rule) and the most
+        urgent priority among the matched rules
+        """
+        hits: Dict[str, int] = {}
+        first_seen: Dict[str, int] = {}
+        priority = None
+        rule_ids = []
+        for index in self.matches(text):
+            rule = self.rules[index]
+            rule_ids.append(rule.id)
+            if rule.category:
+                hits[rule.category] = hits.get(rule.category, 0) + 1
+                first_seen[rule.category] = min(first_seen.get(rule.category, rule.id), rule.id)
+            if rule.priority and (priority is None or
+                                  models.priority_rank(rule.priority) < models.priority_rank(priority)):
+                priority = rule.priority
+        category = min(hits, key=lambda c: (-hits[c], first_seen[c])) if hits else None
+        return Route(category, priority, sorted(set(rule_ids)))
+
+# ========== RULE CACHE ==========
+
+class _Cache:
+    def __init__(self):
+        self.automaton = Automaton([])
+        self.fingerprint = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+_cache = _Cache()
+
+def _fingerprint(db) -> Tuple:
+    """Changes whenever a rule is added, edited or deleted"""
+    table = models.RoutingRule.__table__
+    return tuple(db.execute(
+        select(func.count(), func.max(table.c.id), func.max(table.c.updated_at))
+    ).one())
+
+def reload(db) -> Automaton:
+    """Compile the active rules and swap the new automaton in"""
+    table = models.RoutingRule.__table__
+    fingerprint = _fingerprint(db)
+    rows = db.execute(
+        select(table.c.id, table.c.keyword, table.c.category, table.c.priority)
+        .where(table.c.is_active.is_(True))
+        .order_by(table.c.id)
+    ).all()
+    automaton = Automaton([Rule(row.id, normalize_keyword(row.keyword), row.category, row.priority) for row in rows])
+    _cache.automaton = automaton
+    _cache.fingerprint = fingerprint
+    _cache.checked_at = time.monotonic()
+    return automaton
+
+def current(db) -> Automaton:
+    """This worker's automaton, recompiled first if the rules changed elsewhere"""
+    if time.monotonic() - _cache.checked_at >= REFRESH_SECONDS and _cache.lock.acquire(blocking=False):
+        try:
+            if _cache.fingerprint is None or _fingerprint(db) != _cache.fingerprint:
+                reload(db)
+            _cache.checked_at = time.monotonic()
+        except Exception as e:
+            # Keep routing with the rules we have rather than failing ticket creation
+            print(f"[ERROR] Routing rules reload failed: {e}")
+            _cache.checked_at = time.monotonic()
+        finally:
+            _cache.lock.release()
+    return _cache.automaton
+
+def route_ticket(db, title: str, description: str) -> Route:
+    """Route a new ticket; db is a main-database session (rules live there)"""
+    return current(db).route(f"{title}\n{description}")
+
+def escalate(current_priority: Optional[str], routed: Optional[str]) -> Optional[str]:
+    """Rules only raise priority, never lower what the customer picked"""
+    if routed and models.priority_rank(routed) < models.priority_rank(current_priority):
+        return routed
+    return current_priority
+
+# ========== RE-ROUTING ==========
+
+def reroute_tickets(statuses=REROUTE_STATUSES, batch_size: int = REROUTE_BATCH_SIZE) -> dict:
+    """
+    Apply the current rules to existing tickets (every shard), in id batches
+
+    Tickets no rule matches keep their category. Returns counts scanned/updated.
+    """
+    main = database.SessionLocal()
+    try:
+        automaton = reload(main)
+    finally:
+        main.close()
+    tickets = models.Ticket.__table__
+    scanned = updated = 0
+    for shard in sharding.shards:
+        last_id = 0
+        while True:
+            with shard.engine.begin() as conn:
+                rows = conn.execute(
+                    select(tickets.c.id, tickets.c.title, tickets.c.description,
+                           tickets.c.ai_category, tickets.c.priority)
+                    .where(tickets.c.id > last_id, tickets.c.status.in_(statuses))
+                    .order_by(tickets.c.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                for row in rows:
+                    route = automaton.route(f"{row.title}\n{row.description}")
+                    category = route.category or row.ai_category
+                    priority = escalate(row.priority, route.priority)
+                    if category != row.ai_category or priority != row.priority:
+                        conn.execute(
+                            update(tickets).where(tickets.c.id == row.id).values(
+                                ai_category=category,
+                                priority=priority,
+                                priority_rank=models.priority_rank(priority),
+                            )
+                        )
+                        updated += 1
+            scanned += len(rows)
+            last_id = rows[-1].id
+    return {"scanned": scanned, "updated": updated, "rules": len(automaton.rules)}
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "reroute":
+        started = datetime.utcnow()
+        result = reroute_tickets()
+        print(f"[OK] Re-routed {result['updated']} of {result['scanned']} tickets "
+              f"with {result['rules']} rules ({(datetime.utcnow() - started).total_seconds():.1f}s)")
+    else:
+        print("Usage: python routing.py reroute")
+        sys.exit(1)
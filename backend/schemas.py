@@ -48,6 +48,11 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     expires_in: int
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    """Refresh token exchanged for a new access token"""
+    refresh_token: str
 
 class TokenData(BaseModel):
     """Data stored in JWT token"""
@@ -55,6 +60,13 @@ class TokenData(BaseModel):
     role: Optional[str] = None
     user_id: Optional[int] = None
 
+class Principal(BaseModel):
+    """Authenticated caller as described by verified token claims"""
+    id: int
+    username: str
+    role: str
+    token_version: int = 0
+
 class LoginRequest(BaseModel):
     """Login request schema"""
     username: str
@@ -149,6 +161,18 @@ class TicketListResponse(BaseModel):
     limit: int
     tickets: List[TicketResponse]
 
+class MessageCreate(BaseModel):
+    """Reply posted to a ticket's conversation"""
+    body: str
+    
+    @validator('body')
+    def validate_body(cls, v):
+        if not v or len(v.strip()) == 0:
+            raise ValueError('Message cannot be empty')
+        if len(v) > 5000:
+            raise ValueError('Message cannot exceed 5000 characters')
+        return v
+
 # ========== HEALTH SCHEMAS ==========
 
 class HealthResponse(BaseModel):
@@ -159,6 +183,84 @@ class HealthResponse(BaseModel):
     user_count: int
     version: str
 
+# ========== ADMIN SCHEMAS ==========
+
+class RoleUpdate(BaseModel):
+    """Change a user's role (admin only)"""
+    role: str
+    
+    @validator('role')
+    def validate_role(cls, v):
+        if v not in ['customer', 'agent', 'admin']:
+            raise ValueError('Role must be one of: customer, agent, admin')
+        return v
+
+class ProfilingConfig(BaseModel):
+    """Runtime profiler settings"""
+    enabled: bool
+    sample_rate: float = 0.1
+    route: Optional[str] = None
+    duration_seconds: Optional[float] = 300
+    interval_ms: float = 5.0
+    
+    @validator('sample_rate')
+    def validate_sample_rate(cls, v):
+        if v < 0 or v > 1:
+            raise ValueError('Sample rate must be between 0 and 1')
+        return v
+    
+    @validator('interval_ms')
+    def validate_interval(cls, v):
+        if v < 1 or v > 1000:
+            raise ValueError('Interval must be between 1 and 1000 ms')
+        return v
+
+class RoutingRuleCreate(BaseModel):
+    """Keyword routing rule (admin only); needs a category and/or a priority"""
+    keyword: str
+    category: Optional[str] = None
+    priority: Optional[str] = None
+    is_active: bool = True
+    
+    @validator('keyword')
+    def validate_keyword(cls, v):
+        if not v or len(v.strip()) == 0:
+            raise ValueError('Keyword cannot be empty')
+        if len(v) > 100:
+            raise ValueError('Keyword cannot exceed 100 characters')
+        return v.strip()
+    
+    @validator('priority')
+    def validate_priority(cls, v):
+        if v and v not in ['low', 'medium', 'high', 'urgent']:
+            raise ValueError('Priority must be one of: low, medium, high, urgent')
+        return v
+    
+    @validator('is_active', always=True)
+    def validate_action(cls, v, values):
+        if not values.get('category') and not values.get('priority'):
+            raise ValueError('A rule must set a category or a priority')
+        return v
+
+class RoutingRuleUpdate(BaseModel):
+    """Partial routing rule update; empty string clears category/priority"""
+    keyword: Optional[str] = None
+    category: Optional[str] = None
+    priority: Optional[str] = None
+    is_active: Optional[bool] = None
+    
+    @validator('keyword')
+    def validate_keyword(cls, v):
+        if v is not None and (len(v.strip()) == 0 or len(v) > 100):
+            raise ValueError('Keyword must be 1-100 characters')
+        return v.strip() if v is not None else v
+    
+    @validator('priority')
+    def validate_priority(cls, v):
+        if v and v not in ['low', 'medium', 'high', 'urgent']:
+            raise ValueError('Priority must be one of: low, medium, high, urgent')
+        return v
+
 # ========== ERROR SCHEMAS ==========
 
 class ErrorResponse(BaseModel):
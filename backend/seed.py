@@ -0,0 +1,183 @@
+"""
+seed.py - Synthetic large-dataset generator for AutoResolve AI
+Bulk-loads realistic users and tickets so production-scale behaviour can be
+reproduced locally. Output is fully determined by --seed, so benchmark numbers
+taken against two seeded databases are comparable.
+
+Usage:
+    python seed.py --users 50000 --tickets 1000000 --seed 42
+    DATABASE_URL=sqlite:///./big.db python seed.py --reset
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+# ========== DISTRIBUTIONS ==========
+# Skewed the way a real helpdesk is: most history is closed, most traffic is medium priority
+
+STATUS_WEIGHTS = {"open": 18, "in_progress": 9, "resolved": 28, "closed": 45}
+PRIORITY_WEIGHTS = {"low": 30, "medium": 45, "high": 18, "urgent": 7}
+ROLE_WEIGHTS = {"customer": 950, "agent": 45, "admin": 5}
+CATEGORY_WEIGHTS = {None: 40, "billing": 20, "account": 18, "technical": 15, "shipping": 7}
+
+# A small pool of passwords: bcrypt runs once per distinct password, not once per user
+PASSWORDS = ["Seed@1234", "Welcome@2024", "Support@123", "Customer@99", "Agent@2024"]
+
+ISSUES = [
+    ("Cannot log in", "I reset my password but still cannot log in to my account. It says invalid credentials."),
+    ("Refund request", "I was charged twice for order {n}. Please refund the duplicate invoice."),
+    ("Invoice missing", "I did not receive the invoice for my last payment. Could you resend it?"),
+    ("App crashes on startup", "The mobile app crashes immediately after the splash screen since the last update."),
+    ("Password reset email not received", "I requested a password reset link several times but no email arrived."),
+    ("Order not delivered", "My order {n} shows as delivered but I never received the package."),
+    ("Change subscription plan", "How do I upgrade from the basic plan to the premium plan?"),
+    ("Two-factor code not working", "The two-factor authentication code is always rejected as expired."),
+    ("Slow dashboard", "The dashboard takes more than a minute to load every morning."),
+    ("Cancel my account", "Please cancel my account and delete my personal data."),
+]
+
+HISTORY_DAYS = 180
+
+# ========== GENERATION ==========
+
+def _weighted(rng: random.Random, weights: dict, k: int):
+    return rng.choices(list(weights), list(weights.values()), k=k)
+
+def generate_users(rng: random.Random, count: int, first_id: int, hashes: list, now: datetime):
+    roles = _weighted(rng, ROLE_WEIGHTS, count)
+    rows = []
+    for i in range(count):
+        uid = first_id + i
+        rows.append({
+            "id": uid,
+            "email": f"user{uid}@example.com",
+            "username": f"user{uid}",
+            "hashed_password": hashes[rng.randrange(len(hashes))],
+            "full_name": f"Seed User {uid}",
+            "role": roles[i],
+            "is_active": rng.random() > 0.02,
+            "created_at": now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)),
+        })
+    return rows
+
+def generate_tickets(rng: random.Random, count: int, first_id: int, customer_ids: list,
+                     agent_ids: list, now: datetime):
+    statuses = _weighted(rng, STATUS_WEIGHTS, count)
+    priorities = _weighted(rng, PRIORITY_WEIGHTS, count)
+    categories = _weighted(rng, CATEGORY_WEIGHTS, count)
+    rows = []
+    for i in range(count):
+        title, description = ISSUES[rng.randrange(len(ISSUES))]
+        created = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+        status = statuses[i]
+        updated = created + timedelta(seconds=rng.randrange(1, 14 * 86400))
+        if updated > now:
+            updated = now
+        assigned = agent_ids[rng.randrange(len(agent_ids))] if agent_ids and status != "open" else None
+        rows.append({
+            "id": first_id + i,
+            "title": title,
+            "description": description.format(n=rng.randrange(100000, 999999)),
+            "status": status,
+            "priority": priorities[i],
+            "user_id": customer_ids[rng.randrange(len(customer_ids))],
+            "assigned_to": assigned,
+            "ai_category": categories[i],
+            "resolved_by_ai": status in ("resolved", "closed") and rng.random() < 0.15,
+            "created_at": created,
+            "updated_at": updated,
+        })
+    return rows
+
+# ========== LOADING ==========
+
+def _fast_sqlite(engine):
+    """Relax durability while bulk loading; the file is rebuilt from the seed if anything fails"""
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "connect")
+        def _pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=OFF")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.execute("PRAGMA cache_size=-200000")
+            cursor.close()
+
+def seed(num_users: int, num_tickets: int, seed_value: int = 42, batch_size: int = 50000,
+         reset: bool = False):
+    import auth
+    import database
+    import migrations
+    import models
+    import sharding
+    from sqlalchemy import func, select, text
+
+    engine = database.engine
+    engines = [engine] + ([shard.engine for shard in sharding.shards] if sharding.ENABLED else [])
+    for each in engines:
+        _fast_sqlite(each)
+        each.dispose()
+
+    if reset:
+        for each in engines:
+            models.Base.metadata.drop_all(bind=each)
+            with each.begin() as conn:
+                conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+    migrations.upgrade()
+
+    rng = random.Random(seed_value)
+    # Fixed reference time keeps the output independent of when the script runs
+    now = datetime(2026, 1, 1) + timedelta(days=seed_value % 365)
+
+    start = time.perf_counter()
+    hashes = [auth.get_password_hash(p) for p in PASSWORDS]
+    print(f"[OK] Hashed {len(hashes)} distinct passwords in {time.perf_counter() - start:.2f}s")
+
+    users_table = models.User.__table__
+    tickets_table = models.Ticket.__table__
+
+    with engine.begin() as conn:
+        first_user = (conn.execute(select(func.max(users_table.c.id))).scalar() or 0) + 1
+        first_ticket = (conn.execute(select(func.max(tickets_table.c.id))).scalar() or 0) + 1
+
+    customer_ids, agent_ids = [], []
+    t0 = time.perf_counter()
+    for offset in range(0, num_users, batch_size):
+        rows = generate_users(rng, min(batch_size, num_users - offset), first_user + offset, hashes, now)
+        for row in rows:
+            (customer_ids if row["role"] == "customer" else agent_ids).append(row["id"])
+        with engine.begin() as conn:
+            conn.execute(users_table.insert(), rows)
+    print(f"[OK] Inserted {num_users} users in {time.perf_counter() - t0:.2f}s")
+
+    if not customer_ids:
+        customer_ids = agent_ids
+    if num_tickets and not customer_ids:
+        raise SystemExit("[ERROR] At least one user is required to own tickets")
+
+    t0 = time.perf_counter()
+    for offset in range(0, num_tickets, batch_size):
+        rows = generate_tickets(rng, min(batch_size, num_tickets - offset), first_ticket + offset,
+                                customer_ids, agent_ids, now)
+        if sharding.ENABLED:
+            # Each shard hands out ids from its own range
+            for row in rows:
+                row["id"] = None
+        sharding.bulk_insert_tickets(rows)
+        done = offset + len(rows)
+        print(f"   ... {done}/{num_tickets} tickets ({done / (time.perf_counter() - t0):,.0f}/s)")
+    print(f"[OK] Inserted {num_tickets} tickets in {time.perf_counter() - t0:.2f}s")
+    print(f"[OK] Total seeding time {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed AutoResolve AI with synthetic data")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tickets", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    args = parser.parse_args()
+    seed(args.users, args.tickets, args.seed, args.batch_size, args.reset)
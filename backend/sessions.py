@@ -0,0 +1,150 @@
+"""
+sessions.py - Rotating refresh tokens for AutoResolve AI
+Long-lived clients trade a refresh token for a new access token instead of
+re-posting credentials, which keeps bcrypt out of the steady-state request mix.
+Refresh tokens are random, stored only as SHA-256 hashes, single use (each
+refresh rotates them) and tied to the user's token_version, so revoking a
+user's tokens also kills their refresh sessions.
+
+Usage:
+    python sessions.py sweep     # delete expired/revoked sessions
+"""
+
+import hashlib
+import os
+import secrets
+import sys
+from datetime import datetime, timedelta
+from typing import Tuple
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+import database
+import models
+
+# ========== CONFIGURATION ==========
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+SWEEP_BATCH_SIZE = 5000
+
+class RefreshError(Exception):
+    """The refresh token is unknown, expired, revoked or no longer valid for the user"""
+
+# ========== TOKENS ==========
+
+def hash_token(token: str) -> str:
+    """SHA-256 is enough here: the tokens are 256-bit random, not guessable passwords"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _create(db: Session, user) -> Tuple[str, models.RefreshSession]:
+    token = secrets.token_urlsafe(32)
+    session = models.RefreshSession(
+        user_id=user.id,
+        token_hash=hash_token(token),
+        token_version=user.token_version or 0,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    db.add(session)
+    return token, session
+
+def issue(db: Session, user) -> str:
+    """Create a refresh session for a user and return the plain token (caller commits)"""
+    return _create(db, user)[0]
+
+def rotate(db: Session, token: str) -> Tuple[models.User, str]:
+    """
+    Redeem a refresh token: revoke it and issue its replacement (caller commits)
+
+    Presenting an already-rotated token means it leaked or was replayed, so
+    every session of that user is revoked.
+    """
+    now = datetime.utcnow()
+    session = db.query(models.RefreshSession).filter(
+        models.RefreshSession.token_hash == hash_token(token)
+    ).first()
+    if session is None:
+        raise RefreshError("Invalid refresh token")
+    if session.revoked_at is not None:
+        revoke_all(db, session.user_id)
+        db.commit()
+        raise RefreshError("Refresh token already used")
+    if session.expires_at < now:
+        raise RefreshError("Refresh token expired")
+
+    user = db.get(models.User, session.user_id)
+    if user is None or not user.is_active or (user.token_version or 0) != session.token_version:
+        session.revoked_at = now
+        db.commit()
+        raise RefreshError("Refresh token revoked")
+
+    # Claim the token with a conditional UPDATE: of two concurrent refreshes with
+    # the same token exactly one matches the row, the other is treated as reuse
+    claimed = db.execute(
+        update(models.RefreshSession)
+        .where(models.RefreshSession.id == session.id,
+               models.RefreshSession.revoked_at.is_(None))
+        .values(revoked_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount != 1:
+        db.rollback()
+        revoke_all(db, session.user_id)
+        db.commit()
+        raise RefreshError("Refresh token already used")
+
+    new_token, replacement = _create(db, user)
+    db.flush()
+    db.execute(
+        update(models.RefreshSession)
+        .where(models.RefreshSession.id == session.id)
+        .values(replaced_by_id=replacement.id)
+        .execution_options(synchronize_session=False)
+    )
+    return user, new_token
+
+def revoke(db: Session, token: str) -> bool:
+    """Revoke one refresh token (logout); returns False if it was unknown"""
+    result = db.execute(
+        update(models.RefreshSession)
+        .where(models.RefreshSession.token_hash == hash_token(token),
+               models.RefreshSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    return result.rowcount > 0
+
+def revoke_all(db: Session, user_id: int) -> None:
+    db.execute(
+        update(models.RefreshSession)
+        .where(models.RefreshSession.user_id == user_id, models.RefreshSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+# ========== SWEEP ==========
+
+def sweep(engine=None, revoked_grace_days: int = 1) -> int:
+    """Delete expired sessions and long-revoked ones in batches; returns rows deleted"""
+    engine = engine or database.engine
+    table = models.RefreshSession.__table__
+    now = datetime.utcnow()
+    revoked_cutoff = now - timedelta(days=revoked_grace_days)
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(table.c.id)
+                .where(or_(table.c.expires_at < now, table.c.revoked_at < revoked_cutoff))
+                .limit(SWEEP_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+        deleted += len(ids)
+    return deleted
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "sweep":
+        print(f"[OK] Deleted {sweep()} refresh sessions")
+    else:
+        print("Usage: python sessions.py sweep")
+        sys.exit(1)
@@ -0,0 +1,381 @@
+"""
+sharding.py - Tickets sharded across databases by customer
+With SHARD_URLS set (comma-separated database URLs), each customer's tickets
+live in one shard picked by a consistent-hash ring over user ids, so shards can
+be appended with only ~1/N of customers moving. Users, sessions and other
+global tables stay in the main database (DATABASE_URL). Without SHARD_URLS
+the main database is the only shard and nothing changes.
+
+Ticket ids stay globally unique: shard k hands out ids from its own range
+[k * 2^40, (k + 1) * 2^40), reserved in blocks from its id_allocator table
+(hi/lo), so the id also tells which shard a ticket was created in. Ids stay
+below 2^53 and are safe for JSON clients.
+
+Usage:
+    python sharding.py status            # shard sizes and ring ownership
+    python sharding.py rebalance         # move tickets after appending a shard
+"""
+
+import bisect
+import contextvars
+import hashlib
+import heapq
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+import database
+import models
+import redaction
+
+# ========== CONFIGURATION ==========
+SHARD_URLS = [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+ENABLED = bool(SHARD_URLS)
+VIRTUAL_NODES = 64         # ring points per shard; more = more even spread
+SHARD_ID_BITS = 40         # ids per shard: 2^40
+ID_BLOCK_SIZE = 1000       # ids reserved per allocator round-trip
+REBALANCE_BATCH_SIZE = 1000
+
+# ========== SHARDS ==========
+
+class Shard:
+    """One ticket database: read-write and read-only engines plus session factories"""
+
+    def __init__(self, index: int, url: str, engine, read_engine):
+        self.index = index
+        self.name = f"shard{index}"
+        self.url = url
+        self.engine = engine
+        self.read_engine = read_engine
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+        self.id_base = index << SHARD_ID_BITS
+
+    def session_for_read(self, user_id: Optional[int] = None):
+        """Read session honouring the user's read-your-writes window (see database.py)"""
+        return self.SessionLocal() if database.wrote_recently(user_id) else self.ReadSessionLocal()
+
+    def __repr__(self):
+        return f"<Shard {self.name}>"
+
+def _build_shards() -> List[Shard]:
+    if not ENABLED:
+        single = Shard(0, database.SQLALCHEMY_DATABASE_URL, database.engine, database.read_engine)
+        # Share the main factories so sessions behave exactly as before
+        single.SessionLocal = database.SessionLocal
+        single.ReadSessionLocal = database.ReadSessionLocal
+        return [single]
+    built = []
+    for index, url in enumerate(SHARD_URLS):
+        engine = database.make_engine(url)
+        built.append(Shard(index, url, engine, database.make_read_engine(database.read_only_url(url), engine)))
+    return built
+
+shards: List[Shard] = _build_shards()
+
+# ========== CONSISTENT HASHING ==========
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """Consistent-hash ring; appending a shard only takes over ~1/N of the keys"""
+
+    def __init__(self, names: Iterable[str], virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f"{name}#{replica}"), index)
+            for index, name in enumerate(names)
+            for replica in range(virtual_nodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [index for _, index in points]
+
+    def owner(self, key: str) -> int:
+        position = bisect.bisect(self.hashes, _hash(key)) % len(self.hashes)
+        return self.owners[position]
+
+ring = HashRing(shard.name for shard in shards)
+
+def shard_for_user(user_id: int) -> Shard:
+    """Shard that holds (and receives) this customer's tickets"""
+    if len(shards) == 1:
+        return shards[0]
+    return shards[ring.owner(f"user:{user_id}")]
+
+def shards_for_ticket(ticket_id: int) -> List[Shard]:
+    """All shards, the one the id was allocated in first (tickets only move on rebalance)"""
+    home = ticket_id >> SHARD_ID_BITS
+    if len(shards) == 1 or not 0 <= home < len(shards):
+        return list(shards)
+    return [shards[home]] + [shard for shard in shards if shard.index != home]
+
+# ========== TICKET IDS ==========
+
+class _IdBlock:
+    __slots__ = ("next", "end")
+
+    def __init__(self):
+        self.next = 0
+        self.end = 0
+
+_id_blocks: Dict[int, _IdBlock] = {}
+_id_lock = threading.Lock()
+
+def _reserve_block(shard: Shard) -> int:
+    """Reserve ID_BLOCK_SIZE ids in the shard's allocator; returns the first one"""
+    allocator = models.IdAllocator.__table__
+    tickets = models.Ticket.__table__
+    archive = models.ArchivedTicket.__table__
+    upper = shard.id_base + (1 << SHARD_ID_BITS)
+    while True:
+        try:
+            with shard.engine.begin() as conn:
+                current = conn.execute(
+                    select(allocator.c.next_id).where(allocator.c.name == "tickets")
+                ).scalar()
+                if current is None:
+                    # First reservation: continue after any ticket already in this range
+                    highest = max(
+                        conn.execute(select(func.max(table.c.id)).where(
+                            table.c.id >= shard.id_base, table.c.id < upper
+                        )).scalar() or 0
+                        for table in (tickets, archive)
+                    )
+                    start = max(highest + 1, shard.id_base + 1)
+                    conn.execute(insert(allocator).values(name="tickets", next_id=start + ID_BLOCK_SIZE))
+                    return start
+                # Compare-and-set so concurrent processes never get the same block
+                claimed = conn.execute(
+                    update(allocator)
+                    .where(allocator.c.name == "tickets", allocator.c.next_id == current)
+                    .values(next_id=current + ID_BLOCK_SIZE)
+                ).rowcount
+                if claimed:
+                    if current + ID_BLOCK_SIZE > upper:
+                        raise RuntimeError(f"{shard.name} has run out of ticket ids")
+                    return current
+        except IntegrityError:
+            # Another process created the allocator row first; read it and take the next block
+            continue
+
+def next_ticket_id(shard: Shard) -> Optional[int]:
+    """
+    Globally unique id for a new ticket in this shard
+
+    Returns None without sharding, where the database assigns ids as before.
+    Call it before the write transaction starts: a block reservation is its
+    own short transaction.
+    """
+    if not ENABLED:
+        return None
+    with _id_lock:
+        block = _id_blocks.setdefault(shard.index, _IdBlock())
+        if block.next >= block.end:
+            block.next = _reserve_block(shard)
+            block.end = block.next + ID_BLOCK_SIZE
+        ticket_id = block.next
+        block.next += 1
+        return ticket_id
+
+def locate_ticket(ticket_id: int) -> Shard:
+    """Shard holding a ticket, live or archived (its home shard if none does)"""
+    candidates = shards_for_ticket(ticket_id)
+    if len(candidates) == 1:
+        return candidates[0]
+    for shard in candidates:
+        with shard.engine.connect() as conn:
+            for table in (models.Ticket.__table__, models.ArchivedTicket.__table__):
+                if conn.execute(select(table.c.id).where(table.c.id == ticket_id)).first():
+                    return shard
+    return candidates[0]
+
+def bulk_insert_tickets(rows: List[dict]) -> None:
+    """Insert ticket rows (Core dicts), PII redacted, into their owners' shards; used by seed and benchmark scripts"""
+    by_shard: Dict[int, List[dict]] = {}
+    for row in rows:
+        redaction.redact_ticket_row(row)
+        shard = shard_for_user(row["user_id"])
+        if ENABLED and row.get("id") is None:
+            row["id"] = next_ticket_id(shard)
+        by_shard.setdefault(shard.index, []).append(row)
+    for index, shard_rows in by_shard.items():
+        with shards[index].engine.begin() as conn:
+            conn.execute(insert(models.Ticket.__table__), shard_rows)
+
+# ========== FAN-OUT ==========
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def fan_out(fn: Callable[[Shard], object], targets: Optional[List[Shard]] = None) -> list:
+    """Run fn(shard) on every shard in parallel; results in shard order"""
+    global _pool
+    targets = shards if targets is None else targets
+    if len(targets) == 1:
+        return [fn(targets[0])]
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(shards)), thread_name_prefix="shard")
+    # Copy the context so per-request query metrics follow the work into the pool
+    futures = [_pool.submit(contextvars.copy_context().run, fn, shard) for shard in targets]
+    return [future.result() for future in futures]
+
+def merge_sorted(results: List[list], key: Callable, skip: int, limit: int) -> list:
+    """K-way merge of per-shard lists already sorted by key, then paginate"""
+    merged = heapq.merge(*results, key=key)
+    page = []
+    for position, item in enumerate(merged):
+        if position >= skip + limit:
+            break
+        if position >= skip:
+            page.append(item)
+    return page
+
+# ========== REBALANCING ==========
+
+# Rows that belong to a ticket and move with it
+_CHILD_TABLES = (models.TicketMessage.__table__, models.TicketAttachment.__table__)
+
+def _delete_tickets(conn, table, ids: List[int]) -> None:
+    """Delete tickets together with their messages and attachment rows"""
+    for child in _CHILD_TABLES:
+        conn.execute(delete(child).where(child.c.ticket_id.in_(ids)))
+    conn.execute(delete(table).where(table.c.id.in_(ids)))
+
+def _children_state(conn, ids: List[int]) -> dict:
+    """(table, ticket id) -> (row count, highest id) of the tickets' messages and attachments"""
+    state = {}
+    for child in _CHILD_TABLES:
+        for ticket_id, count, highest in conn.execute(
+            select(child.c.ticket_id, func.count(), func.max(child.c.id))
+            .where(child.c.ticket_id.in_(ids))
+            .group_by(child.c.ticket_id)
+        ):
+            state[(child.name, ticket_id)] = (count, highest)
+    return state
+
+def _copy_tickets(source_conn, target_conn, table, rows) -> None:
+    """
+    Copy tickets with their messages and attachment rows into another shard
+
+    Message and attachment ids are per shard, so the target assigns new ones
+    (in the original order) and last_message_id is remapped to match. Any
+    earlier partial copy of the same tickets on the target is replaced.
+    """
+    messages = models.TicketMessage.__table__
+    attachments = models.TicketAttachment.__table__
+    ids = [row["id"] for row in rows]
+    _delete_tickets(target_conn, table, ids)
+
+    message_rows = source_conn.execute(
+        select(messages).where(messages.c.ticket_id.in_(ids)).order_by(messages.c.id)
+    ).mappings().all()
+    new_message_ids = {}
+    if message_rows:
+        inserted = target_conn.execute(
+            insert(messages).returning(messages.c.id, sort_by_parameter_order=True),
+            [{key: value for key, value in row.items() if key != "id"} for row in message_rows],
+        ).scalars().all()
+        new_message_ids = dict(zip((row["id"] for row in message_rows), inserted))
+    attachment_rows = source_conn.execute(
+        select(attachments).where(attachments.c.ticket_id.in_(ids)).order_by(attachments.c.id)
+    ).mappings().all()
+    if attachment_rows:
+        target_conn.execute(
+            insert(attachments),
+            [{key: value for key, value in row.items() if key != "id"} for row in attachment_rows],
+        )
+
+    copies = []
+    for row in rows:
+        copy = dict(row)
+        if copy["last_message_id"] is not None:
+            copy["last_message_id"] = new_message_ids.get(copy["last_message_id"])
+        copies.append(copy)
+    target_conn.execute(insert(table), copies)
+
+def rebalance(batch_size: int = REBALANCE_BATCH_SIZE) -> int:
+    """
+    Move tickets whose owner changed on the ring (after appending a shard)
+
+    Each ticket moves with its messages and attachment rows. A batch is
+    copied into the new shard and committed, then deleted from the old one,
+    so an interrupted run is safe to repeat. Writes may continue meanwhile:
+    right before the delete the source rows are locked and compared with
+    what was copied, and tickets changed (or archived/deleted) since are left
+    in place and copied again. Returns tickets moved.
+    """
+    moved = 0
+    for model in (models.Ticket, models.ArchivedTicket):
+        table = model.__table__
+        for source in shards:
+            with source.engine.connect() as conn:
+                user_ids = conn.execute(select(table.c.user_id).distinct()).scalars().all()
+            for user_id in user_ids:
+                target = shard_for_user(user_id)
+                if target.index == source.index:
+                    continue
+                while True:
+                    with source.engine.connect() as source_conn:
+                        rows = source_conn.execute(
+                            select(table).where(table.c.user_id == user_id).order_by(table.c.id).limit(batch_size)
+                        ).mappings().all()
+                        if not rows:
+                            break
+                        ids = [row["id"] for row in rows]
+                        # Read before the copy: anything committed after it shows up as a change
+                        copied_children = _children_state(source_conn, ids)
+                        with target.engine.begin() as target_conn:
+                            _copy_tickets(source_conn, target_conn, table, rows)
+                    copied = {row["id"]: dict(row) for row in rows}
+                    with source.engine.begin() as conn:
+                        current = {
+                            row["id"]: dict(row) for row in conn.execute(
+                                select(table).where(table.c.id.in_(ids)).with_for_update()
+                            ).mappings()
+                        }
+                        current_children = _children_state(conn, ids)
+                        unchanged = [
+                            ticket_id for ticket_id in ids
+                            if current.get(ticket_id) == copied[ticket_id]
+                            and all(current_children.get((child.name, ticket_id)) == copied_children.get((child.name, ticket_id))
+                                    for child in _CHILD_TABLES)
+                        ]
+                        if unchanged:
+                            _delete_tickets(conn, table, unchanged)
+                    gone = [ticket_id for ticket_id in ids if ticket_id not in current]
+                    if gone:
+                        # Archived or deleted on the source meanwhile: drop the stale copy
+                        with target.engine.begin() as conn:
+                            _delete_tickets(conn, table, gone)
+                    moved += len(unchanged)
+    return moved
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "status":
+        for shard in shards:
+            with shard.engine.connect() as conn:
+                count = conn.execute(select(func.count()).select_from(models.Ticket.__table__)).scalar()
+            print(f"   {shard.name}: {count} tickets  ({shard.url})")
+        sample = 100_000
+        owned = [0] * len(shards)
+        for user_id in range(1, sample + 1):
+            owned[shard_for_user(user_id).index] += 1
+        print("   ring ownership: " + ", ".join(
+            f"{shard.name} {owned[shard.index] / sample:.1%}" for shard in shards
+        ))
+    elif command == "rebalance":
+        print(f"[OK] Moved {rebalance()} tickets")
+    else:
+        print("Usage: python sharding.py [status|rebalance]")
+        sys.exit(1)
@@ -0,0 +1,22 @@
+"""
+Shared pytest setup: the backend modules are imported flat (import sharding,
+import redaction, ...) as when the server runs from backend/, and anything they
+write goes to a scratch directory instead of the working tree.
+
+Usage:
+    python -m pytest -q backend/tests
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH_DIR = tempfile.mkdtemp(prefix="autoresolve-tests-")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(SCRATCH_DIR, 'tickets.db')}")
+os.environ.setdefault("ATTACHMENT_DIR", os.path.join(SCRATCH_DIR, "attachments"))
+os.environ.setdefault("ANALYTICS_DIR", os.path.join(SCRATCH_DIR, "analytics_snapshot"))
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,26 @@
+import pytest
+
+import attachments
+
+@pytest.mark.parametrize("header,size,expected", [
+    (None, 100, None),
+    ("", 100, None),
+    ("bytes=0-9", 100, (0, 9)),
+    ("bytes=90-", 100, (90, 99)),
+    ("bytes=90-200", 100, (90, 99)),
+    ("bytes=-10", 100, (90, 99)),
+    ("bytes=-500", 100, (0, 99)),
+    ("bytes=-0", 100, None),
+    ("bytes=3-1", 100, None),
+    ("bytes=0-1,5-6", 100, None),
+    ("bytes=a-b", 100, None),
+    ("items=0-9", 100, None),
+    ("bytes=0-9", 0, None),
+])
+def test_parse_range(header, size, expected):
+    assert attachments.parse_range(header, size) == expected
+
+def test_parse_range_past_the_end_is_unsatisfiable():
+    with pytest.raises(attachments.AttachmentError) as error:
+        attachments.parse_range("bytes=100-", 100)
+    assert error.value.status_code == 416
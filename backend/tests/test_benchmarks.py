@@ -0,0 +1,20 @@
+"""Each module benchmark, at a size that runs in seconds, so they keep working"""
+
+import group_commit
+import notifications
+import redaction
+
+def test_redaction_benchmark(capsys):
+    redaction.benchmark(0.05)
+    assert "MB/s" in capsys.readouterr().out
+
+def test_notifications_benchmark(capsys):
+    notifications.benchmark(tickets=200, fail_every=7)
+    out = capsys.readouterr().out
+    assert "email delivered:     200" in out
+    assert "webhook delivered:   200" in out
+
+def test_group_commit_benchmark(capsys):
+    group_commit.benchmark(writes=40, threads=4)
+    out = capsys.readouterr().out
+    assert "direct" in out and "group" in out
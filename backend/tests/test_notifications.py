@@ -0,0 +1,21 @@
+import notifications
+
+def _notification():
+    return notifications.Notification(recipient_id=7, ticket_id=1, title="Help", due_at=0.0, channels=["email"])
+
+def test_merge_keeps_first_old_and_latest_new_value():
+    notification = _notification()
+    notification.merge([("status", "open", "in_progress")])
+    notification.merge([("status", "in_progress", "resolved"), ("priority", "low", "high")])
+    assert notification.changes == {"status": ["open", "resolved"], "priority": ["low", "high"]}
+
+def test_merge_drops_a_change_that_was_reverted():
+    notification = _notification()
+    notification.merge([("status", "open", "resolved"), ("priority", "low", "high")])
+    notification.merge([("status", "resolved", "open")])
+    assert notification.changes == {"priority": ["low", "high"]}
+
+def test_lines_name_the_recipient():
+    notification = _notification()
+    notification.merge([("assigned_to", None, 7), ("status", "open", "closed")])
+    assert notification.lines() == ["Assignee: nobody -> you", "Status: open -> closed"]
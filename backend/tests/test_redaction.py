@@ -0,0 +1,40 @@
+import pytest
+
+import redaction
+
+@pytest.mark.parametrize("text,expected", redaction.SELFTEST_CASES)
+def test_selftest_cases(text, expected):
+    assert redaction.redact(text)[0] == expected
+
+def test_selftest_passes():
+    assert redaction.selftest()
+
+@pytest.mark.parametrize("digits,valid", [
+    ("4111111111111111", True),
+    ("5500000000000004", True),
+    ("4111111111111112", False),
+    ("1234567890123", False),
+])
+def test_luhn_valid(digits, valid):
+    assert redaction.luhn_valid(digits) is valid
+
+def test_card_length_run_failing_luhn_is_not_a_card():
+    text, found = redaction.redact("ref 4111 1111 1111 1112")
+    assert text == "ref 4111 1111 1111 1112"
+    assert found == {}
+
+def test_bare_digit_run_needs_phone_context():
+    assert redaction.redact("order 5558675309")[0] == "order 5558675309"
+    assert redaction.redact("mobile 5558675309")[0] == "mobile [PHONE]"
+    # Context further back than PHONE_CONTEXT_CHARS doesn't count
+    far = "call " + "x" * redaction.PHONE_CONTEXT_CHARS + " 5558675309"
+    assert redaction.redact(far)[0] == far
+
+def test_separated_or_prefixed_numbers_need_no_context():
+    assert redaction.redact("555-867-5309")[0] == "[PHONE]"
+    assert redaction.redact("+15558675309")[0] == "[PHONE]"
+
+def test_redact_fields_reports_originals_only_for_redacted_fields():
+    redacted, originals = redaction.redact_fields({"title": "Help", "description": "mail a@example.com"})
+    assert redacted == {"title": "Help", "description": "mail [EMAIL]"}
+    assert originals == {"title": None, "description": "mail a@example.com"}
@@ -0,0 +1,35 @@
+from collections import Counter
+
+import sharding
+
+def test_merge_sorted_paginates_across_shards():
+    results = [[1, 4, 7], [2, 5, 8], [3, 6, 9]]
+    assert sharding.merge_sorted(results, key=lambda n: n, skip=0, limit=4) == [1, 2, 3, 4]
+    assert sharding.merge_sorted(results, key=lambda n: n, skip=4, limit=3) == [5, 6, 7]
+    assert sharding.merge_sorted(results, key=lambda n: n, skip=8, limit=5) == [9]
+    assert sharding.merge_sorted(results, key=lambda n: n, skip=20, limit=5) == []
+
+def test_merge_sorted_uses_key_and_handles_empty_shards():
+    results = [[(3, "c"), (1, "a")], [], [(2, "b")]]
+    page = sharding.merge_sorted(results, key=lambda row: -row[0], skip=0, limit=10)
+    assert page == [(3, "c"), (2, "b"), (1, "a")]
+
+def test_hash_ring_is_deterministic():
+    first = sharding.HashRing(["a", "b", "c"])
+    second = sharding.HashRing(["a", "b", "c"])
+    keys = [f"user:{n}" for n in range(1000)]
+    assert [first.owner(key) for key in keys] == [second.owner(key) for key in keys]
+
+def test_hash_ring_spreads_keys():
+    ring = sharding.HashRing(["a", "b", "c", "d"])
+    counts = Counter(ring.owner(f"user:{n}") for n in range(20000))
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 20000 / 4 * 0.6
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    before = sharding.HashRing(["a", "b", "c"])
+    after = sharding.HashRing(["a", "b", "c", "d"])
+    keys = [f"user:{n}" for n in range(20000)]
+    moved = [key for key in keys if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == 3 for key in moved)
+    assert len(moved) < len(keys) / 4 * 1.5